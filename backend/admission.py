@@ -0,0 +1,261 @@
+"""
+大模型调用准入控制
+所有访问阿里云百炼的请求先在这里排队，避免上游限流后的连锁失败：
+- 每个 (API Key, 模型) 一个令牌桶，限制请求速率
+- 按优先级排队：语音解析 > 行程生成 > 预算建议，排队超过截止时间直接拒绝
+- 自适应并发：上游返回429或延迟明显升高时减小并发上限，正常时缓慢恢复（AIMD）
+- 统计队列长度、等待时间、限流次数等指标
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import openai
+
+from llm import DEFAULT_MODEL
+from rate_limit import TokenBucket
+
+# 准入控制配置
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "5"))
+LLM_RATE_LIMIT_BURST = float(os.getenv("LLM_RATE_LIMIT_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "2"))
+
+# 延迟超过基线的倍数时视为上游拥塞
+LATENCY_BACKOFF_RATIO = float(os.getenv("LLM_LATENCY_BACKOFF_RATIO", "2.0"))
+
+
+class Priority(IntEnum):
+    """调用优先级（数值越小越优先）"""
+    INTERACTIVE = 0  # 语音文本解析，用户正在等待
+    PLAN = 1         # 行程生成
+    BUDGET = 2       # 预算建议
+
+
+# 各优先级的默认排队截止时间（秒）
+DEFAULT_DEADLINES = {
+    Priority.INTERACTIVE: float(os.getenv("LLM_DEADLINE_INTERACTIVE", "10")),
+    Priority.PLAN: float(os.getenv("LLM_DEADLINE_PLAN", "30")),
+    Priority.BUDGET: float(os.getenv("LLM_DEADLINE_BUDGET", "15")),
+}
+
+
+class AdmissionTimeout(Exception):
+    """排队超过截止时间"""
+
+    def __init__(self, priority: Priority, waited: float):
+        super().__init__(f"AI服务繁忙，排队{waited:.1f}秒后仍未获得调用配额，请稍后重试")
+        self.priority = priority
+        self.waited = waited
+
+
+class _Lane:
+    """单个 (API Key, 模型) 的排队和并发状态"""
+
+    def __init__(self, key_id: str, model: str, rate: float, burst: float, max_concurrency: int):
+        self.key_id = key_id
+        self.model = model
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, float, float, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        # 延迟基线按 (优先级, 调用类型, 是否流式) 分开维护：
+        # 流式调用记录首token延迟，非流式调用记录完整耗时，后者随输出长度变化
+        self.latency_floor: Dict[Tuple[Priority, str, bool], float] = {}
+
+        # 指标
+        self.admitted = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.wait_times: Deque[float] = deque(maxlen=1000)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.wait_times)
+        return {
+            "key": self.key_id,
+            "model": self.model,
+            "queue_depth": sum(1 for waiter in self.waiters if not waiter[4].done()),
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.limit, 2),
+            "tokens": round(self.bucket.tokens, 2),
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "upstream_429": self.rate_limited,
+            "wait_avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "wait_p95": round(waits[int(len(waits) * 0.95) - 1], 4) if len(waits) >= 20 else None,
+            "wait_max": round(waits[-1], 4) if waits else 0.0,
+        }
+
+
+class AdmissionSlot:
+    """一次已获准的调用；作为异步上下文管理器使用"""
+
+    def __init__(
+        self, controller: "AdmissionController", lane: _Lane, priority: Priority, timeout: float, kind: str = ""
+    ):
+        self.controller = controller
+        self.lane = lane
+        self.priority = priority
+        self.timeout = timeout
+        self.kind = kind
+        self.admitted_at: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.streaming = False
+
+    def first_token(self):
+        """流式调用收到首个token时调用，以首token延迟作为拥塞信号"""
+        if self.latency is None and self.admitted_at is not None:
+            self.latency = time.monotonic() - self.admitted_at
+            self.streaming = True
+
+    async def __aenter__(self) -> "AdmissionSlot":
+        await self.controller._acquire(self.lane, self.priority, self.timeout)
+        self.admitted_at = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.latency is None:
+            self.latency = time.monotonic() - self.admitted_at
+        rate_limited = exc_type is not None and issubclass(exc_type, openai.RateLimitError)
+        failed = exc_type is not None and not rate_limited
+        floor_key = (self.priority, self.kind, self.streaming)
+        self.controller._release(self.lane, floor_key, self.latency, rate_limited, failed)
+        return False
+
+
+class AdmissionController:
+    """按 (API Key, 模型) 分道的准入控制器"""
+
+    def __init__(
+        self,
+        rate: float = LLM_RATE_LIMIT_RPS,
+        burst: float = LLM_RATE_LIMIT_BURST,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.lanes: Dict[Tuple[str, str], _Lane] = {}
+        self._seq = itertools.count()
+
+    def slot(
+        self,
+        priority: Priority,
+        model: str = DEFAULT_MODEL,
+        api_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        kind: str = "",
+    ) -> AdmissionSlot:
+        """
+        获取调用配额：async with controller.slot(Priority.PLAN) as slot: ...
+        kind 区分输出长度不同的调用（如行程骨架、单天行程、完整行程），各自维护延迟基线
+        """
+        lane = self._lane(api_key or os.getenv("DASHSCOPE_API_KEY", ""), model)
+        deadline = DEFAULT_DEADLINES[priority] if timeout is None else timeout
+        return AdmissionSlot(self, lane, priority, deadline, kind)
+
+    def _lane(self, api_key: str, model: str) -> _Lane:
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+        lane = self.lanes.get((key_id, model))
+        if lane is None:
+            lane = _Lane(key_id, model, self.rate, self.burst, self.max_concurrency)
+            self.lanes[(key_id, model)] = lane
+        return lane
+
+    async def _acquire(self, lane: _Lane, priority: Priority, timeout: float):
+        enqueued_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.waiters, (int(priority), next(self._seq), enqueued_at, enqueued_at + timeout, future))
+        self._dispatch(lane)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 配额恰好在超时时发放，直接使用
+                pass
+            else:
+                future.cancel()
+                lane.timeouts += 1
+                raise AdmissionTimeout(priority, time.monotonic() - enqueued_at)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已获得配额但调用方被取消，归还配额
+                lane.in_flight -= 1
+                self._dispatch(lane)
+            else:
+                future.cancel()
+            raise
+
+        lane.wait_times.append(time.monotonic() - enqueued_at)
+
+    def _dispatch(self, lane: _Lane):
+        """按优先级为等待者发放配额（受并发上限和令牌桶约束）"""
+        now = time.monotonic()
+        while lane.waiters:
+            _, _, _, deadline, future = lane.waiters[0]
+            if future.done() or deadline <= now:
+                heapq.heappop(lane.waiters)
+                continue
+            if lane.in_flight >= int(lane.limit):
+                return
+            if not lane.bucket.try_acquire():
+                self._schedule(lane, lane.bucket.wait_time())
+                return
+            heapq.heappop(lane.waiters)
+            lane.in_flight += 1
+            lane.admitted += 1
+            future.set_result(True)
+
+    def _schedule(self, lane: _Lane, delay: float):
+        """令牌不足时，在下一个令牌可用时重新发放"""
+        if lane.timer is not None:
+            return
+
+        def fire():
+            lane.timer = None
+            self._dispatch(lane)
+
+        lane.timer = asyncio.get_running_loop().call_later(max(delay, 0.001), fire)
+
+    def _release(
+        self, lane: _Lane, floor_key: Tuple[Priority, str, bool], latency: float, rate_limited: bool, failed: bool
+    ):
+        lane.in_flight -= 1
+
+        if rate_limited:
+            # 上游限流：并发上限减半
+            lane.rate_limited += 1
+            lane.limit = max(self.min_concurrency, lane.limit / 2)
+        elif not failed:
+            # 不同长度的调用、首token延迟和完整耗时都不可比，按 (优先级, 调用类型, 是否流式) 分别比较
+            floor = lane.latency_floor.get(floor_key)
+            if floor is None or latency < floor:
+                lane.latency_floor[floor_key] = latency
+            else:
+                # 基线缓慢上浮，避免偶发的极低延迟长期压低基线
+                lane.latency_floor[floor_key] = floor * 1.01
+
+            if floor is not None and latency > floor * LATENCY_BACKOFF_RATIO:
+                lane.limit = max(self.min_concurrency, lane.limit * 0.9)
+            else:
+                lane.limit = min(self.max_concurrency, lane.limit + 1 / max(lane.limit, 1))
+
+        self._dispatch(lane)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各通道指标"""
+        return [lane.stats() for lane in self.lanes.values()]
+
+
+# 全局准入控制器
+admission_controller = AdmissionController()
@@ -0,0 +1,84 @@
+"""
+事件广播通道
+一个生产者发布事件，多个订阅者各自接收完整的事件序列：
+后加入的订阅者会先重放已发布的事件，再继续接收新事件。
+重放缓冲区有界：只含进度和消息的事件只保留最新一条，部分结果按 (section, index) 只保留最新一份，
+其余事件（任务信息、最终结果、错误）全部保留。
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Hashable, List
+
+# 通道关闭标记
+_CLOSED = object()
+
+# 只含这些字段的事件是纯进度事件，新的进度事件替换旧的
+_PROGRESS_FIELDS = {"progress", "message"}
+
+
+def _replay_key(event: Dict[str, Any], seq: int) -> Hashable:
+    """事件在重放缓冲区中的键，键相同的新事件替换旧事件"""
+    if event.keys() <= _PROGRESS_FIELDS:
+        return "progress"
+    partial = event.get("partial")
+    if isinstance(partial, dict) and "section" in partial:
+        return ("partial", partial["section"], partial.get("index"))
+    return seq
+
+
+class EventBroadcast:
+    """可重放的单生产者、多订阅者事件通道"""
+
+    def __init__(self):
+        self.closed = False
+        self._replay: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._published = 0
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        """重放给后加入订阅者的事件（按发布顺序）"""
+        return list(self._replay.values())
+
+    def publish(self, event: Dict[str, Any]):
+        """发布事件给所有订阅者"""
+        if self.closed:
+            raise RuntimeError("事件通道已关闭")
+        key = _replay_key(event, self._published)
+        self._published += 1
+        self._replay.pop(key, None)
+        self._replay[key] = event
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def close(self):
+        """关闭通道，订阅者读完剩余事件后结束"""
+        if self.closed:
+            return
+        self.closed = True
+        for queue in self._subscribers:
+            queue.put_nowait(_CLOSED)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """订阅事件：先重放历史事件，再等待新事件直到通道关闭"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.closed:
+            queue.put_nowait(_CLOSED)
+        else:
+            self._subscribers.append(queue)
+
+        try:
+            while True:
+                event = await queue.get()
+                if event is _CLOSED:
+                    return
+                yield event
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
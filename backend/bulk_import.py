@@ -0,0 +1,84 @@
+"""
+批量导入的流式解析
+逐块读取请求体并按行产出记录，不需要把整个上传内容读入内存：
+- NDJSON：每行一个JSON对象
+- CSV：第一行为表头，支持带引号的字段（字段内可含逗号和换行）
+每条记录以 (行号, 记录, 错误信息) 的形式产出，解析失败的行不会中断整个导入。
+"""
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple
+
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把字节流切分为文本行（正确处理跨块的多字节字符和行）"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """逐行解析NDJSON，空行跳过"""
+    row = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row, None, f"JSON格式错误: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row, None, "每行必须是一个JSON对象"
+            continue
+        yield row, record, None
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """逐行解析带表头的CSV，空字段视为未填写"""
+    header = None
+    row = 0
+    buffered = ""
+    async for line in iter_lines(chunks):
+        # 引号未闭合说明字段内有换行，继续拼接下一行
+        buffered = f"{buffered}\n{line}" if buffered else line
+        if buffered.count('"') % 2:
+            continue
+        text, buffered = buffered, ""
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+
+        row += 1
+        if len(values) > len(header):
+            yield row, None, f"列数({len(values)})多于表头({len(header)})"
+            continue
+        yield row, {name: value for name, value in zip(header, values) if value != ""}, None
+
+    if buffered:
+        row += 1
+        yield row, None, "CSV引号未闭合"
+
+
+async def iter_json_records(items: Iterable[Any]) -> AsyncIterator[Record]:
+    """已解析的JSON数组"""
+    for row, record in enumerate(items, start=1):
+        if isinstance(record, dict):
+            yield row, record, None
+        else:
+            yield row, None, "每条记录必须是一个JSON对象"
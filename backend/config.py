@@ -8,12 +8,16 @@ from typing import Optional
 class Settings(BaseSettings):
     """应用配置"""
     
-    # Supabase配置
-    supabase_url: str
-    supabase_key: str
+    # 存储配置：supabase 或 sqlite（嵌入式，用于本地压测和测试）
+    storage_backend: str = "supabase"
+    sqlite_path: str = "./data/travel.db"
+
+    # Supabase配置（storage_backend=supabase 时必填）
+    supabase_url: Optional[str] = None
+    supabase_key: Optional[str] = None
     
-    # 阿里云百炼配置
-    dashscope_api_key: str
+    # 阿里云百炼配置（由 llm.get_llm_client 在首次调用时检查，仅使用存储时可不配置）
+    dashscope_api_key: Optional[str] = None
     
     # 阿里云语音识别配置（可选）
     aliyun_speech_app_key: Optional[str] = None
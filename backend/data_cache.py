@@ -0,0 +1,289 @@
+"""
+计划和费用的读穿透缓存
+在 Database 前面缓存计划和费用的读取，写操作（创建/更新/修补/删除计划、增删改费用）精确失效相关的键：
+- ("plan", user_id, plan_id)      单个计划
+- ("fields", user_id, plan_id)    计划的部分字段（按字段组合分别保存）
+- ("expenses", user_id, plan_id)  计划的费用记录
+- ("budget", user_id, plan_id)    计划按类别的费用汇总
+- ("plans", user_id)              用户的计划列表
+- ("summaries", user_id)          用户的计划摘要分页（按每页条数和游标分别保存）
+缓存后端可替换：默认进程内 LRU + TTL；多个 worker 可共用 Redis（或兼容 Redis 协议的服务）。
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import Storage
+from ttl_cache import LRUCache
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # 可选依赖，仅 DATA_CACHE_BACKEND=redis 时需要
+    redis_asyncio = None
+
+# 数据缓存配置
+DATA_CACHE_BACKEND = os.getenv("DATA_CACHE_BACKEND", "memory")  # memory / redis / none
+DATA_CACHE_TTL = float(os.getenv("DATA_CACHE_TTL", "60"))
+DATA_CACHE_MAX_ENTRIES = int(os.getenv("DATA_CACHE_MAX_ENTRIES", "2048"))
+DATA_CACHE_REDIS_URL = os.getenv("DATA_CACHE_REDIS_URL", "redis://localhost:6379/0")
+DATA_CACHE_PREFIX = os.getenv("DATA_CACHE_PREFIX", "travel:")
+DATA_CACHE_MAX_VARIANTS = int(os.getenv("DATA_CACHE_MAX_VARIANTS", "16"))  # 同一个键下保存的字段组合/分页数上限
+
+CacheKey = Tuple[str, ...]
+
+
+class MemoryCacheBackend:
+    """进程内缓存后端（LRU + TTL），值以JSON文本保存，读取时得到独立的副本"""
+
+    def __init__(self, max_entries: int = DATA_CACHE_MAX_ENTRIES, ttl: float = DATA_CACHE_TTL):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl, sizeof=len)
+
+    async def get(self, key: CacheKey) -> Optional[str]:
+        return self.cache.get(key)
+
+    async def set(self, key: CacheKey, value: str):
+        self.cache.set(key, value)
+
+    async def delete(self, *keys: CacheKey):
+        for key in keys:
+            self.cache.delete(key)
+
+    async def close(self):
+        self.cache.clear()
+
+
+class RedisCacheBackend:
+    """Redis 缓存后端，多个 worker 共享缓存和失效"""
+
+    def __init__(self, url: str = DATA_CACHE_REDIS_URL, ttl: float = DATA_CACHE_TTL, prefix: str = DATA_CACHE_PREFIX):
+        if redis_asyncio is None:
+            raise RuntimeError("DATA_CACHE_BACKEND=redis 需要安装 redis 包（pip install redis）")
+        self.client = redis_asyncio.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key: CacheKey) -> str:
+        return self.prefix + ":".join(key)
+
+    async def get(self, key: CacheKey) -> Optional[str]:
+        value = await self.client.get(self._key(key))
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    async def set(self, key: CacheKey, value: str):
+        await self.client.set(self._key(key), value, ex=max(int(self.ttl), 1))
+
+    async def delete(self, *keys: CacheKey):
+        if keys:
+            await self.client.delete(*(self._key(key) for key in keys))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_cache_backend(kind: str = DATA_CACHE_BACKEND):
+    """按配置创建缓存后端，none 时返回 None（不缓存）"""
+    if kind == "none":
+        return None
+    if kind == "redis":
+        return RedisCacheBackend()
+    if kind == "memory":
+        return MemoryCacheBackend()
+    raise ValueError(f"未知的 DATA_CACHE_BACKEND: {kind}")
+
+
+class CachedDatabase(Storage):
+    """
+    带读穿透缓存的数据库包装，逐个实现 Storage 接口（读方法走缓存，写方法失效相关的键）
+    不做隐式转发：底层数据库新增的方法必须在这里显式实现，否则实例化时直接报错
+    """
+
+    def __init__(self, db: Storage, backend: Any):
+        self.db = db
+        self.backend = backend
+        self.local = getattr(db, "local", False)
+        # 正在读取的键的失效版本和读取数：读取期间发生写操作时，不把读到的旧值写回缓存
+        # 只记录有读取进行中的键，最后一个读取结束时移除，不随访问过的键无限增长
+        self._versions: Dict[CacheKey, int] = {}
+        self._readers: Dict[CacheKey, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def _read_through(self, key: CacheKey, load, variant: Optional[str] = None):
+        """
+        缓存命中直接返回，否则读取底层数据库并写回缓存
+        指定 variant 时同一个键下保存多份结果（不同的字段组合、分页位置），失效时一起删除
+        """
+        cached = await self.backend.get(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            if variant is None:
+                self.hits += 1
+                return entry
+            if variant in entry:
+                self.hits += 1
+                return entry[variant]
+
+        self.misses += 1
+        version = self._versions.setdefault(key, 0)
+        self._readers[key] = self._readers.get(key, 0) + 1
+        try:
+            value = await load()
+            if value is None or self._versions[key] != version:
+                return value
+            entry = value
+            if variant is not None:
+                # 与其他读取写回的结果合并，超过上限时丢弃最早写入的
+                cached = await self.backend.get(key)
+                if self._versions[key] != version:
+                    return value
+                entry = json.loads(cached) if cached is not None else {}
+                entry.pop(variant, None)
+                entry[variant] = value
+                while len(entry) > DATA_CACHE_MAX_VARIANTS:
+                    del entry[next(iter(entry))]
+            await self.backend.set(key, json.dumps(entry, ensure_ascii=False, default=str))
+            return value
+        finally:
+            self._readers[key] -= 1
+            if not self._readers[key]:
+                del self._readers[key]
+                del self._versions[key]
+
+    async def _invalidate(self, *keys: CacheKey):
+        for key in keys:
+            if key in self._versions:
+                self._versions[key] += 1
+        self.invalidations += len(keys)
+        await self.backend.delete(*keys)
+
+    async def get_travel_plan(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read_through(
+            ("plan", user_id, plan_id),
+            lambda: self.db.get_travel_plan(plan_id, user_id),
+        )
+
+    async def get_travel_plan_fields(self, plan_id: str, user_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        return await self._read_through(
+            ("fields", user_id, plan_id),
+            lambda: self.db.get_travel_plan_fields(plan_id, user_id, fields),
+            variant=json.dumps(fields, ensure_ascii=False),
+        )
+
+    async def get_user_travel_plans(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self._read_through(
+            ("plans", user_id),
+            lambda: self.db.get_user_travel_plans(user_id),
+        )
+
+    async def get_user_travel_plan_summaries(
+        self,
+        user_id: str,
+        limit: int = 20,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._read_through(
+            ("summaries", user_id),
+            lambda: self.db.get_user_travel_plan_summaries(user_id, limit=limit, after=after),
+            variant=json.dumps([limit, list(after) if after is not None else None], ensure_ascii=False),
+        )
+
+    async def get_plan_expenses(self, plan_id: str, user_id: str) -> List[Dict[str, Any]]:
+        return await self._read_through(
+            ("expenses", user_id, plan_id),
+            lambda: self.db.get_plan_expenses(plan_id, user_id),
+        )
+
+    async def get_plan_budget_totals(self, plan_id: str, user_id: str) -> Dict[str, float]:
+        return await self._read_through(
+            ("budget", user_id, plan_id),
+            lambda: self.db.get_plan_budget_totals(plan_id, user_id),
+        )
+
+    def _list_keys(self, user_id: str) -> Tuple[CacheKey, CacheKey]:
+        return ("plans", user_id), ("summaries", user_id)
+
+    def _plan_keys(self, user_id: str, plan_id: str) -> Tuple[CacheKey, ...]:
+        return ("plan", user_id, plan_id), ("fields", user_id, plan_id), *self._list_keys(user_id)
+
+    def _expense_keys(self, user_id: str, plan_id: str) -> Tuple[CacheKey, CacheKey]:
+        return ("expenses", user_id, plan_id), ("budget", user_id, plan_id)
+
+    async def create_travel_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self.db.create_travel_plan(user_id, plan_data)
+        finally:
+            await self._invalidate(*self._list_keys(user_id))
+
+    async def create_travel_plans(self, plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            return await self.db.create_travel_plans(plans)
+        finally:
+            user_ids = sorted({plan.get("user_id") for plan in plans})
+            await self._invalidate(*(key for user_id in user_ids for key in self._list_keys(user_id)))
+
+    async def update_travel_plan(self, plan_id: str, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self.db.update_travel_plan(plan_id, user_id, plan_data)
+        finally:
+            await self._invalidate(*self._plan_keys(user_id, plan_id))
+
+    async def patch_travel_plan(
+        self,
+        plan_id: str,
+        user_id: str,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+        return_path: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.db.patch_travel_plan(plan_id, user_id, operations, expected_version, return_path)
+        finally:
+            await self._invalidate(*self._plan_keys(user_id, plan_id))
+
+    async def delete_travel_plan(self, plan_id: str, user_id: str) -> bool:
+        try:
+            return await self.db.delete_travel_plan(plan_id, user_id)
+        finally:
+            # 费用记录随计划级联删除
+            await self._invalidate(*self._plan_keys(user_id, plan_id), *self._expense_keys(user_id, plan_id))
+
+    async def create_expense(self, user_id: str, plan_id: str, expense_data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self.db.create_expense(user_id, plan_id, expense_data)
+        finally:
+            await self._invalidate(*self._expense_keys(user_id, plan_id))
+
+    async def create_expenses(self, user_id: str, expenses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            return await self.db.create_expenses(user_id, expenses)
+        finally:
+            plan_ids = sorted({expense.get("plan_id") for expense in expenses})
+            await self._invalidate(*(key for plan_id in plan_ids for key in self._expense_keys(user_id, plan_id)))
+
+    async def update_expense(self, expense_id: str, user_id: str, expense_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        expense = await self.db.update_expense(expense_id, user_id, expense_data)
+        if expense is not None:
+            await self._invalidate(*self._expense_keys(user_id, expense["plan_id"]))
+        return expense
+
+    async def delete_expense(self, expense_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        expense = await self.db.delete_expense(expense_id, user_id)
+        if expense is not None:
+            await self._invalidate(*self._expense_keys(user_id, expense["plan_id"]))
+        return expense
+
+    async def close(self):
+        await self.backend.close()
+        await self.db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
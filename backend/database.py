@@ -1,22 +1,98 @@
 """
 数据库配置和操作 - 使用Supabase
+通过共享的异步HTTP客户端直接访问 Supabase 的 PostgREST 接口（/rest/v1），
+连接池保持长连接，每次调用有独立的超时，不会阻塞事件循环。
+存储实现由 config.Settings.storage_backend 选择（supabase / sqlite），接口见 storage.py。
 """
 import os
-from supabase import create_client, Client
-from typing import Optional, Dict, Any, List
-
-class Database:
-    """数据库管理类"""
-    
-    def __init__(self):
-        self.supabase_url = os.getenv("SUPABASE_URL")
-        self.supabase_key = os.getenv("SUPABASE_KEY")
-        
+import httpx
+from typing import Optional, Dict, Any, List, Tuple
+
+from data_cache import CachedDatabase, create_cache_backend
+from plan_outbox import OutboxDatabase, PlanOutbox, PLAN_OUTBOX_ENABLED, PLAN_OUTBOX_PATH
+from json_patch import JsonPatchError, JsonPatchTestFailed
+from storage import PLAN_SUMMARY_COLUMNS, PlanVersionConflict, Storage, parse_plan_field
+
+# 连接池和超时配置
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+class DatabaseError(Exception):
+    """PostgREST 返回错误"""
+
+    def __init__(self, status_code: int, message: str, details: Optional[str] = None):
+        super().__init__(f"数据库请求失败({status_code}): {message}")
+        self.status_code = status_code
+        self.message = message
+        self.details = details
+
+class Database(Storage):
+    """数据库管理类（Supabase 存储实现）"""
+
+    def __init__(
+        self,
+        supabase_url: Optional[str] = None,
+        supabase_key: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.supabase_url = supabase_url or os.getenv("SUPABASE_URL")
+        self.supabase_key = supabase_key or os.getenv("SUPABASE_KEY")
+
         if not self.supabase_url or not self.supabase_key:
             raise ValueError("SUPABASE_URL 和 SUPABASE_KEY 必须在环境变量中设置")
-        
-        self.client: Client = create_client(self.supabase_url, self.supabase_key)
-    
+
+        self.http = httpx.AsyncClient(
+            base_url=f"{self.supabase_url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": self.supabase_key,
+                "Authorization": f"Bearer {self.supabase_key}",
+            },
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+            transport=transport,
+        )
+
+    async def close(self):
+        """关闭连接池"""
+        await self.http.aclose()
+
+    async def _request(
+        self,
+        method: str,
+        table: str,
+        params: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        timeout: Optional[float] = None,
+        prefer: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """发送 PostgREST 请求，返回行列表"""
+        headers = {}
+        if method in ("POST", "PATCH", "DELETE"):
+            headers["Prefer"] = prefer or "return=representation"
+        response = await self.http.request(
+            method,
+            f"/{table}",
+            params=params,
+            json=json,
+            headers=headers,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+        )
+        if response.status_code >= 400:
+            try:
+                body = response.json()
+                message, details = body.get("message", response.text), body.get("details")
+            except ValueError:
+                message, details = response.text, None
+            raise DatabaseError(response.status_code, message, details)
+        if not response.content:
+            return []
+        return response.json()
+
     async def create_travel_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
         """创建旅行计划"""
         data = {
@@ -31,46 +107,141 @@ class Database:
             "itinerary": plan_data.get("itinerary"),
             "created_at": "now()"
         }
-        
-        result = self.client.table("travel_plans").insert(data).execute()
-        return result.data[0] if result.data else None
-    
+
+        rows = await self._request("POST", "travel_plans", json=data)
+        return rows[0] if rows else None
+
+    async def create_travel_plans(self, plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量写入已带 id 和 created_at 的计划（发件箱使用）
+        按 id 忽略已存在的行，重试写入不会产生重复记录
+        """
+        if not plans:
+            return []
+        data = [
+            {
+                key: plan.get(key)
+                for key in (
+                    "id", "user_id", "destination", "start_date", "end_date", "days",
+                    "budget", "travelers", "preferences", "itinerary", "version", "created_at",
+                )
+            }
+            for plan in plans
+        ]
+        return await self._request(
+            "POST", "travel_plans", json=data,
+            params={"on_conflict": "id"},
+            prefer="resolution=ignore-duplicates,return=representation",
+        )
+
     async def get_user_travel_plans(self, user_id: str) -> List[Dict[str, Any]]:
         """获取用户的所有旅行计划"""
-        result = self.client.table("travel_plans")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
-            .execute()
-        return result.data
-    
+        return await self._request("GET", "travel_plans", params={
+            "select": "*",
+            "user_id": f"eq.{user_id}",
+            "order": "created_at.desc",
+        })
+
+    async def get_user_travel_plan_summaries(
+        self,
+        user_id: str,
+        limit: int = 20,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        按创建时间倒序分页获取计划摘要（键集分页）
+        after 为上一页最后一条的 (created_at, id)，返回其后的最多 limit 条
+        """
+        params = {
+            "select": PLAN_SUMMARY_COLUMNS,
+            "user_id": f"eq.{user_id}",
+            "order": "created_at.desc,id.desc",
+            "limit": str(limit),
+        }
+        if after is not None:
+            created_at, plan_id = after
+            params["or"] = (
+                f'(created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt."{plan_id}"))'
+            )
+        return await self._request("GET", "travel_plans", params=params)
+
     async def get_travel_plan(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
         """获取特定旅行计划"""
-        result = self.client.table("travel_plans")\
-            .select("*")\
-            .eq("id", plan_id)\
-            .eq("user_id", user_id)\
-            .execute()
-        return result.data[0] if result.data else None
-    
+        rows = await self._request("GET", "travel_plans", params={
+            "select": "*",
+            "id": f"eq.{plan_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        return rows[0] if rows else None
+
+    async def get_travel_plan_fields(self, plan_id: str, user_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        只读取计划的部分字段，JSON 路径通过 PostgREST 的 -> 选择（如 itinerary->days->0），
+        数据库只返回选中的子树
+        """
+        select = ["version"]
+        for index, field in enumerate(fields):
+            column, path = parse_plan_field(field)
+            select.append(f"f{index}:{'->'.join([column, *path])}")
+        rows = await self._request("GET", "travel_plans", params={
+            "select": ",".join(select),
+            "id": f"eq.{plan_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        if not rows:
+            return None
+        row = rows[0]
+        return {"version": row.get("version"), **{field: row.get(f"f{index}") for index, field in enumerate(fields)}}
+
     async def update_travel_plan(self, plan_id: str, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
         """更新旅行计划"""
-        result = self.client.table("travel_plans")\
-            .update(plan_data)\
-            .eq("id", plan_id)\
-            .eq("user_id", user_id)\
-            .execute()
-        return result.data[0] if result.data else None
-    
+        rows = await self._request("PATCH", "travel_plans", json=plan_data, params={
+            "id": f"eq.{plan_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        return rows[0] if rows else None
+
+    async def patch_travel_plan(
+        self,
+        plan_id: str,
+        user_id: str,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+        return_path: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        在数据库内应用 JSON Patch（RPC patch_travel_plan_itinerary，见 database_setup.sql）
+        只传输补丁和修改后的子树，不传输整个 itinerary
+        """
+        try:
+            return await self._request("POST", "rpc/patch_travel_plan_itinerary", json={
+                "p_plan_id": plan_id,
+                "p_user_id": user_id,
+                "p_patch": operations,
+                "p_expected_version": expected_version,
+                "p_return_path": return_path or [],
+            })
+        except DatabaseError as e:
+            # 函数通过 PTxxx 错误码把失败原因映射为 HTTP 状态码
+            if e.status_code == 404:
+                return None
+            if e.status_code == 412:
+                raise PlanVersionConflict(int(e.details or 0))
+            if e.status_code == 409:
+                raise JsonPatchTestFailed(e.message)
+            if e.status_code == 422:
+                raise JsonPatchError(e.message)
+            raise
+
     async def delete_travel_plan(self, plan_id: str, user_id: str) -> bool:
         """删除旅行计划"""
-        result = self.client.table("travel_plans")\
-            .delete()\
-            .eq("id", plan_id)\
-            .eq("user_id", user_id)\
-            .execute()
-        return len(result.data) > 0
-    
+        rows = await self._request("DELETE", "travel_plans", params={
+            "id": f"eq.{plan_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        return len(rows) > 0
+
     async def create_expense(self, user_id: str, plan_id: str, expense_data: Dict[str, Any]) -> Dict[str, Any]:
         """创建费用记录"""
         data = {
@@ -82,32 +253,115 @@ class Database:
             "date": expense_data.get("date"),
             "created_at": "now()"
         }
-        
-        result = self.client.table("expenses").insert(data).execute()
-        return result.data[0] if result.data else None
-    
+
+        rows = await self._request("POST", "expenses", json=data)
+        return rows[0] if rows else None
+
+    async def create_expenses(self, user_id: str, expenses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量创建费用记录（一次多行插入），返回的记录与输入顺序一致"""
+        if not expenses:
+            return []
+        data = [
+            {
+                "user_id": user_id,
+                "plan_id": expense.get("plan_id"),
+                "category": expense.get("category"),
+                "amount": expense.get("amount"),
+                "description": expense.get("description"),
+                "date": expense.get("date"),
+                "created_at": "now()"
+            }
+            for expense in expenses
+        ]
+
+        return await self._request("POST", "expenses", json=data)
+
     async def get_plan_expenses(self, plan_id: str, user_id: str) -> List[Dict[str, Any]]:
         """获取计划的所有费用记录"""
-        result = self.client.table("expenses")\
-            .select("*")\
-            .eq("plan_id", plan_id)\
-            .eq("user_id", user_id)\
-            .order("date", desc=True)\
-            .execute()
-        return result.data
+        return await self._request("GET", "expenses", params={
+            "select": "*",
+            "plan_id": f"eq.{plan_id}",
+            "user_id": f"eq.{user_id}",
+            "order": "date.desc",
+        })
+
+    async def update_expense(self, expense_id: str, user_id: str, expense_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """修改费用记录，返回修改后的记录（不存在时为None）"""
+        rows = await self._request("PATCH", "expenses", json=expense_data, params={
+            "id": f"eq.{expense_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        return rows[0] if rows else None
+
+    async def delete_expense(self, expense_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """删除费用记录，返回被删除的记录（不存在时为None）"""
+        rows = await self._request("DELETE", "expenses", params={
+            "id": f"eq.{expense_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        return rows[0] if rows else None
+
+    async def get_plan_budget_totals(self, plan_id: str, user_id: str) -> Dict[str, float]:
+        """获取计划按类别的费用汇总（由数据库触发器随费用增删改维护）"""
+        rows = await self._request("GET", "plan_budget_totals", params={
+            "select": "category,total",
+            "plan_id": f"eq.{plan_id}",
+            "user_id": f"eq.{user_id}",
+        })
+        return {row["category"]: float(row["total"]) for row in rows}
+
+def create_storage(settings: Any = None) -> Storage:
+    """按配置创建存储实现"""
+    if settings is None:
+        from config import settings
+    if settings.storage_backend == "sqlite":
+        from sqlite_storage import SQLiteDatabase
+        return SQLiteDatabase(settings.sqlite_path)
+    if settings.storage_backend == "supabase":
+        return Database(settings.supabase_url, settings.supabase_key)
+    raise ValueError(f"未知的 STORAGE_BACKEND: {settings.storage_backend}")
 
 # 全局数据库实例
-db_instance: Optional[Database] = None
+db_instance: Optional[Storage] = None
+outbox_instance: Optional[OutboxDatabase] = None
 
 async def init_db():
-    """初始化数据库连接"""
-    global db_instance
-    db_instance = Database()
+    """
+    初始化数据库连接
+    按 PLAN_OUTBOX_ENABLED 配置包上计划写入发件箱（存储本身是本地的时不使用），
+    按 DATA_CACHE_BACKEND 配置包上读穿透缓存
+    """
+    global db_instance, outbox_instance
+    db = create_storage()
+    if PLAN_OUTBOX_ENABLED and not db.local:
+        outbox_instance = OutboxDatabase(db, PlanOutbox(PLAN_OUTBOX_PATH))
+        outbox_instance.start()
+        db = outbox_instance
+    backend = create_cache_backend()
+    db_instance = CachedDatabase(db, backend) if backend is not None else db
+
+async def close_db():
+    """关闭数据库连接池（发件箱会先尝试写入剩余计划）"""
+    global db_instance, outbox_instance
+    if db_instance is not None:
+        await db_instance.close()
+        db_instance = None
+    outbox_instance = None
 
-def get_db() -> Database:
+def data_cache_stats() -> Optional[Dict[str, Any]]:
+    """读穿透缓存的统计，未启用时为None"""
+    if isinstance(db_instance, CachedDatabase):
+        return db_instance.stats()
+    return None
+
+def plan_outbox_stats() -> Optional[Dict[str, Any]]:
+    """计划写入发件箱的统计，未启用时为None"""
+    if outbox_instance is not None:
+        return outbox_instance.stats()
+    return None
+
+def get_db() -> Storage:
     """获取数据库实例"""
     if db_instance is None:
         raise RuntimeError("数据库未初始化")
     return db_instance
-
-
@@ -0,0 +1,161 @@
+"""
+地理编码缓存
+同一个景点会被不同用户、不同页面反复解析，缓存后不再消耗高德配额：
+- 键为规范化的地址文本 + 城市（全半角、大小写、空白和常见标点统一）
+- 内存层为 LRU，磁盘层为本地 SQLite（进程重启后仍然有效）
+- 找到的结果长时间缓存；"找不到"的结果短时间缓存，避免反复查询无效地址
+- 磁盘层的读写放到线程池执行，不阻塞事件循环
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+
+from ttl_cache import LRUCache, SQLiteCache
+
+# 缓存配置
+GEOCODE_CACHE_ENABLED = os.getenv("GEOCODE_CACHE_ENABLED", "true").lower() != "false"
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL = float(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", "3600"))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "10000"))
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "./data/geocode_cache.db")  # 设为空字符串时只用内存层
+
+# 地址中不影响含义的字符：空白和常见标点
+_ADDRESS_NOISE = re.compile(r"[\s,，、.。;；:：'\"“”‘’()（）\[\]【】<>《》·\-—_/|]+")
+
+# 磁盘层中"找不到"的标记
+_NOT_FOUND = {"not_found": True}
+
+
+def normalize_address(text: Optional[str]) -> str:
+    """统一全半角、大小写，去掉空白和标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _ADDRESS_NOISE.sub("", text)
+
+
+def geocode_cache_key(address: str, city: Optional[str] = None) -> str:
+    """地址 + 城市的缓存键"""
+    raw = f"{normalize_address(city)}|{normalize_address(address)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GeocodeCache:
+    """两级地理编码缓存：内存 LRU + SQLite"""
+
+    def __init__(
+        self,
+        ttl: float = GEOCODE_CACHE_TTL,
+        negative_ttl: float = GEOCODE_CACHE_NEGATIVE_TTL,
+        max_entries: int = GEOCODE_CACHE_MAX_ENTRIES,
+        disk_path: Optional[str] = GEOCODE_CACHE_PATH,
+        enabled: bool = GEOCODE_CACHE_ENABLED,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk_path = disk_path or None
+        self._disk: Optional[SQLiteCache] = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def disk(self) -> Optional[SQLiteCache]:
+        """磁盘层在第一次使用时打开"""
+        if self._disk is None and self.disk_path:
+            self._disk = SQLiteCache(self.disk_path, table="geocode_cache")
+        return self._disk
+
+    def _disk_get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        disk = self.disk
+        return disk.get_entry(key) if disk is not None else None
+
+    def _disk_set(self, key: str, value: Any, ttl: float):
+        if self.disk is not None:
+            self.disk.set(key, value, ttl=ttl)
+
+    def _disk_delete(self, key: str):
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    async def lookup(self, address: str, city: Optional[str] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        查询缓存，返回 (是否命中, 结果)
+        命中"找不到"的缓存时返回 (True, None)
+        """
+        if not self.enabled:
+            return False, None
+
+        key = geocode_cache_key(address, city)
+        value = self.memory.get(key)
+        if value is None and self.disk_path:
+            entry = await asyncio.to_thread(self._disk_get, key)
+            if entry is not None:
+                value, expires_at = entry
+                self.disk_hits += 1
+                # 回填内存层时沿用磁盘条目的剩余有效期
+                ttl = self.negative_ttl if value == _NOT_FOUND else self.ttl
+                if expires_at is not None:
+                    ttl = min(ttl, max(expires_at - time.time(), 0.001))
+                self.memory.set(key, value, ttl=ttl)
+
+        if value is None:
+            self.misses += 1
+            return False, None
+        if value == _NOT_FOUND:
+            self.negative_hits += 1
+            return True, None
+        self.hits += 1
+        return True, value
+
+    async def set(self, address: str, city: Optional[str], result: Optional[Dict[str, Any]]):
+        """写入结果，result 为None表示找不到（短时间缓存）"""
+        if not self.enabled:
+            return
+
+        key = geocode_cache_key(address, city)
+        value, ttl = (result, self.ttl) if result is not None else (_NOT_FOUND, self.negative_ttl)
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_set, key, value, ttl)
+
+    async def contains(self, address: str, city: Optional[str] = None) -> bool:
+        """是否已缓存（不计入命中统计）"""
+        key = geocode_cache_key(address, city)
+        if key in self.memory:
+            return True
+        return self.disk_path is not None and await asyncio.to_thread(self._disk_get, key) is not None
+
+    async def delete(self, address: str, city: Optional[str] = None):
+        key = geocode_cache_key(address, city)
+        self.memory.delete(key)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_delete, key)
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": self._disk.count() if self._disk is not None else None,
+        }
+
+
+# 全局缓存实例
+geocode_cache = GeocodeCache()
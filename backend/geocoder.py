@@ -0,0 +1,212 @@
+"""
+并行对冲地理编码
+多个数据源（高德POI搜索、高德地理编码、可选的 Nominatim 兼容服务）按顺序错开启动：
+- 第一个数据源立即请求；超过对冲延迟仍没有足够可信的结果时启动下一个，
+  前一个数据源返回"找不到"或出错时立即启动下一个
+- 每个候选结果带置信度，超过接受阈值立即返回，其余请求取消
+- 整体截止时间之后返回已有的最佳结果，延迟上限可预期（不再是各数据源超时之和）
+数据源实现 GeocodeProvider 接口，测试中可以替换为本地桩实现。
+"""
+import asyncio
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from geocode_cache import normalize_address
+from http_clients import RateLimiter
+
+# 对冲配置
+GEOCODE_HEDGE_DELAY = float(os.getenv("GEOCODE_HEDGE_DELAY", "0.3"))  # 启动下一个数据源前等待的秒数
+GEOCODE_ACCEPT_CONFIDENCE = float(os.getenv("GEOCODE_ACCEPT_CONFIDENCE", "0.8"))  # 达到即返回
+GEOCODE_DEADLINE = float(os.getenv("GEOCODE_DEADLINE", "4"))  # 整体截止时间（秒）
+
+# 解析统计（用于 /api/metrics）
+resolver_stats: Dict[str, Any] = {"lookups": 0, "hedged": 0, "deadline_exceeded": 0, "wins": {}}
+
+
+class GeocodeCandidate:
+    """某个数据源给出的候选结果"""
+
+    def __init__(self, provider: str, result: Dict[str, Any], confidence: float):
+        self.provider = provider
+        self.result = result  # {lng, lat, formatted_address, name}，坐标为高德使用的 GCJ-02
+        self.confidence = confidence
+
+
+class GeocodeProvider(ABC):
+    """地理编码数据源"""
+
+    name = "provider"
+
+    @abstractmethod
+    async def lookup(self, address: str, city: Optional[str] = None) -> Optional[GeocodeCandidate]:
+        """解析地址，找不到时返回None，上游出错时抛出异常"""
+
+
+class HedgeOutcome:
+    """一次对冲解析的结果"""
+
+    def __init__(self, best: Optional[GeocodeCandidate], errors: List[Exception], deadline_exceeded: bool):
+        self.best = best
+        self.errors = errors
+        self.deadline_exceeded = deadline_exceeded
+
+    @property
+    def definitive(self) -> bool:
+        """所有数据源都明确答复（可以缓存"找不到"）"""
+        return self.best is not None or (not self.errors and not self.deadline_exceeded)
+
+
+def text_match(query: str, text: Optional[str]) -> float:
+    """查询词与结果名称/地址的匹配程度（0~1）"""
+    q, t = normalize_address(query), normalize_address(text)
+    if not q or not t:
+        return 0.0
+    if q in t or t in q:
+        return 1.0
+    return len(set(q) & set(t)) / len(set(q))
+
+
+async def hedged_resolve(
+    providers: List[GeocodeProvider],
+    address: str,
+    city: Optional[str] = None,
+    hedge_delay: float = GEOCODE_HEDGE_DELAY,
+    accept_confidence: float = GEOCODE_ACCEPT_CONFIDENCE,
+    deadline: float = GEOCODE_DEADLINE,
+) -> HedgeOutcome:
+    """按对冲策略依次启动数据源，返回置信度最高的候选"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    pending: Dict[asyncio.Task, GeocodeProvider] = {}
+    candidates: List[GeocodeCandidate] = []
+    errors: List[Exception] = []
+    launched = 0
+    next_launch = start
+    deadline_exceeded = False
+
+    def launch():
+        nonlocal launched, next_launch
+        provider = providers[launched]
+        launched += 1
+        pending[asyncio.create_task(provider.lookup(address, city))] = provider
+        next_launch = loop.time() + hedge_delay
+
+    resolver_stats["lookups"] += 1
+    try:
+        while pending or launched < len(providers):
+            now = loop.time()
+            if now >= start + deadline:
+                deadline_exceeded = True
+                resolver_stats["deadline_exceeded"] += 1
+                break
+            if launched < len(providers) and (not pending or now >= next_launch):
+                if pending:
+                    resolver_stats["hedged"] += 1
+                launch()
+                continue
+
+            timeout = start + deadline - now
+            if launched < len(providers):
+                timeout = min(timeout, next_launch - now)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = pending.pop(task)
+                try:
+                    candidate = task.result()
+                except Exception as e:
+                    print(f"⚠️ {provider.name} 地理编码失败: {e}")
+                    errors.append(e)
+                    continue
+                if candidate is not None:
+                    candidates.append(candidate)
+
+            if any(c.confidence >= accept_confidence for c in candidates):
+                break
+    finally:
+        # 已有足够好的结果（或超时、请求被取消）时取消其余数据源
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    best = max(candidates, key=lambda c: c.confidence, default=None)
+    if best is not None:
+        resolver_stats["wins"][best.provider] = resolver_stats["wins"].get(best.provider, 0) + 1
+    return HedgeOutcome(best, errors, deadline_exceeded)
+
+
+# ---------------------------------------------------------------------------
+# Nominatim 兼容数据源
+# ---------------------------------------------------------------------------
+
+_KRASOVSKY_A = 6378245.0
+_KRASOVSKY_EE = 0.00669342162296594323
+
+
+def _out_of_china(lng: float, lat: float) -> bool:
+    return not (73.66 < lng < 135.05 and 3.86 < lat < 53.55)
+
+
+def _transform_lat(x: float, y: float) -> float:
+    ret = -100.0 + 2.0 * x + 3.0 * y + 0.2 * y * y + 0.1 * x * y + 0.2 * math.sqrt(abs(x))
+    ret += (20.0 * math.sin(6.0 * x * math.pi) + 20.0 * math.sin(2.0 * x * math.pi)) * 2.0 / 3.0
+    ret += (20.0 * math.sin(y * math.pi) + 40.0 * math.sin(y / 3.0 * math.pi)) * 2.0 / 3.0
+    ret += (160.0 * math.sin(y / 12.0 * math.pi) + 320.0 * math.sin(y * math.pi / 30.0)) * 2.0 / 3.0
+    return ret
+
+
+def _transform_lng(x: float, y: float) -> float:
+    ret = 300.0 + x + 2.0 * y + 0.1 * x * x + 0.1 * x * y + 0.1 * math.sqrt(abs(x))
+    ret += (20.0 * math.sin(6.0 * x * math.pi) + 20.0 * math.sin(2.0 * x * math.pi)) * 2.0 / 3.0
+    ret += (20.0 * math.sin(x * math.pi) + 40.0 * math.sin(x / 3.0 * math.pi)) * 2.0 / 3.0
+    ret += (150.0 * math.sin(x / 12.0 * math.pi) + 300.0 * math.sin(x / 30.0 * math.pi)) * 2.0 / 3.0
+    return ret
+
+
+def wgs84_to_gcj02(lng: float, lat: float):
+    """WGS-84（OSM/GPS）坐标转换为高德使用的 GCJ-02 坐标（境外坐标不变）"""
+    if _out_of_china(lng, lat):
+        return lng, lat
+    dlat = _transform_lat(lng - 105.0, lat - 35.0)
+    dlng = _transform_lng(lng - 105.0, lat - 35.0)
+    radlat = lat / 180.0 * math.pi
+    magic = 1 - _KRASOVSKY_EE * math.sin(radlat) ** 2
+    sqrtmagic = math.sqrt(magic)
+    dlat = (dlat * 180.0) / ((_KRASOVSKY_A * (1 - _KRASOVSKY_EE)) / (magic * sqrtmagic) * math.pi)
+    dlng = (dlng * 180.0) / (_KRASOVSKY_A / sqrtmagic * math.cos(radlat) * math.pi)
+    return lng + dlng, lat + dlat
+
+
+class NominatimProvider(GeocodeProvider):
+    """Nominatim 兼容的地理编码服务（OpenStreetMap 数据，境外地点覆盖更好）"""
+
+    name = "nominatim"
+
+    def __init__(self, client: httpx.AsyncClient, limiter: Optional[RateLimiter] = None):
+        self.client = client
+        self.limiter = limiter
+
+    async def lookup(self, address: str, city: Optional[str] = None) -> Optional[GeocodeCandidate]:
+        query = f"{city} {address}" if city and city not in address else address
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        response = await self.client.get("/search", params={
+            "q": query, "format": "jsonv2", "limit": 1, "accept-language": "zh-CN,en",
+        })
+        response.raise_for_status()
+        places = response.json()
+        if not places:
+            return None
+
+        place = places[0]
+        lng, lat = wgs84_to_gcj02(float(place["lon"]), float(place["lat"]))
+        display_name = place.get("display_name") or ""
+        name = place.get("name") or display_name.split(",")[0] or address
+        confidence = 0.4 + 0.3 * float(place.get("importance") or 0) + 0.2 * text_match(address, name)
+        return GeocodeCandidate(self.name, {
+            "lng": lng, "lat": lat, "formatted_address": display_name, "name": name,
+        }, confidence)
@@ -0,0 +1,133 @@
+"""
+上游HTTP客户端管理
+每个上游主机（高德Web服务，以及可选的 Nominatim 兼容服务）共享一个 httpx.AsyncClient，由应用 lifespan 负责创建和关闭：
+- 连接池 + keep-alive 复用 TCP/TLS 连接，一次地理编码未命中不再握手两次
+- 安装了 h2 时启用 HTTP/2，多个并发请求复用同一条连接
+- 连接超时和读取超时分开设置，握手卡住时尽快失败
+- 按高德的QPS配额限速，批量请求不会触发上游限流
+"""
+import asyncio
+import os
+from typing import Optional
+
+import httpx
+
+from rate_limit import TokenBucket
+
+try:
+    import h2
+except ImportError:  # 可选依赖，未安装时使用 HTTP/1.1
+    h2 = None
+
+# 高德Web服务地址（可通过 AMAP_BASE_URL 覆盖，便于本地压测）
+AMAP_BASE_URL = "https://restapi.amap.com"
+
+# 连接池配置：地理编码请求短小且频繁，少量长连接即可
+AMAP_MAX_CONNECTIONS = int(os.getenv("AMAP_MAX_CONNECTIONS", "20"))
+AMAP_MAX_KEEPALIVE = int(os.getenv("AMAP_MAX_KEEPALIVE", "10"))
+AMAP_KEEPALIVE_EXPIRY = float(os.getenv("AMAP_KEEPALIVE_EXPIRY", "60"))
+AMAP_CONNECT_TIMEOUT = float(os.getenv("AMAP_CONNECT_TIMEOUT", "3"))
+AMAP_READ_TIMEOUT = float(os.getenv("AMAP_READ_TIMEOUT", "5"))
+AMAP_ROUTE_READ_TIMEOUT = float(os.getenv("AMAP_ROUTE_READ_TIMEOUT", "10"))
+AMAP_HTTP2 = os.getenv("AMAP_HTTP2", "true").lower() != "false"
+
+# 地理编码/POI搜索的QPS配额（个人开发者Key默认较低，0表示不限速）
+AMAP_GEOCODE_QPS = float(os.getenv("AMAP_GEOCODE_QPS", "20"))
+AMAP_ROUTE_QPS = float(os.getenv("AMAP_ROUTE_QPS", "10"))  # 路径规划接口的QPS配额
+
+# Nominatim 兼容的地理编码服务（如 https://nominatim.openstreetmap.org 或自建实例），为空时不启用
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "")
+NOMINATIM_QPS = float(os.getenv("NOMINATIM_QPS", "1"))  # 公共实例的使用政策要求不超过1次/秒
+NOMINATIM_USER_AGENT = os.getenv("NOMINATIM_USER_AGENT", "AI-Travel-Planner/1.0")
+NOMINATIM_CONNECT_TIMEOUT = float(os.getenv("NOMINATIM_CONNECT_TIMEOUT", "3"))
+NOMINATIM_READ_TIMEOUT = float(os.getenv("NOMINATIM_READ_TIMEOUT", "5"))
+
+
+
+class RateLimiter:
+    """异步令牌桶限速（单个事件循环内共享）"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.bucket = TokenBucket(rate, burst or max(1.0, rate)) if rate > 0 else None
+        self.waits = 0
+
+    async def acquire(self):
+        """等待直到取得一个令牌"""
+        if self.bucket is None:
+            return
+        while not self.bucket.try_acquire():
+            self.waits += 1
+            await asyncio.sleep(self.bucket.wait_time())
+
+
+# 全局客户端实例
+amap_client: Optional[httpx.AsyncClient] = None
+nominatim_client: Optional[httpx.AsyncClient] = None
+
+# 所有地理编码请求（单个和批量）共享的限速器
+amap_geocode_limiter = RateLimiter(AMAP_GEOCODE_QPS)
+amap_route_limiter = RateLimiter(AMAP_ROUTE_QPS)
+nominatim_limiter = RateLimiter(NOMINATIM_QPS)
+
+
+def create_amap_client(base_url: Optional[str] = None, **kwargs) -> httpx.AsyncClient:
+    """创建带连接池的高德客户端（额外参数透传给 httpx.AsyncClient，如 verify）"""
+    return httpx.AsyncClient(
+        base_url=base_url or os.getenv("AMAP_BASE_URL", AMAP_BASE_URL),
+        http2=AMAP_HTTP2 and h2 is not None,
+        limits=httpx.Limits(
+            max_connections=AMAP_MAX_CONNECTIONS,
+            max_keepalive_connections=AMAP_MAX_KEEPALIVE,
+            keepalive_expiry=AMAP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(AMAP_READ_TIMEOUT, connect=AMAP_CONNECT_TIMEOUT),
+        **kwargs,
+    )
+
+
+def create_nominatim_client(base_url: Optional[str] = None, **kwargs) -> httpx.AsyncClient:
+    """创建 Nominatim 客户端（服务要求设置 User-Agent）"""
+    return httpx.AsyncClient(
+        base_url=base_url or NOMINATIM_URL,
+        headers={"User-Agent": NOMINATIM_USER_AGENT},
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+        timeout=httpx.Timeout(NOMINATIM_READ_TIMEOUT, connect=NOMINATIM_CONNECT_TIMEOUT),
+        **kwargs,
+    )
+
+
+async def init_http_clients():
+    """应用启动时创建上游客户端"""
+    global amap_client, nominatim_client
+    if amap_client is None:
+        amap_client = create_amap_client()
+    if nominatim_client is None and NOMINATIM_URL:
+        nominatim_client = create_nominatim_client()
+
+
+async def close_http_clients():
+    """应用关闭时释放连接池"""
+    global amap_client, nominatim_client
+    if amap_client is not None:
+        await amap_client.aclose()
+        amap_client = None
+    if nominatim_client is not None:
+        await nominatim_client.aclose()
+        nominatim_client = None
+
+
+def get_amap_client() -> httpx.AsyncClient:
+    """获取共享的高德客户端（FastAPI依赖；未经 lifespan 启动时延迟创建）"""
+    global amap_client
+    if amap_client is None:
+        amap_client = create_amap_client()
+    return amap_client
+
+
+def get_nominatim_client() -> Optional[httpx.AsyncClient]:
+    """获取共享的 Nominatim 客户端，未配置 NOMINATIM_URL 时返回None"""
+    global nominatim_client
+    if nominatim_client is None and NOMINATIM_URL:
+        nominatim_client = create_nominatim_client()
+    return nominatim_client
@@ -0,0 +1,203 @@
+"""
+进程内后台任务队列
+任务提交后由固定数量的 worker 执行，执行过程与HTTP连接解耦：
+- 队列有上限，满时拒绝提交（调用方返回 429 + Retry-After）
+- 每个任务的事件通过 EventBroadcast 广播，可随时查询状态或重新订阅
+- 已结束的任务保留一段时间后清理（定时清理，查询和提交时也会清理）
+"""
+import asyncio
+import math
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from broadcast import EventBroadcast
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("任务队列已满，请稍后重试")
+        self.retry_after = retry_after
+
+
+class Job:
+    """后台任务"""
+
+    def __init__(self, user_id: str, payload: Any):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.payload = payload
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.channel = EventBroadcast()
+
+    def publish(self, event: Dict[str, Any]):
+        """发布任务进度事件"""
+        self.channel.publish(event)
+
+    @property
+    def progress(self) -> int:
+        """最近一次上报的进度"""
+        for event in reversed(self.channel.events):
+            if "progress" in event:
+                return event["progress"]
+        return 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态"""
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        if self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """有界队列 + 固定并发的任务执行器"""
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[Any]],
+        workers: int = 4,
+        max_queue: int = 50,
+        retention: float = 3600,
+    ):
+        self.handler = handler
+        self.worker_count = workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+        self._avg_duration = 30.0  # 任务平均耗时（秒），用于估算 Retry-After
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """启动 worker（需在事件循环中调用）"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        """停止 worker；执行中和排队中的任务标记为失败并关闭事件通道，订阅者不会一直等待"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                self._cancel(job)
+                job.channel.close()
+        self._queue = None
+
+    def _cancel(self, job: Job):
+        job.status = "failed"
+        job.error = "任务已取消"
+        job.finished_at = time.time()
+        job.publish({"error": job.error, "message": "服务正在关闭，任务已取消"})
+
+    def submit(self, user_id: str, payload: Any) -> Job:
+        """提交任务，队列已满时抛出 QueueFullError"""
+        self.start()
+        self._purge_expired()
+
+        job = Job(user_id, payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+
+        self.jobs[job.id] = job
+        job.publish({"progress": 0, "message": "任务已排队，等待生成...", "job_id": job.id})
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务（已过保留期的任务视为不存在）"""
+        self._purge_expired()
+        return self.jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """估算队列腾出空位所需的秒数"""
+        queued = self._queue.qsize() if self._queue else 0
+        return max(1, math.ceil(self._avg_duration * max(queued, 1) / max(self.worker_count, 1)))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await self.handler(job)
+                job.status = "succeeded"
+                self.completed += 1
+            except asyncio.CancelledError:
+                self._cancel(job)
+                raise
+            except Exception as e:
+                import traceback
+                print(f"后台任务失败: {traceback.format_exc()}")
+                job.status = "failed"
+                job.error = str(e)
+                job.publish({"error": str(e), "message": f"生成失败: {str(e)}"})
+                self.failed += 1
+            finally:
+                job.finished_at = time.time()
+                duration = job.finished_at - job.started_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                job.channel.close()
+                self._queue.task_done()
+
+    async def _reap(self):
+        """定时清理过期任务，没有新的提交和查询时已结束的任务也会被释放"""
+        while True:
+            await asyncio.sleep(max(min(self.retention, 60), 1))
+            self._purge_expired()
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计"""
+        running = sum(1 for job in self.jobs.values() if job.status == "running")
+        return {
+            "workers": self.worker_count,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "running": running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_duration": round(self._avg_duration, 2),
+        }
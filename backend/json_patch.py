@@ -0,0 +1,202 @@
+"""
+JSON Patch（RFC 6902）
+支持 add / remove / replace / move / copy / test 六种操作，路径使用 JSON Pointer（RFC 6901）。
+Supabase 存储在数据库内用 jsonb 函数执行同样的操作（见 database_setup.sql 中的 jsonb_patch），
+这里的实现用于请求校验和嵌入式存储。
+"""
+import copy
+import re
+from typing import Any, Dict, List, Optional
+
+OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+_ARRAY_INDEX = re.compile(r"^(0|[1-9][0-9]{0,8})$")
+
+
+class JsonPatchError(Exception):
+    """补丁格式错误或路径无法应用"""
+
+    status_code = 422
+
+
+class JsonPatchTestFailed(JsonPatchError):
+    """test 操作的值与文档不一致"""
+
+    status_code = 409
+
+
+def parse_pointer(pointer: Any) -> List[str]:
+    """把 JSON Pointer 解析为路径片段列表，空字符串表示整个文档"""
+    if not isinstance(pointer, str):
+        raise JsonPatchError("路径必须是字符串")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"无效的JSON Pointer: {pointer}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def format_pointer(tokens: List[str]) -> str:
+    return "".join("/" + token.replace("~", "~0").replace("/", "~1") for token in tokens)
+
+
+def validate_operations(operations: Any) -> List[Dict[str, Any]]:
+    """检查补丁结构（不依赖文档内容），返回操作列表"""
+    if not isinstance(operations, list) or not operations:
+        raise JsonPatchError("补丁必须是非空的操作数组")
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise JsonPatchError(f"第{index}个操作必须是对象")
+        op = operation.get("op")
+        if op not in OPERATIONS:
+            raise JsonPatchError(f"第{index}个操作的 op 无效: {op}")
+        parse_pointer(operation.get("path"))
+        if op in ("move", "copy"):
+            parse_pointer(operation.get("from"))
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JsonPatchError(f"第{index}个操作缺少 value")
+    return operations
+
+
+def changed_path(operations: List[Dict[str, Any]]) -> List[str]:
+    """
+    补丁修改的最小公共子树路径
+    add/remove 会移动数组中后续元素的下标，因此取父节点；replace 只影响目标节点；test 不修改文档
+    """
+    affected = []
+    for operation in operations:
+        op = operation["op"]
+        path = parse_pointer(operation["path"])
+        if op == "replace":
+            affected.append(path)
+        elif op in ("add", "remove", "copy"):
+            affected.append(path[:-1])
+        elif op == "move":
+            affected.append(path[:-1])
+            affected.append(parse_pointer(operation["from"])[:-1])
+    if not affected:
+        return []
+
+    common = affected[0]
+    for path in affected[1:]:
+        length = 0
+        while length < min(len(common), len(path)) and common[length] == path[length]:
+            length += 1
+        common = common[:length]
+    return common
+
+
+def _index(token: str, size: int) -> int:
+    if not _ARRAY_INDEX.match(token) or int(token) >= size:
+        raise JsonPatchError(f"数组下标无效: {token}")
+    return int(token)
+
+
+def resolve(document: Any, tokens: List[str]) -> Any:
+    """取路径对应的值，不存在时抛出 JsonPatchError"""
+    node = document
+    for token in tokens:
+        if isinstance(node, dict):
+            if token not in node:
+                raise JsonPatchError(f"路径不存在: {format_pointer(tokens)}")
+            node = node[token]
+        elif isinstance(node, list):
+            node = node[_index(token, len(node))]
+        else:
+            raise JsonPatchError(f"路径不存在: {format_pointer(tokens)}")
+    return node
+
+
+def get_value(document: Any, tokens: List[str]) -> Optional[Any]:
+    """取路径对应的值，不存在时返回None"""
+    try:
+        return resolve(document, tokens)
+    except JsonPatchError:
+        return None
+
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent, key = resolve(document, tokens[:-1]), tokens[-1]
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        if key == "-":
+            parent.append(value)
+        else:
+            parent.insert(_index(key, len(parent) + 1), value)
+    else:
+        raise JsonPatchError(f"父节点不是对象或数组: {format_pointer(tokens)}")
+    return document
+
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        raise JsonPatchError("不能删除整个文档")
+    parent, key = resolve(document, tokens[:-1]), tokens[-1]
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JsonPatchError(f"路径不存在: {format_pointer(tokens)}")
+        del parent[key]
+    elif isinstance(parent, list):
+        del parent[_index(key, len(parent))]
+    else:
+        raise JsonPatchError(f"路径不存在: {format_pointer(tokens)}")
+    return document
+
+
+def _replace(document: Any, tokens: List[str], value: Any) -> Any:
+    resolve(document, tokens)
+    if not tokens:
+        return value
+    parent, key = resolve(document, tokens[:-1]), tokens[-1]
+    if isinstance(parent, dict):
+        parent[key] = value
+    else:
+        parent[_index(key, len(parent))] = value
+    return document
+
+
+def json_equal(a: Any, b: Any) -> bool:
+    """按 JSON 语义比较（true 与 1 不相等，1 与 1.0 相等）"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(json_equal(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(json_equal(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+def apply_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """按顺序应用补丁，返回新文档（不修改原文档）；任一操作失败则整个补丁失败"""
+    document = copy.deepcopy(document)
+    for operation in validate_operations(operations):
+        op = operation["op"]
+        path = parse_pointer(operation["path"])
+        if op == "add":
+            document = _add(document, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            document = _remove(document, path)
+        elif op == "replace":
+            document = _replace(document, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            source = parse_pointer(operation["from"])
+            if len(path) > len(source) and path[:len(source)] == source:
+                raise JsonPatchError("不能把节点移动到它自己的子节点下")
+            value = resolve(document, source)
+            document = _add(_remove(document, source), path, value)
+        elif op == "copy":
+            value = copy.deepcopy(resolve(document, parse_pointer(operation["from"])))
+            document = _add(document, path, value)
+        elif op == "test":
+            try:
+                current = resolve(document, path)
+            except JsonPatchError:
+                raise JsonPatchTestFailed(f"test 失败，路径不存在: {operation['path']}")
+            if not json_equal(current, operation["value"]):
+                raise JsonPatchTestFailed(f"test 失败: {operation['path']}")
+    return document
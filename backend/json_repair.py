@@ -0,0 +1,310 @@
+"""
+大模型JSON输出修复
+对模型返回的文本做一次线性扫描，输出合法JSON：
+- 跳过JSON前后的说明文字和 ``` 代码块标记
+- 去掉 // 、/* */ 和 # 注释
+- 删除多余的逗号（尾逗号、连续逗号），补上缺失的逗号和冒号
+- 为未加引号的键和值加引号，单引号字符串转为双引号（字符串内部的撇号保持不变）
+- 转义字符串中的换行符和未转义的内部引号
+- True/False/None/NaN 等字面量转为JSON字面量
+- 输出被截断时补全字符串、丢弃不完整的键值对并闭合所有括号
+"""
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+
+class JSONRepairError(ValueError):
+    """无法从文本中修复出JSON"""
+
+
+# 未加引号的值映射到JSON字面量
+_LITERALS = {
+    "true": "true",
+    "false": "false",
+    "null": "null",
+    "True": "true",
+    "False": "false",
+    "None": "null",
+    "NaN": "null",
+    "Infinity": "null",
+    "-Infinity": "null",
+    "undefined": "null",
+}
+
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$")
+
+# 字符串中允许的转义字符
+_VALID_ESCAPES = set('"\\/bfnrt')
+
+# 可以出现在未加引号的值之后的分隔符
+_VALUE_DELIMITERS = ",}]\n"
+
+
+class _Container:
+    """扫描过程中打开的对象或数组"""
+
+    __slots__ = ("kind", "count", "expect", "start", "item_start", "discard")
+
+    def __init__(self, kind: str, discard: bool = False):
+        self.kind = kind          # "{" 或 "["
+        self.count = 0            # 已开始的成员数
+        self.expect = "key" if kind == "{" else "value"  # 对象: key / colon / value
+        self.start = 0            # 容器在输出中的起始位置（含分隔逗号）
+        self.item_start = 0       # 当前成员在输出中的起始位置（含分隔逗号）
+        self.discard = discard    # 出现在键位置的容器，闭合后丢弃
+
+
+def _normalize_number(raw: str) -> Optional[str]:
+    """规整数字写法，无法识别时返回None"""
+    text = raw.lstrip("+")
+    if text.startswith("."):
+        text = "0" + text
+    elif text.startswith("-."):
+        text = "-0" + text[1:]
+    text = text.rstrip(".")
+    if _NUMBER.match(text):
+        return text
+    if re.match(r"-?\d+(\.\d+)?$", text):
+        # 前导零，如 007
+        return str(float(text)) if "." in text else str(int(text))
+    return None
+
+
+def _string_ends_at(text: str, i: int, n: int) -> bool:
+    """判断位置 i 的引号是否为字符串结尾（其后是分隔符、换行或文本结束）"""
+    j = i + 1
+    while j < n:
+        ch = text[j]
+        if ch == "\n":
+            return True
+        if ch in " \t\r":
+            j += 1
+            continue
+        # 引号后隔空白紧跟另一个字符串，视为缺少逗号
+        return ch in ",:}]/#" or (ch == '"' and j > i + 1)
+    return True
+
+
+def _scan_string(text: str, i: int, n: int, quote: str, out: List[str]) -> int:
+    """读取以 quote 开头的字符串，写入标准JSON字符串，返回结束后的位置"""
+    out.append('"')
+    i += 1
+    while i < n:
+        ch = text[i]
+        if ch == "\\":
+            if i + 1 >= n:
+                i += 1
+                break
+            nxt = text[i + 1]
+            if nxt in _VALID_ESCAPES:
+                out.append(ch + nxt)
+                i += 2
+            elif nxt == "u" and re.match(r"[0-9a-fA-F]{4}", text[i + 2:i + 6]):
+                out.append(text[i:i + 6])
+                i += 6
+            elif nxt == "'":
+                out.append("'")
+                i += 2
+            else:
+                out.append("\\\\")
+                i += 1
+            continue
+        if ch == quote:
+            if _string_ends_at(text, i, n):
+                i += 1
+                out.append('"')
+                return i
+            out.append('\\"' if quote == '"' else "'")
+            i += 1
+            continue
+        if ch == '"':
+            out.append('\\"')
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\r":
+            out.append("\\r")
+        elif ch == "\t":
+            out.append("\\t")
+        elif ch < " ":
+            out.append("\\u%04x" % ord(ch))
+        else:
+            out.append(ch)
+        i += 1
+    # 字符串被截断，补上结尾引号
+    out.append('"')
+    return i
+
+
+def repair_json(text: str) -> str:
+    """单次线性扫描修复模型输出，返回合法的JSON文本"""
+    n = len(text)
+    i = 0
+
+    # 定位JSON起点（跳过说明文字和代码块标记）
+    while i < n and text[i] not in "{[":
+        i += 1
+    if i >= n:
+        raise JSONRepairError("文本中没有JSON对象或数组")
+
+    out: List[str] = []
+    stack: List[_Container] = []
+
+    def begin_item(container: _Container):
+        container.item_start = len(out)
+        if container.count:
+            out.append(",")
+        container.count += 1
+
+    def begin_value() -> bool:
+        """在当前容器中开始一个值；返回该值是否位于对象的键位置"""
+        if not stack:
+            return False
+        top = stack[-1]
+        if top.kind == "[":
+            begin_item(top)
+            return False
+        if top.expect == "colon":
+            out.append(":")
+        elif top.expect == "key":
+            begin_item(top)
+            top.expect = "key"
+            return True
+        top.expect = "key"
+        return False
+
+    def _close(container: _Container):
+        """闭合栈顶容器：丢弃没有值的键，键位置上的容器整体丢弃"""
+        if container.kind == "{" and container.expect in ("colon", "value"):
+            del out[container.item_start:]
+        stack.pop()
+        out.append("}" if container.kind == "{" else "]")
+        if container.discard:
+            del out[container.start:]
+            stack[-1].count -= 1
+
+    while i < n:
+        ch = text[i]
+
+        if ch in " \t\r\n":
+            i += 1
+            continue
+
+        # 注释
+        if ch == "/" and i + 1 < n and text[i + 1] == "/" or ch == "#":
+            while i < n and text[i] != "\n":
+                i += 1
+            continue
+        if ch == "/" and i + 1 < n and text[i + 1] == "*":
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+
+        if not stack and out:
+            # 根节点已闭合，忽略后续文本
+            break
+
+        if ch in "{[":
+            in_key_position = begin_value()
+            container = _Container(ch, discard=in_key_position)
+            container.start = stack[-1].item_start if stack else len(out)
+            stack.append(container)
+            out.append(ch)
+            i += 1
+            continue
+
+        if ch in "}]":
+            if not stack:
+                i += 1
+                continue
+            # 括号不匹配时先闭合内层容器
+            if not any(c.kind == ("{" if ch == "}" else "[") for c in stack):
+                i += 1
+                continue
+            while stack:
+                container = stack[-1]
+                _close(container)
+                if container.kind == ("{" if ch == "}" else "["):
+                    break
+            i += 1
+            continue
+
+        if ch == ",":
+            i += 1
+            continue
+
+        if ch == ":":
+            if stack and stack[-1].kind == "{" and stack[-1].expect == "colon":
+                out.append(":")
+                stack[-1].expect = "value"
+            i += 1
+            continue
+
+        if ch in "\"'":
+            top = stack[-1] if stack else None
+            if top is not None and top.kind == "{" and top.expect == "key":
+                begin_item(top)
+                i = _scan_string(text, i, n, ch, out)
+                top.expect = "colon"
+            else:
+                begin_value()
+                i = _scan_string(text, i, n, ch, out)
+            continue
+
+        # 未加引号的键或值
+        top = stack[-1] if stack else None
+        if top is not None and top.kind == "{" and top.expect == "key":
+            start = i
+            while i < n and text[i] not in ':,}]\n"':
+                i += 1
+            word = text[start:i].strip()
+            if word:
+                begin_item(top)
+                out.append(json.dumps(word, ensure_ascii=False))
+                top.expect = "colon"
+            continue
+
+        start = i
+        while i < n and text[i] not in _VALUE_DELIMITERS:
+            if text[i] == "/" and i + 1 < n and text[i + 1] in "/*":
+                break
+            i += 1
+        word = text[start:i].strip()
+        if not word:
+            i = max(i, start + 1)
+            continue
+        begin_value()
+        if word in _LITERALS:
+            out.append(_LITERALS[word])
+        else:
+            number = _normalize_number(word)
+            out.append(number if number is not None else json.dumps(word, ensure_ascii=False))
+
+    # 文本被截断：丢弃不完整的键值对并闭合所有括号
+    while stack:
+        _close(stack[-1])
+
+    return "".join(out)
+
+
+def loads(text: str) -> Any:
+    """解析模型输出的JSON：合法时直接解析，否则修复后解析"""
+    return loads_with_status(text)[0]
+
+
+def loads_with_status(text: str) -> Tuple[Any, bool]:
+    """同 loads，另外返回是否经过修复（修复过的结果可能丢失了被截断的内容）"""
+    if text is None:
+        raise JSONRepairError("文本为空")
+    stripped = text.strip()
+    try:
+        return json.loads(stripped), False
+    except ValueError:
+        pass
+
+    try:
+        return json.loads(repair_json(stripped)), True
+    except ValueError as e:
+        if isinstance(e, JSONRepairError):
+            raise
+        raise JSONRepairError(f"JSON修复失败: {e}") from e
@@ -0,0 +1,163 @@
+"""
+增量JSON解析 - 在AI流式输出过程中提取已完成的行程片段
+逐字符扫描一次输出流，跟踪括号深度和字符串状态：
+- days 数组中每完成一个元素就产出一个 day 片段
+- 其他顶层字段（transportation、cost_breakdown、tips 等）完成时产出对应片段
+对JSON前后的说明文字、代码块标记和注释保持容忍。
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+import json_repair
+
+
+class IncrementalItineraryParser:
+    """行程JSON的增量解析器"""
+
+    def __init__(self, array_key: str = "days"):
+        self.array_key = array_key
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.started = False
+        self.finished = False
+        self.in_string = False
+        self.escape = False
+        self.comment: Optional[str] = None  # "line" / "block"
+
+        # 顶层对象的状态
+        self.expect_key = False
+        self.current_key: Optional[str] = None
+        self.key_start: Optional[int] = None
+        self.value_start: Optional[int] = None
+
+        # days 数组中当前元素的起始位置
+        self.element_start: Optional[int] = None
+        self.element_index = 0
+
+        # 已完成的片段
+        self.sections: Dict[str, Any] = {}
+        self.items: List[Any] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """输入新的文本片段，返回本次新完成的片段事件列表"""
+        self.buffer += text
+        events: List[Dict[str, Any]] = []
+        buffer = self.buffer
+
+        while self.pos < len(buffer) and not self.finished:
+            i = self.pos
+            ch = buffer[i]
+
+            if self.comment == "line":
+                if ch == "\n":
+                    self.comment = None
+                self.pos += 1
+                continue
+            if self.comment == "block":
+                if ch == "/" and i > 0 and buffer[i - 1] == "*":
+                    self.comment = None
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect_key and self.key_start is not None:
+                        self.current_key = self._decode_key(buffer[self.key_start:i + 1])
+                        self.key_start = None
+                self.pos += 1
+                continue
+
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                    self.expect_key = True
+                self.pos += 1
+                continue
+
+            if ch == "/" and i + 1 < len(buffer):
+                nxt = buffer[i + 1]
+                if nxt in "/*":
+                    self.comment = "line" if nxt == "/" else "block"
+                    self.pos += 2
+                    continue
+            elif ch == "/":
+                # 需要下一个字符才能判断是否为注释
+                break
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect_key:
+                    self.key_start = i
+                elif self.depth == 1 and self.value_start is None:
+                    self.value_start = i
+            elif ch == ":" and self.depth == 1:
+                self.expect_key = False
+            elif ch in "{[":
+                if self.depth == 1 and self.value_start is None:
+                    self.value_start = i
+                elif self.depth == 2 and self.current_key == self.array_key and ch == "{":
+                    self.element_start = i
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 2 and self.element_start is not None and ch == "}":
+                    events.extend(self._complete_element(buffer[self.element_start:i + 1]))
+                    self.element_start = None
+                elif self.depth == 1 and self.value_start is not None:
+                    events.extend(self._complete_section(buffer[self.value_start:i + 1]))
+                elif self.depth == 0:
+                    if self.value_start is not None:
+                        events.extend(self._complete_section(buffer[self.value_start:i]))
+                    self.finished = True
+            elif ch == "," and self.depth == 1:
+                if self.value_start is not None:
+                    events.extend(self._complete_section(buffer[self.value_start:i]))
+                self.expect_key = True
+            elif self.depth == 1 and not self.expect_key and self.value_start is None and not ch.isspace():
+                # 数字、布尔等标量值
+                self.value_start = i
+
+            self.pos += 1
+
+        return events
+
+    def _decode_key(self, raw: str) -> str:
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return raw.strip('"')
+
+    def _loads(self, text: str) -> Any:
+        """解析片段（容忍常见格式问题），失败时返回None（最终结果仍以完整解析为准）"""
+        try:
+            return json_repair.loads(text)
+        except ValueError:
+            return None
+
+    def _complete_element(self, text: str) -> List[Dict[str, Any]]:
+        index = self.element_index
+        self.element_index += 1
+        data = self._loads(text)
+        if data is None:
+            return []
+        self.items.append(data)
+        return [{"section": "day", "index": index, "data": data}]
+
+    def _complete_section(self, text: str) -> List[Dict[str, Any]]:
+        key = self.current_key
+        self.value_start = None
+        self.current_key = None
+        if key is None or key == self.array_key:
+            return []
+        data = self._loads(text.strip())
+        if data is None:
+            return []
+        self.sections[key] = data
+        return [{"section": key, "data": data}]
@@ -0,0 +1,69 @@
+"""
+大语言模型客户端管理 - 阿里云百炼（OpenAI兼容接口）
+整个进程共享一个 AsyncOpenAI 客户端，由应用 lifespan 负责创建和关闭，
+底层 httpx 连接池复用与 DashScope 之间的 TCP/TLS 连接。
+"""
+import os
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+# 阿里云百炼 OpenAI 兼容接口地址（可通过 DASHSCOPE_BASE_URL 覆盖，便于本地压测）
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 默认模型
+DEFAULT_MODEL = "qwen-plus"
+
+# 连接池配置：单个 worker 需要同时承载几十条流式响应
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+
+# 全局客户端实例
+llm_client: Optional[AsyncOpenAI] = None
+
+
+def create_llm_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """创建带连接池的异步客户端"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        ),
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url or os.getenv("DASHSCOPE_BASE_URL", DASHSCOPE_BASE_URL),
+        http_client=http_client,
+    )
+
+
+async def init_llm_client():
+    """应用启动时初始化客户端（未配置密钥时延迟到首次使用再报错）"""
+    global llm_client
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if api_key and llm_client is None:
+        llm_client = create_llm_client(api_key)
+
+
+async def close_llm_client():
+    """应用关闭时释放连接池"""
+    global llm_client
+    if llm_client is not None:
+        await llm_client.close()
+        llm_client = None
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """获取共享的阿里云百炼客户端"""
+    global llm_client
+    if llm_client is None:
+        api_key = os.getenv("DASHSCOPE_API_KEY")
+        if not api_key:
+            raise HTTPException(status_code=500, detail="DASHSCOPE_API_KEY未配置")
+        llm_client = create_llm_client(api_key)
+    return llm_client
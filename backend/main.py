@@ -8,15 +8,46 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional, List
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 from routers import travel, voice, auth, budget, parse, geocode
-from database import init_db
+from database import init_db, close_db, data_cache_stats, plan_outbox_stats
+from llm import init_llm_client, close_llm_client
+from http_clients import init_http_clients, close_http_clients
+from plan_cache import plan_cache
+from geocode_cache import geocode_cache
+from geocoder import resolver_stats
+from route_planning import route_cache
+from admission import admission_controller
+from telemetry import generation_telemetry
+from prompts import prompt_cache_stats
+from serialization import FastJSONResponse
+from compression import CompressionMiddleware
 
 # 加载环境变量
 load_dotenv()
 
-app = FastAPI(title="AI Travel Planner API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化数据库、共享的AI客户端、上游HTTP客户端和后台任务队列，关闭时释放"""
+    await init_db()
+    await init_llm_client()
+    await init_http_clients()
+    travel.plan_jobs.start()
+    yield
+    await travel.plan_jobs.stop()
+    await travel.stop_plan_generations()
+    await close_http_clients()
+    await close_llm_client()
+    await close_db()
+
+app = FastAPI(
+    title="AI Travel Planner API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 # CORS配置
 app.add_middleware(
@@ -27,6 +58,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 较大的JSON响应（完整行程等）按 Accept-Encoding 压缩，SSE 不压缩
+app.add_middleware(CompressionMiddleware)
+
 # 静态文件服务 - 动态获取正确的路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 frontend_dir = os.path.join(os.path.dirname(current_dir), "frontend")
@@ -40,11 +74,6 @@ app.include_router(budget.router, prefix="/api/budget", tags=["预算管理"])
 app.include_router(parse.router, prefix="/api/parse", tags=["智能解析"])
 app.include_router(geocode.router, prefix="/api/map", tags=["地图服务"])
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动时初始化数据库"""
-    await init_db()
-
 @app.get("/")
 async def root():
     """根路径"""
@@ -55,6 +84,26 @@ async def health_check():
     """健康检查"""
     return {"status": "healthy"}
 
+@app.get("/api/metrics")
+async def metrics():
+    """运行指标（缓存命中率等）"""
+    return {
+        "plan_cache": plan_cache.stats(),
+        "plan_generation": {
+            **travel.generation_stats,
+            "inflight": len(travel.inflight_generations),
+            "latency": generation_telemetry.stats(),
+            "prompt_cache": prompt_cache_stats.stats(),
+        },
+        "plan_jobs": travel.plan_jobs.stats(),
+        "llm_admission": admission_controller.stats(),
+        "data_cache": data_cache_stats(),
+        "plan_outbox": plan_outbox_stats(),
+        "geocode_cache": geocode_cache.stats(),
+        "geocode_resolver": resolver_stats,
+        "route_cache": route_cache.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
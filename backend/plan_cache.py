@@ -0,0 +1,146 @@
+"""
+旅行计划结果缓存
+相同目的地、天数、人数、预算档位和偏好的请求直接复用已生成的行程，
+避免重复调用大模型。内存层为 LRU（TTL + 字节上限），磁盘层为可选的 SQLite。
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from datetime import date
+from typing import Any, Dict, Optional
+
+from ttl_cache import LRUCache, SQLiteCache
+
+# 缓存配置
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() != "false"
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(6 * 3600)))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "512"))
+PLAN_CACHE_MAX_BYTES = int(os.getenv("PLAN_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH")  # 设置后启用磁盘层，如 ./data/plan_cache.db
+
+# 预算档位：按几何级数分档，相邻档位相差约15%
+BUDGET_BUCKET_RATIO = float(os.getenv("PLAN_CACHE_BUDGET_RATIO", "1.15"))
+
+# 偏好分隔符：中英文逗号、顿号、分号、斜杠、空白
+_PREFERENCE_SPLIT = re.compile(r"[,，、;；/|\s]+")
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    """统一全半角、大小写和空白"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.lower().split())
+
+
+def budget_bucket(budget: float) -> int:
+    """将预算映射到档位编号"""
+    if budget is None or budget <= 0:
+        return 0
+    return int(math.floor(math.log(budget) / math.log(BUDGET_BUCKET_RATIO)))
+
+
+def normalize_preferences(preferences: Optional[str]) -> str:
+    """偏好词拆分、去重并排序"""
+    terms = {term for term in _PREFERENCE_SPLIT.split(_normalize_text(preferences)) if term}
+    return "、".join(sorted(terms))
+
+
+def normalize_start_date(start_date: Optional[str]) -> str:
+    """出发日期统一为 YYYY-MM-DD，无法解析时按文本规范化"""
+    text = _normalize_text(start_date)
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        return text
+
+
+def canonicalize_request(request: Any) -> Dict[str, Any]:
+    """生成规范化的请求描述（与提示词相关的字段）"""
+    return {
+        "destination": _normalize_text(request.destination),
+        "days": int(request.days),
+        "travelers": int(request.travelers),
+        "budget_bucket": budget_bucket(request.budget),
+        "preferences": normalize_preferences(request.preferences),
+        # 出发日期会写入提示词（季节、节假日影响行程），必须参与缓存键
+        "start_date": normalize_start_date(getattr(request, "start_date", None)),
+    }
+
+
+def plan_cache_key(request: Any) -> str:
+    """根据规范化请求生成缓存键"""
+    canonical = json.dumps(canonicalize_request(request), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """两级行程缓存：内存 LRU + 可选 SQLite 磁盘层"""
+
+    def __init__(
+        self,
+        ttl: float = PLAN_CACHE_TTL,
+        max_entries: int = PLAN_CACHE_MAX_ENTRIES,
+        max_bytes: int = PLAN_CACHE_MAX_BYTES,
+        disk_path: Optional[str] = PLAN_CACHE_PATH,
+        enabled: bool = PLAN_CACHE_ENABLED,
+    ):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.disk = SQLiteCache(disk_path, table="plan_cache") if disk_path else None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def get(self, request: Any) -> Optional[Dict[str, Any]]:
+        """查询缓存的行程，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        key = plan_cache_key(request)
+        itinerary = self.memory.get(key)
+        if itinerary is None and self.disk is not None:
+            itinerary = self.disk.get(key)
+            if itinerary is not None:
+                self.disk_hits += 1
+                self.memory.set(key, itinerary)
+
+        if itinerary is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return itinerary
+
+    def set(self, request: Any, itinerary: Dict[str, Any]):
+        """写入缓存"""
+        if not self.enabled:
+            return
+
+        key = plan_cache_key(request)
+        self.memory.set(key, itinerary)
+        if self.disk is not None:
+            self.disk.set(key, itinerary, ttl=self.ttl)
+
+    def clear(self):
+        """清空内存层"""
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "disk_entries": self.disk.count() if self.disk is not None else None,
+        }
+
+
+# 全局缓存实例
+plan_cache = PlanCache()
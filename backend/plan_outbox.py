@@ -0,0 +1,470 @@
+"""
+旅行计划写入的本地发件箱（write-behind）
+生成完成的计划先写入本地 SQLite 发件箱并立即返回给用户，
+后台任务定期把发件箱中的计划批量写入 Supabase，失败时按指数退避重试：
+- 计划ID和创建时间在本地生成，重试写入不会产生重复记录
+- 尚未写入数据库的计划，读取、列表、修改和删除都直接使用发件箱中的数据
+- 进程重启后发件箱中的计划会继续写入
+- 批量写入失败时逐条重试，多次写入失败的计划转入死信，不再阻塞其他计划
+- 发件箱中的计划带 sync_status（pending / failed），写入失败的计划对用户可见而不是静默丢失
+默认关闭（PLAN_OUTBOX_ENABLED=true 开启）：计划在写入数据库前只存在于本机，
+多 worker 部署时只有持有发件箱文件的 worker 能读到；存储后端本身是本地 SQLite 时不使用发件箱。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import PLAN_SUMMARY_COLUMNS, patch_plan_itinerary, select_plan_fields
+
+# 发件箱配置
+PLAN_OUTBOX_ENABLED = os.getenv("PLAN_OUTBOX_ENABLED", "false").lower() == "true"
+PLAN_OUTBOX_PATH = os.getenv("PLAN_OUTBOX_PATH", "./data/plan_outbox.db")
+PLAN_OUTBOX_FLUSH_INTERVAL = float(os.getenv("PLAN_OUTBOX_FLUSH_INTERVAL", "2"))
+PLAN_OUTBOX_BATCH_SIZE = int(os.getenv("PLAN_OUTBOX_BATCH_SIZE", "50"))
+PLAN_OUTBOX_MAX_BACKOFF = float(os.getenv("PLAN_OUTBOX_MAX_BACKOFF", "300"))
+PLAN_OUTBOX_MAX_ATTEMPTS = int(os.getenv("PLAN_OUTBOX_MAX_ATTEMPTS", "8"))  # 超过后转入死信
+
+
+class PlanNotPersisted(Exception):
+    """发件箱中的计划暂时无法写入数据库"""
+
+
+def plan_estimated_cost(plan: Dict[str, Any]) -> Optional[float]:
+    """与数据库触发器一致：取 itinerary.cost_breakdown.total（非数字时为空）"""
+    total = ((plan.get("itinerary") or {}).get("cost_breakdown") or {}).get("total")
+    return float(total) if isinstance(total, (int, float)) and not isinstance(total, bool) else None
+
+
+class PlanOutbox:
+    """SQLite 持久化的待写入计划队列"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plan_outbox ("
+            "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, plan TEXT NOT NULL, "
+            "created_at TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT, dead_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(plan_outbox)")}
+        if "dead_at" not in columns:  # 旧版本创建的发件箱
+            self._conn.execute("ALTER TABLE plan_outbox ADD COLUMN dead_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_plan_outbox_user ON plan_outbox(user_id, created_at)")
+        self._conn.commit()
+
+    def add(self, plan: Dict[str, Any]):
+        """写入一个完整的计划行（含 id、user_id、created_at）"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plan_outbox (id, user_id, plan, created_at) VALUES (?, ?, ?, ?)",
+                (plan["id"], plan["user_id"], json.dumps(plan, ensure_ascii=False, default=str), plan["created_at"]),
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _with_sync_status(row: Tuple[str, Optional[float], Optional[str]]) -> Dict[str, Any]:
+        """发件箱中的计划加上写入状态：pending 等待写入，failed 多次写入失败（已转入死信）"""
+        plan, dead_at, last_error = row
+        plan = json.loads(plan)
+        if dead_at is None:
+            plan["sync_status"] = "pending"
+        else:
+            plan["sync_status"] = "failed"
+            plan["sync_error"] = last_error
+        return plan
+
+    def _load(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """原始计划行（不含写入状态）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT plan FROM plan_outbox WHERE id = ? AND user_id = ?", (plan_id, user_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT plan, dead_at, last_error FROM plan_outbox WHERE id = ? AND user_id = ?", (plan_id, user_id)
+            ).fetchone()
+        return self._with_sync_status(row) if row else None
+
+    def list_for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """用户待写入和写入失败的计划（按创建时间倒序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT plan, dead_at, last_error FROM plan_outbox WHERE user_id = ? "
+                "ORDER BY created_at DESC, id DESC",
+                (user_id,),
+            ).fetchall()
+        return [self._with_sync_status(row) for row in rows]
+
+    def update(self, plan_id: str, user_id: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        plan = self._load(plan_id, user_id)
+        if plan is None:
+            return None
+        plan.update(changes)
+        plan["version"] = changes.get("version", plan.get("version", 1) + 1)
+        plan["estimated_cost"] = plan_estimated_cost(plan)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE plan_outbox SET plan = ? WHERE id = ?",
+                (json.dumps(plan, ensure_ascii=False, default=str), plan_id),
+            )
+            self._conn.commit()
+        return self.get(plan_id, user_id)
+
+    def remove(self, plan_ids: List[str]) -> int:
+        if not plan_ids:
+            return 0
+        with self._lock:
+            cursor = self._conn.executemany("DELETE FROM plan_outbox WHERE id = ?", [(plan_id,) for plan_id in plan_ids])
+            self._conn.commit()
+            return cursor.rowcount
+
+    def due(self, limit: int, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """到达重试时间的待写入计划（最早创建的优先，不含死信）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT plan FROM plan_outbox WHERE dead_at IS NULL AND next_attempt_at <= ? "
+                "ORDER BY created_at LIMIT ?",
+                (time.time() if now is None else now, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def mark_failed(
+        self,
+        plan_ids: List[str],
+        error: str,
+        max_backoff: float = PLAN_OUTBOX_MAX_BACKOFF,
+        max_attempts: int = PLAN_OUTBOX_MAX_ATTEMPTS,
+    ) -> List[str]:
+        """记录写入失败，按失败次数指数退避；达到 max_attempts 的计划转入死信，返回其ID"""
+        now = time.time()
+        dead: List[str] = []
+        with self._lock:
+            for plan_id in plan_ids:
+                row = self._conn.execute("SELECT attempts FROM plan_outbox WHERE id = ?", (plan_id,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                delay = min(max_backoff, 2 ** attempts)
+                self._conn.execute(
+                    "UPDATE plan_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, now + delay, error[:500], plan_id),
+                )
+                if attempts >= max_attempts:
+                    # 死信保留在发件箱中（用户仍可读取），但不再自动重试
+                    self._conn.execute("UPDATE plan_outbox SET dead_at = ? WHERE id = ?", (now, plan_id))
+                    dead.append(plan_id)
+            self._conn.commit()
+        return dead
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending, oldest, max_attempts = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at), MAX(attempts) FROM plan_outbox WHERE dead_at IS NULL"
+            ).fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM plan_outbox WHERE dead_at IS NOT NULL").fetchone()[0]
+        return {
+            "pending": pending,
+            "oldest_created_at": oldest,
+            "max_attempts": max_attempts or 0,
+            "dead_letter": dead,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _summary(plan: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+    summary = {column: plan.get(column) for column in columns}
+    summary["sync_status"] = plan["sync_status"]
+    if "sync_error" in plan:
+        summary["sync_error"] = plan["sync_error"]
+    return summary
+
+
+class OutboxDatabase:
+    """计划写入经过发件箱的数据库包装，其余方法直接转发给底层 Database
+    发件箱的 SQLite 读写都放到线程池执行，不阻塞事件循环
+    """
+
+    def __init__(
+        self,
+        db: Any,
+        outbox: PlanOutbox,
+        flush_interval: float = PLAN_OUTBOX_FLUSH_INTERVAL,
+        batch_size: int = PLAN_OUTBOX_BATCH_SIZE,
+    ):
+        self.db = db
+        self.outbox = outbox
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # 发件箱的读改写互斥（只在 SQLite 操作期间持有，网络写入时不持有）；
+        # 正在写入数据库的计划记录在 _in_flight 中，对它们的修改/删除等写入结束后再进行，
+        # 避免删除的计划被写入恢复、或修改在写入完成后丢失
+        self._lock = asyncio.Lock()
+        self._in_flight: Dict[str, asyncio.Event] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.last_error: Optional[str] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.db, name)
+
+    def start(self):
+        """启动后台写入任务（需在事件循环中调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._wake.set()  # 上次运行遗留的计划立即写入
+
+    async def close(self):
+        """停止后台任务并尝试写入剩余计划（失败的计划保留在发件箱，下次启动继续）"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        finally:
+            self.outbox.close()
+            await self.db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"发件箱写入异常: {e}")
+
+    async def flush(self) -> int:
+        """把到期的待写入计划批量写入数据库，返回写入数量"""
+        written = 0
+        while True:
+            async with self._lock:
+                due = await asyncio.to_thread(self.outbox.due, self.batch_size + len(self._in_flight))
+                batch = [plan for plan in due if plan["id"] not in self._in_flight][:self.batch_size]
+                if not batch:
+                    return written
+                self._claim(batch)
+            try:
+                error = await self._try_write(batch)
+                if error is None or len(batch) == 1:
+                    await self._finish(batch, error)
+                    if error is not None:
+                        return written
+                    written += len(batch)
+                    continue
+                # 批量失败时逐条重试，只有写不进去的计划进入退避/死信
+                for plan in batch:
+                    row_error = await self._try_write([plan])
+                    await self._finish([plan], row_error)
+                    self._release([plan])
+                    if row_error is None:
+                        written += 1
+                return written
+            finally:
+                self._release(batch)
+
+    def _claim(self, plans: List[Dict[str, Any]]):
+        """标记计划正在写入数据库（调用方持有 self._lock）"""
+        for plan in plans:
+            self._in_flight[plan["id"]] = asyncio.Event()
+
+    def _release(self, plans: List[Dict[str, Any]]):
+        """写入结束，唤醒等待这些计划的修改/删除"""
+        for plan in plans:
+            event = self._in_flight.pop(plan["id"], None)
+            if event is not None:
+                event.set()
+
+    async def _try_write(self, plans: List[Dict[str, Any]]) -> Optional[Exception]:
+        """写入数据库（不持有锁），返回失败原因"""
+        try:
+            await self.db.create_travel_plans(plans)
+        except Exception as e:
+            self._record_failure(e)
+            return e
+        return None
+
+    async def _finish(self, plans: List[Dict[str, Any]], error: Optional[Exception]):
+        """写入成功的计划移出发件箱，失败的记录退避"""
+        ids = [plan["id"] for plan in plans]
+        async with self._lock:
+            if error is None:
+                await asyncio.to_thread(self.outbox.remove, ids)
+                self.flushed += len(ids)
+            else:
+                await self._mark_failed(ids, str(error))
+
+    @asynccontextmanager
+    async def _idle(self, plan_ids: List[str]):
+        """持有 self._lock，且 plan_ids 中没有正在写入数据库的计划（修改/删除不与写入交错）"""
+        while True:
+            async with self._lock:
+                event = next((self._in_flight[plan_id] for plan_id in plan_ids if plan_id in self._in_flight), None)
+                if event is None:
+                    yield
+                    return
+            await event.wait()
+
+    def _record_failure(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error)
+
+    async def _mark_failed(self, plan_ids: List[str], error: str):
+        dead = await asyncio.to_thread(self.outbox.mark_failed, plan_ids, error)
+        for plan_id in dead:
+            self.dead_lettered += 1
+            print(f"计划 {plan_id} 多次写入失败，已转入死信: {error}")
+
+    async def _persist_pending_plans(self, user_id: str, plan_ids: List[str]):
+        """费用记录通过外键引用计划：引用的计划若还在发件箱中，先写入数据库"""
+        plan_ids = list(dict.fromkeys(plan_ids))
+        async with self._idle(plan_ids):
+            plans = []
+            for plan_id in plan_ids:
+                plan = await asyncio.to_thread(self.outbox._load, plan_id, user_id)
+                if plan is not None:
+                    plans.append(plan)
+            if not plans:
+                return
+            self._claim(plans)
+        try:
+            error = await self._try_write(plans)
+            await self._finish(plans, error)
+        finally:
+            self._release(plans)
+        if error is not None:
+            raise PlanNotPersisted(f"旅行计划尚未保存到数据库，请稍后重试: {error}") from error
+
+    async def create_travel_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """写入发件箱并立即返回计划（后台写入数据库）"""
+        plan = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "destination": plan_data.get("destination"),
+            "start_date": plan_data.get("start_date"),
+            "end_date": plan_data.get("end_date"),
+            "days": plan_data.get("days"),
+            "budget": plan_data.get("budget"),
+            "travelers": plan_data.get("travelers"),
+            "preferences": plan_data.get("preferences"),
+            "itinerary": plan_data.get("itinerary"),
+            "version": 1,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        plan["estimated_cost"] = plan_estimated_cost(plan)
+        await asyncio.to_thread(self.outbox.add, plan)
+        self._wake.set()
+        return plan
+
+    async def get_travel_plan(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        plan = await asyncio.to_thread(self.outbox.get, plan_id, user_id)
+        if plan is not None:
+            return plan
+        return await self.db.get_travel_plan(plan_id, user_id)
+
+    async def get_travel_plan_fields(self, plan_id: str, user_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        plan = await asyncio.to_thread(self.outbox.get, plan_id, user_id)
+        if plan is not None:
+            return select_plan_fields(plan, fields)
+        return await self.db.get_travel_plan_fields(plan_id, user_id, fields)
+
+    async def get_user_travel_plans(self, user_id: str) -> List[Dict[str, Any]]:
+        pending = await asyncio.to_thread(self.outbox.list_for_user, user_id)
+        stored = await self.db.get_user_travel_plans(user_id)
+        pending_ids = {plan["id"] for plan in pending}
+        return pending + [plan for plan in stored if plan.get("id") not in pending_ids]
+
+    async def get_user_travel_plan_summaries(
+        self,
+        user_id: str,
+        limit: int = 20,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        columns = PLAN_SUMMARY_COLUMNS.split(",")
+
+        pending = [
+            _summary(plan, columns) for plan in await asyncio.to_thread(self.outbox.list_for_user, user_id)
+            if after is None or (plan["created_at"], plan["id"]) < tuple(after)
+        ]
+        stored = await self.db.get_user_travel_plan_summaries(user_id, limit=limit, after=after)
+        if not pending:
+            return stored
+
+        merged = {plan["id"]: plan for plan in stored}
+        merged.update((plan["id"], plan) for plan in pending)
+        rows = sorted(merged.values(), key=lambda plan: (plan["created_at"], plan["id"]), reverse=True)
+        return rows[:limit]
+
+    async def update_travel_plan(self, plan_id: str, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._idle([plan_id]):
+            plan = await asyncio.to_thread(self.outbox.update, plan_id, user_id, plan_data)
+        if plan is not None:
+            return plan
+        return await self.db.update_travel_plan(plan_id, user_id, plan_data)
+
+    async def patch_travel_plan(
+        self,
+        plan_id: str,
+        user_id: str,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+        return_path: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        async with self._idle([plan_id]):
+            plan = await asyncio.to_thread(self.outbox.get, plan_id, user_id)
+            if plan is not None:
+                itinerary, result = patch_plan_itinerary(plan, operations, expected_version, return_path or [])
+                changes = {"itinerary": itinerary, "version": result["version"]}
+                await asyncio.to_thread(self.outbox.update, plan_id, user_id, changes)
+                return result
+        return await self.db.patch_travel_plan(plan_id, user_id, operations, expected_version, return_path)
+
+    async def delete_travel_plan(self, plan_id: str, user_id: str) -> bool:
+        async with self._idle([plan_id]):
+            if await asyncio.to_thread(self.outbox.get, plan_id, user_id) is not None:
+                await asyncio.to_thread(self.outbox.remove, [plan_id])
+                return True
+        return await self.db.delete_travel_plan(plan_id, user_id)
+
+    async def create_expense(self, user_id: str, plan_id: str, expense_data: Dict[str, Any]) -> Dict[str, Any]:
+        await self._persist_pending_plans(user_id, [plan_id])
+        return await self.db.create_expense(user_id, plan_id, expense_data)
+
+    async def create_expenses(self, user_id: str, expenses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        await self._persist_pending_plans(user_id, [expense["plan_id"] for expense in expenses])
+        return await self.db.create_expenses(user_id, expenses)
+
+    def stats(self) -> Dict[str, Any]:
+        """发件箱统计"""
+        return {
+            **self.outbox.stats(),
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,228 @@
+"""
+行程生成提示词
+服务商（阿里云百炼）对请求的公共前缀做上下文缓存：前缀逐字节相同的部分只需计算一次。
+因此所有固定内容（角色设定、格式要求、返回格式示例）放在消息最前面且不含任何变量，
+日期、目的地等每次请求不同的内容统一放在最后。
+/plan 和 /plan-stream 共用同一套消息，长途旅行分天生成的骨架和单日提示词同样遵循此顺序。
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+# 系统提示词（所有行程生成调用共用，不含变量）
+PLAN_SYSTEM_PROMPT = """你是一个专业的旅行规划师，擅长为用户制定详细的旅行计划。
+
+重要规则：
+1. 必须严格按照JSON格式返回，不要添加任何额外的文字说明
+2. 所有字段名必须使用双引号
+3. 不要在JSON中使用单引号
+4. 不要在JSON中添加注释
+5. 确保所有括号正确闭合
+6. 不要在最后一个元素后添加逗号
+7. 所有字符串值都要用双引号包裹
+8. 确保JSON格式完整有效
+9. 行程日期以用户消息末尾给出的当前日期为准：用户说"今年"指当前年份，"明年"指下一年"""
+
+# 完整行程的固定说明和返回格式示例
+PLAN_INSTRUCTIONS = """请根据本消息末尾的旅行需求生成详细的旅行计划。
+
+请生成一个JSON格式的旅行计划，包含以下信息：
+1. 每天的详细行程（包括景点、餐厅、住宿建议）
+2. 交通方式建议
+3. 每个项目的预估费用
+4. 总费用预算分析
+5. 特别注意事项和建议
+
+返回格式示例：
+{
+    "days": [
+        {
+            "day": 1,
+            "date": "第一天",
+            "activities": [
+                {
+                    "time": "09:00",
+                    "type": "景点",
+                    "name": "景点名称",
+                    "description": "详细描述",
+                    "estimated_cost": 100,
+                    "location": {"lat": 35.6762, "lng": 139.6503},
+                    "duration": "2小时"
+                }
+            ],
+            "meals": [
+                {
+                    "time": "12:00",
+                    "type": "午餐",
+                    "restaurant": "餐厅名称",
+                    "cuisine": "菜系",
+                    "estimated_cost": 150
+                }
+            ],
+            "accommodation": {
+                "name": "酒店名称",
+                "type": "酒店类型",
+                "estimated_cost": 500
+            }
+        }
+    ],
+    "transportation": {
+        "outbound": {"method": "飞机", "cost": 2000},
+        "local": {"method": "地铁+出租车", "estimated_daily_cost": 100},
+        "return": {"method": "飞机", "cost": 2000}
+    },
+    "cost_breakdown": {
+        "transportation": 5000,
+        "accommodation": 3000,
+        "food": 2000,
+        "activities": 1500,
+        "shopping": 500,
+        "total": 12000
+    },
+    "tips": [
+        "建议1",
+        "建议2"
+    ]
+}
+
+days 数组的元素个数必须等于旅行天数。
+直接输出JSON，不要有任何前缀或后缀说明。"""
+
+# 行程骨架的固定说明和返回格式示例
+SKELETON_INSTRUCTIONS = """请根据本消息末尾的旅行需求生成行程骨架，只需确定每天游览的区域和主题，不需要具体活动。
+
+返回格式示例：
+{
+    "days": [
+        {"day": 1, "area": "游览区域", "theme": "当天主题"}
+    ],
+    "hotel": {"name": "酒店名称", "type": "酒店类型", "estimated_cost": 500},
+    "transportation": {
+        "outbound": {"method": "飞机", "cost": 2000},
+        "local": {"method": "地铁+出租车", "estimated_daily_cost": 100},
+        "return": {"method": "飞机", "cost": 2000}
+    },
+    "shopping_budget": 500,
+    "tips": ["建议1", "建议2"]
+}
+
+shopping_budget 为整个行程的购物预算（元）。days 数组的元素个数必须等于旅行天数，相邻天的区域尽量不重复。只返回JSON。"""
+
+# 单日详细行程的固定说明和返回格式示例
+DAY_INSTRUCTIONS = """请根据本消息末尾的信息生成某一天的详细行程。
+
+返回格式示例：
+{
+    "day": 1,
+    "date": "第1天",
+    "activities": [
+        {
+            "time": "09:00",
+            "type": "景点",
+            "name": "景点名称",
+            "description": "详细描述",
+            "estimated_cost": 100,
+            "location": {"lat": 35.6762, "lng": 139.6503},
+            "duration": "2小时"
+        }
+    ],
+    "meals": [
+        {"time": "12:00", "type": "午餐", "restaurant": "餐厅名称", "cuisine": "菜系", "estimated_cost": 150}
+    ],
+    "accommodation": {"name": "酒店名称", "type": "酒店类型", "estimated_cost": 500}
+}
+
+day 和 date 使用末尾给出的天数。只返回这一天的JSON对象。"""
+
+
+def _today_section(today: Optional[date]) -> str:
+    today = today or date.today()
+    return f"""【当前时间】
+当前日期：{today.strftime("%Y年%m月%d日")}
+当前年份：{today.year}年（"今年"指{today.year}年，"明年"指{today.year + 1}年）"""
+
+
+def _request_section(request: Any) -> str:
+    lines = [
+        f"目的地：{request.destination}",
+        f"旅行天数：{request.days}天",
+        f"预算：{request.budget}元人民币",
+        f"同行人数：{request.travelers}人",
+        f"旅行偏好：{request.preferences}",
+    ]
+    if getattr(request, "start_date", None):
+        lines.append(f"出发日期：{request.start_date}")
+    return "【旅行需求】\n" + "\n".join(lines)
+
+
+def _messages(instructions: str, variable: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{instructions}\n\n{variable}"},
+    ]
+
+
+def build_plan_messages(request: Any, today: Optional[date] = None) -> List[Dict[str, str]]:
+    """完整行程的消息列表（/plan 和 /plan-stream 共用）"""
+    return _messages(PLAN_INSTRUCTIONS, f"{_today_section(today)}\n\n{_request_section(request)}")
+
+
+def build_skeleton_messages(request: Any, today: Optional[date] = None) -> List[Dict[str, str]]:
+    """行程骨架的消息列表"""
+    return _messages(SKELETON_INSTRUCTIONS, f"{_today_section(today)}\n\n{_request_section(request)}")
+
+
+def build_day_messages(
+    request: Any,
+    outline: Dict[str, Any],
+    skeleton: Dict[str, Any],
+    today: Optional[date] = None,
+) -> List[Dict[str, str]]:
+    """单日详细行程的消息列表"""
+    hotel = skeleton.get("hotel") or {}
+    daily_budget = round(request.budget / max(request.days, 1))
+    variable = f"""【当天信息】
+目的地：{request.destination}
+天数：第{outline.get("day")}天
+游览区域：{outline.get("area", "")}
+当天主题：{outline.get("theme", "")}
+住宿酒店：{hotel.get("name", "")}
+同行人数：{request.travelers}人
+旅行偏好：{request.preferences}
+当天预算：约{daily_budget}元人民币"""
+    return _messages(DAY_INSTRUCTIONS, f"{_today_section(today)}\n\n{variable}")
+
+
+class PromptCacheStats:
+    """服务商上下文缓存的命中统计（来自 usage.prompt_tokens_details.cached_tokens）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.reported = 0  # 返回了缓存信息的请求数
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage: Any) -> Optional[int]:
+        """记录一次调用的 usage，返回命中缓存的token数（服务商未返回时为None）"""
+        if usage is None:
+            return None
+        self.requests += 1
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            return None
+        self.reported += 1
+        self.cached_tokens += cached
+        return cached
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "reported": self.reported,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "hit_rate": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+        }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,60 @@
+"""
+路线规划缓存和路点处理
+- 路线按起终点坐标（量化到约10米）+ 策略缓存，同一天的路线重复打开地图时不再请求高德
+- 相距不足10米的连续路点视为同一地点，不单独规划路段
+"""
+import math
+import os
+from typing import List, Sequence, Tuple
+
+from ttl_cache import LRUCache
+
+# 缓存配置（路线受路况影响，不宜缓存太久）
+ROUTE_CACHE_TTL = float(os.getenv("ROUTE_CACHE_TTL", str(24 * 3600)))
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "2000"))
+ROUTE_CACHE_MAX_BYTES = int(os.getenv("ROUTE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # polyline 较长，按字节限制
+
+# 坐标量化步长：纬度 0.0001° ≈ 11米，经度在国内约 9~11米
+COORD_QUANTUM = 1e-4
+
+# 小于该距离的相邻路点视为同一地点（米）
+MIN_WAYPOINT_DISTANCE = float(os.getenv("MIN_WAYPOINT_DISTANCE", "10"))
+
+EARTH_RADIUS = 6371008.8  # 米
+
+route_cache = LRUCache(max_entries=ROUTE_CACHE_MAX_ENTRIES, max_bytes=ROUTE_CACHE_MAX_BYTES, ttl=ROUTE_CACHE_TTL)
+
+
+def quantize(lng: float, lat: float) -> Tuple[int, int]:
+    """坐标量化为整数网格"""
+    return round(lng / COORD_QUANTUM), round(lat / COORD_QUANTUM)
+
+
+def route_cache_key(origin: Tuple[float, float], destination: Tuple[float, float], strategy: int) -> str:
+    """(起点, 终点, 策略) 的缓存键，相距不足约10米的坐标共用同一条路线"""
+    (olng, olat), (dlng, dlat) = quantize(*origin), quantize(*destination)
+    return f"{strategy}:{olng},{olat}:{dlng},{dlat}"
+
+
+def haversine(lng1: float, lat1: float, lng2: float, lat2: float) -> float:
+    """两点间球面距离（米）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def drop_near_duplicates(
+    points: Sequence[Tuple[float, float]], min_distance: float = MIN_WAYPOINT_DISTANCE
+) -> List[int]:
+    """返回保留的路点下标：与上一个保留点相距不足 min_distance 米的点被去掉"""
+    kept: List[int] = []
+    for index, (lng, lat) in enumerate(points):
+        if kept:
+            last_lng, last_lat = points[kept[-1]]
+            if haversine(last_lng, last_lat, lng, lat) < min_distance:
+                continue
+        kept.append(index)
+    return kept
+
@@ -1,14 +1,20 @@
 """
 预算管理路由
 """
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import os
-from openai import OpenAI
+import json
 
-from database import get_db, Database
+from database import get_db
+from storage import Storage
+from llm import get_llm_client, DEFAULT_MODEL
+from admission import admission_controller, Priority
+from bulk_import import iter_csv_records, iter_json_records, iter_ndjson_records
+import json_repair
+from json_repair import JSONRepairError
 
 router = APIRouter()
 
@@ -19,6 +25,12 @@ class ExpenseRequest(BaseModel):
     description: str
     date: Optional[str] = None
 
+class ExpenseUpdateRequest(BaseModel):
+    category: Optional[str] = None
+    amount: Optional[float] = None
+    description: Optional[str] = None
+    date: Optional[str] = None
+
 class ExpenseResponse(BaseModel):
     id: str
     plan_id: str
@@ -38,7 +50,7 @@ class BudgetAnalysis(BaseModel):
 async def add_expense(
     expense: ExpenseRequest,
     user_id: str,
-    db: Database = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """添加费用记录"""
     try:
@@ -56,11 +68,126 @@ async def add_expense(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"添加费用记录失败: {str(e)}")
 
+# 批量导入：每次多行插入的行数、单次导入的行数上限
+BULK_EXPENSE_CHUNK_SIZE = int(os.getenv("BULK_EXPENSE_CHUNK_SIZE", "500"))
+BULK_EXPENSE_MAX_ROWS = int(os.getenv("BULK_EXPENSE_MAX_ROWS", "10000"))
+
+def format_validation_error(error: ValidationError) -> str:
+    """把 pydantic 校验错误整理为一行说明"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or '记录'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+@router.post("/expenses/bulk")
+async def add_expenses_bulk(
+    request: Request,
+    user_id: str,
+    db: Storage = Depends(get_db)
+):
+    """
+    批量添加费用记录
+    请求体支持三种格式（按 Content-Type 区分）：
+    - application/json: ExpenseRequest 数组，或 {"expenses": [...]}
+    - application/x-ndjson: 每行一个 ExpenseRequest（流式读取）
+    - text/csv: 表头为 plan_id,category,amount,description,date（流式读取）
+    逐行校验，有效记录按 BULK_EXPENSE_CHUNK_SIZE 分块多行插入；返回每一行的结果
+    超过 BULK_EXPENSE_MAX_ROWS 行时停止读取，之后的行不导入，响应中的 error 说明原因
+    读取上传内容出错（如客户端断开）时同样停止，返回已处理部分的结果
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        records = iter_ndjson_records(request.stream())
+    elif content_type in ("text/csv", "application/csv"):
+        records = iter_csv_records(request.stream())
+    elif content_type == "application/json":
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+        items = body.get("expenses") if isinstance(body, dict) else body
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="请求体应为费用记录数组或 {\"expenses\": [...]}")
+        records = iter_json_records(items)
+    else:
+        raise HTTPException(status_code=415, detail=f"不支持的格式: {content_type}")
+
+    results: List[Dict[str, Any]] = []
+    pending: List[tuple] = []  # (行号, 费用数据)
+
+    async def flush():
+        if not pending:
+            return
+        batch = list(pending)
+        pending.clear()
+        try:
+            created = await db.create_expenses(user_id, [data for _, data in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                results.append({"row": batch[0][0], "status": "failed", "error": str(e)})
+                return
+            # 整块插入失败时逐行重试，只有真正写不进去的行标记为失败
+            for row, data in batch:
+                try:
+                    created = await db.create_expenses(user_id, [data])
+                except Exception as row_error:
+                    results.append({"row": row, "status": "failed", "error": str(row_error)})
+                    continue
+                results.append({"row": row, "status": "created", "id": created[0].get("id")})
+            return
+        for (row, _), record in zip(batch, created):
+            results.append({"row": row, "status": "created", "id": record.get("id")})
+
+    truncated = False
+    stream_error = None
+    try:
+        async for row, record, error in records:
+            if row > BULK_EXPENSE_MAX_ROWS:
+                truncated = True
+                break
+            if error is None:
+                try:
+                    expense = ExpenseRequest.model_validate(record)
+                except ValidationError as e:
+                    error = format_validation_error(e)
+            if error is not None:
+                results.append({"row": row, "status": "invalid", "error": error})
+                continue
+
+            pending.append((row, {
+                "plan_id": expense.plan_id,
+                "category": expense.category,
+                "amount": expense.amount,
+                "description": expense.description,
+                "date": expense.date or datetime.now().isoformat()
+            }))
+            if len(pending) >= BULK_EXPENSE_CHUNK_SIZE:
+                await flush()
+    except Exception as e:
+        stream_error = e
+    finally:
+        await records.aclose()
+    await flush()
+
+    results.sort(key=lambda result: result["row"])
+    created_count = sum(1 for result in results if result["status"] == "created")
+    response = {
+        "total": len(results),
+        "created": created_count,
+        "failed": len(results) - created_count,
+        "results": results,
+    }
+    if truncated:
+        response["error"] = f"超过单次导入上限{BULK_EXPENSE_MAX_ROWS}行，第{BULK_EXPENSE_MAX_ROWS}行之后的记录未导入"
+    elif stream_error is not None:
+        response["error"] = f"读取上传内容失败，之后的记录未导入: {str(stream_error) or type(stream_error).__name__}"
+    return response
+
 @router.get("/expenses/{plan_id}")
 async def get_expenses(
     plan_id: str,
     user_id: str,
-    db: Database = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """获取计划的所有费用记录"""
     try:
@@ -70,11 +197,55 @@ async def get_expenses(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取费用记录失败: {str(e)}")
 
+@router.put("/expense/{expense_id}")
+async def update_expense(
+    expense_id: str,
+    expense: ExpenseUpdateRequest,
+    user_id: str,
+    db: Storage = Depends(get_db)
+):
+    """修改费用记录（只更新提供的字段，计划的费用汇总由数据库同步更新）"""
+    expense_data = expense.model_dump(exclude_none=True)
+    if not expense_data:
+        raise HTTPException(status_code=400, detail="没有需要修改的字段")
+    try:
+        result = await db.update_expense(expense_id, user_id, expense_data)
+        
+        if not result:
+            raise HTTPException(status_code=404, detail="费用记录不存在")
+        
+        return result
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"修改费用记录失败: {str(e)}")
+
+@router.delete("/expense/{expense_id}")
+async def delete_expense(
+    expense_id: str,
+    user_id: str,
+    db: Storage = Depends(get_db)
+):
+    """删除费用记录"""
+    try:
+        result = await db.delete_expense(expense_id, user_id)
+        
+        if not result:
+            raise HTTPException(status_code=404, detail="费用记录不存在")
+        
+        return {"message": "删除成功"}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"删除费用记录失败: {str(e)}")
+
 @router.get("/analysis/{plan_id}", response_model=BudgetAnalysis)
 async def analyze_budget(
     plan_id: str,
     user_id: str,
-    db: Database = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """分析预算使用情况"""
     try:
@@ -84,20 +255,14 @@ async def analyze_budget(
         if not plan:
             raise HTTPException(status_code=404, detail="旅行计划不存在")
         
-        # 获取所有费用记录
-        expenses = await db.get_plan_expenses(plan_id, user_id)
+        # 按类别的费用汇总（随费用增删改增量维护，不再遍历全部费用记录）
+        category_breakdown = await db.get_plan_budget_totals(plan_id, user_id)
         
         # 计算总花费
-        total_spent = sum(exp.get("amount", 0) for exp in expenses)
+        total_spent = sum(category_breakdown.values())
         total_budget = plan.get("budget", 0)
         remaining = total_budget - total_spent
         
-        # 按类别统计
-        category_breakdown = {}
-        for exp in expenses:
-            category = exp.get("category", "其他")
-            category_breakdown[category] = category_breakdown.get(category, 0) + exp.get("amount", 0)
-        
         # 使用AI生成预算建议
         recommendations = await generate_budget_recommendations(
             total_budget, total_spent, category_breakdown, plan
@@ -129,10 +294,7 @@ async def generate_budget_recommendations(
         if not api_key:
             return ["预算建议功能需要配置DASHSCOPE_API_KEY"]
         
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
+        client = get_llm_client()
         
         prompt = f"""
 根据以下旅行预算信息，给出3-5条实用的预算管理建议：
@@ -150,29 +312,36 @@ async def generate_budget_recommendations(
 请以列表形式返回建议，每条建议简洁实用。只返回建议内容，不要其他说明。
 """
         
-        response = client.chat.completions.create(
-            model="qwen-plus",
-            messages=[
-                {"role": "system", "content": "你是一个专业的旅行预算顾问。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+        async with admission_controller.slot(Priority.BUDGET):
+            response = await client.chat.completions.create(
+                model=DEFAULT_MODEL,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的旅行预算顾问。"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7
+            )
         
         recommendations_text = response.choices[0].message.content
         
-        # 解析建议（按行分割）
-        recommendations = [
-            line.strip().lstrip('- ').lstrip('• ').lstrip('1234567890. ')
-            for line in recommendations_text.split('\n')
-            if line.strip() and len(line.strip()) > 10
-        ]
-        
-        return recommendations[:5]  # 最多返回5条
+        return parse_recommendations(recommendations_text)[:5]  # 最多返回5条
     
     except Exception as e:
         return [f"生成建议时出错: {str(e)}"]
 
-import json
-
-
+def parse_recommendations(text: str) -> List[str]:
+    """解析AI返回的建议：模型返回JSON数组时按数组解析，否则按行分割"""
+    stripped = text.strip()
+    if stripped.startswith("[") or stripped.startswith("```"):
+        try:
+            items = json_repair.loads(stripped)
+            if isinstance(items, list):
+                return [str(item).strip() for item in items if str(item).strip()]
+        except JSONRepairError:
+            pass
+    
+    return [
+        line.strip().lstrip('- ').lstrip('• ').lstrip('1234567890. ')
+        for line in text.split('\n')
+        if line.strip() and len(line.strip()) > 10
+    ]
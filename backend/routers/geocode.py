@@ -1,18 +1,58 @@
 """
 高德地图地理编码服务和路径规划服务
-使用Web服务API进行地址解析和路径规划
-支持地理编码、POI搜索和驾车路径规划
+使用Web服务API进行地址解析和路径规划（共享 http_clients 中的连接池客户端）
+支持地理编码、批量地理编码、POI搜索、驾车路径规划和整日多段路线规划
+地理编码结果经过两级缓存（内存 + 本地SQLite），重复地址不再请求高德
+未命中缓存时由 geocoder.hedged_resolve 对冲请求多个数据源（高德POI、高德地理编码、可选的Nominatim）
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import os
 import httpx
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Union
+
+from geocode_cache import geocode_cache, geocode_cache_key
+from geocoder import GeocodeCandidate, GeocodeProvider, NominatimProvider, hedged_resolve, text_match
+from http_clients import (
+    AMAP_CONNECT_TIMEOUT,
+    AMAP_ROUTE_READ_TIMEOUT,
+    amap_geocode_limiter,
+    amap_route_limiter,
+    get_amap_client,
+    get_nominatim_client,
+    nominatim_limiter,
+)
+from route_planning import drop_near_duplicates, route_cache, route_cache_key
+from serialization import dumps
+
+# 批量地理编码配置
+GEOCODE_BATCH_MAX_ITEMS = int(os.getenv("GEOCODE_BATCH_MAX_ITEMS", "200"))
+GEOCODE_BATCH_CONCURRENCY = int(os.getenv("GEOCODE_BATCH_CONCURRENCY", "5"))
+
+# 整日路线规划配置
+DAY_ROUTE_MAX_WAYPOINTS = int(os.getenv("DAY_ROUTE_MAX_WAYPOINTS", "30"))
+DAY_ROUTE_CONCURRENCY = int(os.getenv("DAY_ROUTE_CONCURRENCY", "4"))
 
 router = APIRouter()
 
 class GeocodeRequest(BaseModel):
     address: str
+    city: Optional[str] = None  # 城市上下文，同名地点在不同城市解析结果不同
+
+class GeocodeBatchItem(BaseModel):
+    address: str
+    city: Optional[str] = None
+
+class GeocodeBatchRequest(BaseModel):
+    addresses: List[Union[GeocodeBatchItem, str]]  # 地址或 {address, city}
+    city: Optional[str] = None  # 未单独指定城市的地址使用的城市
+    stream: bool = False  # True时按解析完成顺序以NDJSON逐条返回
+
+class AmapServiceError(Exception):
+    """高德接口返回错误（Key无效、配额用尽等），与"找不到"区分，结果不缓存"""
+
 
 class GeocodeResponse(BaseModel):
     lng: float
@@ -32,13 +72,65 @@ class RouteResponse(BaseModel):
     steps: List[Dict[str, Any]]  # 路径步骤
     polyline: str  # 路径轨迹（编码后的坐标串）
 
+class Waypoint(BaseModel):
+    lng: float
+    lat: float
+    name: Optional[str] = None
+
+class DayRouteRequest(BaseModel):
+    waypoints: List[Waypoint]  # 按游览顺序排列
+    strategy: int = 0  # 0=最快捷, 1=最经济, 2=最短距离
+
+class AmapPoiProvider(GeocodeProvider):
+    """高德POI搜索：适合景点、学校、商场等具体地点，名称匹配时最可信"""
+
+    name = "amap_poi"
+
+    def __init__(self, client: httpx.AsyncClient, amap_key: str):
+        self.client = client
+        self.amap_key = amap_key
+
+    async def lookup(self, address: str, city: Optional[str] = None) -> Optional[GeocodeCandidate]:
+        result = await search_poi(self.client, self.amap_key, address, city)
+        if result is None:
+            return None
+        return GeocodeCandidate(self.name, result.model_dump(), 0.7 + 0.3 * text_match(address, result.name))
+
+
+class AmapGeocodeProvider(GeocodeProvider):
+    """高德地理编码：适合详细地址"""
+
+    name = "amap_geocode"
+
+    def __init__(self, client: httpx.AsyncClient, amap_key: str):
+        self.client = client
+        self.amap_key = amap_key
+
+    async def lookup(self, address: str, city: Optional[str] = None) -> Optional[GeocodeCandidate]:
+        result = await geocode_by_address(self.client, self.amap_key, address, city)
+        if result is None:
+            return None
+        return GeocodeCandidate(self.name, result.model_dump(), 0.55 + 0.3 * text_match(address, result.formatted_address))
+
+
+def get_geocode_providers(client: httpx.AsyncClient = Depends(get_amap_client)) -> List[GeocodeProvider]:
+    """地理编码数据源（按对冲启动顺序；测试中可通过 dependency_overrides 替换为桩实现）"""
+    amap_key = os.getenv("AMAP_WEB_KEY", "564f4fc5fbd68a60cf4b80191841d1ee")
+    providers: List[GeocodeProvider] = [AmapPoiProvider(client, amap_key), AmapGeocodeProvider(client, amap_key)]
+    nominatim_client = get_nominatim_client()
+    if nominatim_client is not None:
+        providers.append(NominatimProvider(nominatim_client, nominatim_limiter))
+    return providers
+
+
 @router.post("/geocode")
-async def geocode_address(request: GeocodeRequest):
+async def geocode_address(request: GeocodeRequest, providers: List[GeocodeProvider] = Depends(get_geocode_providers)):
     """
     智能地理编码：将地址转换为经纬度坐标
     策略：
-    1. 先尝试POI搜索（适合景点、学校、商场等具体地点）
-    2. 如果POI搜索无结果，再使用地理编码（适合地址）
+    1. 先请求POI搜索（适合景点、学校、商场等具体地点）
+    2. POI搜索无结果或超过对冲延迟仍未返回可信结果时，同时请求地理编码（适合地址）
+    3. 配置了 NOMINATIM_URL 时再对冲请求 Nominatim，按置信度选择最佳结果
     """
     amap_key = os.getenv("AMAP_WEB_KEY", "564f4fc5fbd68a60cf4b80191841d1ee")
     
@@ -48,18 +140,9 @@ async def geocode_address(request: GeocodeRequest):
         raise HTTPException(status_code=400, detail="地址不能为空")
     
     try:
-        # 方案1: 优先尝试POI搜索（更精确）
-        poi_result = await search_poi(amap_key, request.address)
-        if poi_result:
-            print(f"✅ POI搜索成功: {poi_result.name}")
-            return poi_result
-        
-        # 方案2: 使用地理编码
-        print(f"⚠️ POI搜索无结果，使用地理编码")
-        geo_result = await geocode_by_address(amap_key, request.address)
-        if geo_result:
-            print(f"✅ 地理编码成功")
-            return geo_result
+        result = await resolve_address(providers, request.address, request.city)
+        if result:
+            return result
         
         # 都失败了
         raise HTTPException(status_code=404, detail=f"无法找到该地址: {request.address}")
@@ -73,150 +156,324 @@ async def geocode_address(request: GeocodeRequest):
         raise HTTPException(status_code=500, detail=f"地理编码服务错误: {str(e)}")
 
 
-async def search_poi(amap_key: str, keyword: str) -> Optional[GeocodeResponse]:
+async def resolve_address(
+    providers: List[GeocodeProvider], address: str, city: Optional[str] = None
+) -> Optional[GeocodeResponse]:
+    """
+    带缓存的地址解析，找不到时返回None
+    只缓存高德明确返回的结果（包括"找不到"），超时和网络错误不缓存
+    """
+    cached, value = await geocode_cache.lookup(address, city)
+    if cached:
+        return GeocodeResponse(**value) if value else None
+
+    try:
+        return await fetch_address(providers, address, city)
+    except AmapServiceError as e:
+        print(f"❌ 高德接口错误: {e}")
+        return None
+
+
+async def fetch_address(
+    providers: List[GeocodeProvider], address: str, city: Optional[str] = None
+) -> Optional[GeocodeResponse]:
+    """对冲请求各数据源解析地址（不查缓存），明确的结果写入缓存"""
+    outcome = await hedged_resolve(providers, address, city)
+    if outcome.best is not None:
+        print(f"✅ {outcome.best.provider} 解析成功: {address}（置信度 {outcome.best.confidence:.2f}）")
+        result = GeocodeResponse(**outcome.best.result)
+        await geocode_cache.set(address, city, result.model_dump())
+        return result
+
+    # 超时或上游出错时不缓存"找不到"
+    if outcome.deadline_exceeded:
+        raise httpx.TimeoutException("地理编码超过截止时间")
+    if outcome.errors:
+        raise outcome.errors[0]
+    await geocode_cache.set(address, city, None)
+    return None
+
+
+def batch_result(index: int, address: str, result: Optional[GeocodeResponse] = None,
+                 error: Optional[str] = None, cached: bool = False) -> Dict[str, Any]:
+    """批量地理编码中单个地址的结果"""
+    return {
+        "index": index,
+        "address": address,
+        "status": "error" if error else ("ok" if result else "not_found"),
+        "result": result.model_dump() if result else None,
+        "error": error,
+        "cached": cached,
+    }
+
+
+@router.post("/geocode-batch")
+async def geocode_batch(request: GeocodeBatchRequest, providers: List[GeocodeProvider] = Depends(get_geocode_providers)):
+    """
+    批量地理编码：一次解析整个行程的地点
+    - 规范化后相同的地址（含城市）只解析一次
+    - 缓存命中的地址立即返回，其余在并发上限和高德QPS限速下并发解析
+    - 默认按输入顺序返回 {"results": [...]}；stream=true 时以 NDJSON 按完成顺序逐条返回
+    """
+    if not request.addresses:
+        raise HTTPException(status_code=400, detail="地址列表不能为空")
+    if len(request.addresses) > GEOCODE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多解析 {GEOCODE_BATCH_MAX_ITEMS} 个地址")
+
+    # 按规范化的 (地址, 城市) 去重，记录每个唯一地址对应的输入位置
+    items = [
+        GeocodeBatchItem(address=item) if isinstance(item, str) else item
+        for item in request.addresses
+    ]
+    groups: Dict[str, List[int]] = {}
+    for index, item in enumerate(items):
+        if item.address.strip():
+            key = geocode_cache_key(item.address, item.city or request.city)
+            groups.setdefault(key, []).append(index)
+
+    ready: List[Dict[str, Any]] = [
+        batch_result(index, item.address, error="地址不能为空")
+        for index, item in enumerate(items) if not item.address.strip()
+    ]
+    pending = []
+    semaphore = asyncio.Semaphore(GEOCODE_BATCH_CONCURRENCY)
+
+    async def resolve(indexes: List[int]) -> List[Dict[str, Any]]:
+        item = items[indexes[0]]
+        try:
+            async with semaphore:
+                result = await fetch_address(providers, item.address, item.city or request.city)
+            error = None
+        except httpx.TimeoutException:
+            result, error = None, "地理编码服务超时"
+        except Exception as e:
+            result, error = None, f"地理编码服务错误: {str(e)}"
+        return [batch_result(i, items[i].address, result, error) for i in indexes]
+
+    for indexes in groups.values():
+        item = items[indexes[0]]
+        cached, value = await geocode_cache.lookup(item.address, item.city or request.city)
+        if cached:
+            result = GeocodeResponse(**value) if value else None
+            ready.extend(batch_result(i, items[i].address, result, cached=True) for i in indexes)
+        else:
+            pending.append(indexes)
+
+    print(f"🗺️ 批量地理编码: {len(items)} 个地址，去重后 {len(groups)} 个，需请求高德 {len(pending)} 个")
+
+    if not request.stream:
+        for results in await asyncio.gather(*(resolve(indexes) for indexes in pending)):
+            ready.extend(results)
+        return {"results": sorted(ready, key=lambda r: r["index"])}
+
+    async def generate():
+        tasks = [asyncio.create_task(resolve(indexes)) for indexes in pending]
+        try:
+            for result in ready:
+                yield dumps(result) + b"\n"
+            for task in asyncio.as_completed(tasks):
+                for result in await task:
+                    yield dumps(result) + b"\n"
+        finally:
+            # 客户端断开时取消尚未完成的解析
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+async def search_poi(
+    client: httpx.AsyncClient, amap_key: str, keyword: str, city: Optional[str] = None
+) -> Optional[GeocodeResponse]:
     """
     POI（兴趣点）搜索 - 更精确
     适用于：景点、学校、商场、酒店等
     """
-    url = "https://restapi.amap.com/v3/place/text"
+    url = "/v3/place/text"
     params = {
         "key": amap_key,
         "keywords": keyword,
         "offset": 1,  # 只返回最相关的1个结果
         "extensions": "base"
     }
+    if city:
+        params["city"] = city
     
     print(f"🔍 POI搜索: {keyword}")
     
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        response = await client.get(url, params=params)
-        data = response.json()
-        
-        if data.get("status") == "1" and data.get("count") != "0":
-            pois = data.get("pois", [])
-            if pois:
-                poi = pois[0]
-                location = poi["location"].split(",")
-                print(f"📍 找到POI: {poi.get('name')} - {poi.get('address')}")
-                return GeocodeResponse(
-                    lng=float(location[0]),
-                    lat=float(location[1]),
-                    formatted_address=poi.get("address"),
-                    name=poi.get("name")
-                )
+    await amap_geocode_limiter.acquire()
+    response = await client.get(url, params=params)
+    data = response.json()
+    
+    if data.get("status") == "1" and data.get("count") != "0":
+        pois = data.get("pois", [])
+        if pois:
+            poi = pois[0]
+            location = poi["location"].split(",")
+            print(f"📍 找到POI: {poi.get('name')} - {poi.get('address')}")
+            return GeocodeResponse(
+                lng=float(location[0]),
+                lat=float(location[1]),
+                formatted_address=poi.get("address"),
+                name=poi.get("name")
+            )
     
+    if data.get("status") == "0":
+        raise AmapServiceError(data.get("info", "未知错误"))
+
     return None
 
 
-async def geocode_by_address(amap_key: str, address: str) -> Optional[GeocodeResponse]:
+async def geocode_by_address(
+    client: httpx.AsyncClient, amap_key: str, address: str, city: Optional[str] = None
+) -> Optional[GeocodeResponse]:
     """
     传统地理编码
     适用于：详细地址
     """
-    url = "https://restapi.amap.com/v3/geocode/geo"
+    url = "/v3/geocode/geo"
     params = {
         "key": amap_key,
         "address": address
     }
+    if city:
+        params["city"] = city
     
     print(f"📡 地理编码: {address}")
     
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        response = await client.get(url, params=params)
-        data = response.json()
-        
-        print(f"🗺️ 地理编码响应: {data}")
-        
-        if data.get("status") == "1" and data.get("count") != "0":
-            geocodes = data.get("geocodes", [])
-            if geocodes:
-                location = geocodes[0]["location"].split(",")
-                return GeocodeResponse(
-                    lng=float(location[0]),
-                    lat=float(location[1]),
-                    formatted_address=geocodes[0].get("formatted_address")
-                )
-        
-        # 检查错误信息
-        if data.get("status") == "0":
-            error_msg = data.get("info", "未知错误")
-            print(f"❌ 地理编码失败: {error_msg}")
+    await amap_geocode_limiter.acquire()
+    response = await client.get(url, params=params)
+    data = response.json()
+    
+    print(f"🗺️ 地理编码响应: {data}")
     
+    if data.get("status") == "1" and data.get("count") != "0":
+        geocodes = data.get("geocodes", [])
+        if geocodes:
+            location = geocodes[0]["location"].split(",")
+            return GeocodeResponse(
+                lng=float(location[0]),
+                lat=float(location[1]),
+                formatted_address=geocodes[0].get("formatted_address")
+            )
+    
+    # 检查错误信息
+    if data.get("status") == "0":
+        error_msg = data.get("info", "未知错误")
+        print(f"❌ 地理编码失败: {error_msg}")
+        raise AmapServiceError(error_msg)
+
     return None
 
 
+async def fetch_driving_route(
+    client: httpx.AsyncClient,
+    amap_key: str,
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    strategy: int = 0,
+) -> RouteResponse:
+    """请求高德驾车路径规划，失败时抛出 AmapServiceError"""
+    url = "/v3/direction/driving"
+    params = {
+        "key": amap_key,
+        "origin": f"{origin[0]},{origin[1]}",
+        "destination": f"{destination[0]},{destination[1]}",
+        "extensions": "all",  # all=详细信息（包含完整polyline），base=基本信息
+        "strategy": strategy  # 0=最快捷, 1=最经济, 2=最短距离
+    }
+    
+    await amap_route_limiter.acquire()
+    # 路径规划响应较大，读取超时比地理编码长
+    response = await client.get(
+        url, params=params, timeout=httpx.Timeout(AMAP_ROUTE_READ_TIMEOUT, connect=AMAP_CONNECT_TIMEOUT)
+    )
+    data = response.json()
+    
+    print(f"📊 路径规划API响应状态: {data.get('status')}, info: {data.get('info')}")
+    
+    if data.get("status") == "1" and data.get("route"):
+        route = data["route"]
+        paths = route.get("paths", [])
+        
+        if paths:
+            path = paths[0]
+            steps = path.get("steps", [])
+            
+            print(f"📊 Path数据: distance={path.get('distance')}, duration={path.get('duration')}")
+            
+            # 如果path没有polyline，尝试从steps中组合
+            path_polyline = path.get("polyline", "")
+            if not path_polyline and steps:
+                # 将所有step的polyline连接起来
+                step_polylines = []
+                for step in steps:
+                    step_poly = step.get("polyline", "")
+                    if step_poly:
+                        step_polylines.append(step_poly)
+                path_polyline = ";".join(step_polylines)
+                print(f"✅ 从steps组合polyline，总长度: {len(path_polyline)}")
+            
+            return RouteResponse(
+                distance=float(path.get("distance", 0)),
+                duration=float(path.get("duration", 0)),
+                steps=[{
+                    "instruction": step.get("instruction", ""),
+                    "road": step.get("road", ""),
+                    "distance": step.get("distance", ""),
+                    "duration": step.get("duration", ""),
+                    "polyline": step.get("polyline", "")
+                } for step in steps],
+                polyline=path_polyline
+            )
+    
+    # API调用失败
+    error_msg = data.get("info", "未知错误")
+    print(f"❌ 路径规划失败: {error_msg}")
+    raise AmapServiceError(error_msg)
+
+
+async def cached_driving_route(
+    client: httpx.AsyncClient,
+    amap_key: str,
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    strategy: int = 0,
+) -> Tuple[RouteResponse, bool]:
+    """带缓存的驾车路径规划，返回 (路线, 是否来自缓存)"""
+    key = route_cache_key(origin, destination, strategy)
+    cached = route_cache.get(key)
+    if cached is not None:
+        return RouteResponse(**cached), True
+
+    route = await fetch_driving_route(client, amap_key, origin, destination, strategy)
+    route_cache.set(key, route.model_dump())
+    return route, False
+
+
 @router.post("/driving-route")
-async def get_driving_route(request: RouteRequest):
+async def get_driving_route(request: RouteRequest, client: httpx.AsyncClient = Depends(get_amap_client)):
     """
     驾车路径规划
-    使用高德地图Web服务API（backend api Key）
+    使用高德地图Web服务API（backend api Key），结果按起终点（约10米精度）缓存
     """
     amap_key = os.getenv("AMAP_WEB_KEY", "564f4fc5fbd68a60cf4b80191841d1ee")
     
     print(f"🚗 驾车路径规划: ({request.origin_lng}, {request.origin_lat}) → ({request.destination_lng}, {request.destination_lat})")
     
     try:
-        # 调用高德地图驾车路径规划API
-        url = "https://restapi.amap.com/v3/direction/driving"
-        params = {
-            "key": amap_key,
-            "origin": f"{request.origin_lng},{request.origin_lat}",
-            "destination": f"{request.destination_lng},{request.destination_lat}",
-            "extensions": "all",  # all=详细信息（包含完整polyline），base=基本信息
-            "strategy": 0  # 0=最快捷, 1=最经济, 2=最短距离
-        }
+        route, _ = await cached_driving_route(
+            client, amap_key,
+            (request.origin_lng, request.origin_lat),
+            (request.destination_lng, request.destination_lat),
+        )
+        return route
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
-            data = response.json()
-            
-            print(f"📊 路径规划API响应状态: {data.get('status')}, info: {data.get('info')}")
-            
-            if data.get("status") == "1" and data.get("route"):
-                route = data["route"]
-                paths = route.get("paths", [])
-                
-                if paths:
-                    path = paths[0]
-                    steps = path.get("steps", [])
-                    
-                    print(f"📊 Path数据: distance={path.get('distance')}, duration={path.get('duration')}")
-                    print(f"📊 Path keys: {list(path.keys())}")
-                    print(f"📊 Polyline in path: {path.get('polyline', 'NOT_FOUND')[:100] if path.get('polyline') else 'EMPTY'}")
-                    
-                    # 如果path没有polyline，尝试从steps中组合
-                    path_polyline = path.get("polyline", "")
-                    if not path_polyline and steps:
-                        # 将所有step的polyline连接起来
-                        step_polylines = []
-                        for step in steps:
-                            step_poly = step.get("polyline", "")
-                            if step_poly:
-                                step_polylines.append(step_poly)
-                        path_polyline = ";".join(step_polylines)
-                        print(f"✅ 从steps组合polyline，总长度: {len(path_polyline)}")
-                    
-                    return RouteResponse(
-                        distance=float(path.get("distance", 0)),
-                        duration=float(path.get("duration", 0)),
-                        steps=[{
-                            "instruction": step.get("instruction", ""),
-                            "road": step.get("road", ""),
-                            "distance": step.get("distance", ""),
-                            "duration": step.get("duration", ""),
-                            "polyline": step.get("polyline", "")
-                        } for step in steps],
-                        polyline=path_polyline
-                    )
-            
-            # API调用失败
-            error_msg = data.get("info", "未知错误")
-            print(f"❌ 路径规划失败: {error_msg}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"路径规划失败: {error_msg}"
-            )
-            
+    except AmapServiceError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"路径规划失败: {e}"
+        )
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="路径规划服务超时")
     except HTTPException:
@@ -225,3 +482,50 @@ async def get_driving_route(request: RouteRequest):
         print(f"❌ 路径规划错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"路径规划服务错误: {str(e)}")
 
+
+@router.post("/day-route")
+async def get_day_route(request: DayRouteRequest, client: httpx.AsyncClient = Depends(get_amap_client)):
+    """
+    一天的多段路线规划
+    - 按顺序连接各路点，相距不足10米的相邻路点合并
+    - 各路段并发请求（受并发上限和高德QPS限速约束），命中缓存的路段不请求高德
+    - 单个路段失败不影响其他路段，返回该路段的错误信息
+    """
+    amap_key = os.getenv("AMAP_WEB_KEY", "564f4fc5fbd68a60cf4b80191841d1ee")
+
+    if len(request.waypoints) > DAY_ROUTE_MAX_WAYPOINTS:
+        raise HTTPException(status_code=400, detail=f"单次最多规划 {DAY_ROUTE_MAX_WAYPOINTS} 个路点")
+
+    points = [(waypoint.lng, waypoint.lat) for waypoint in request.waypoints]
+    kept = drop_near_duplicates(points)
+    pairs = list(zip(kept, kept[1:]))
+    print(f"🚗 整日路线规划: {len(points)} 个路点，去重后 {len(kept)} 个，{len(pairs)} 段")
+
+    semaphore = asyncio.Semaphore(DAY_ROUTE_CONCURRENCY)
+
+    async def plan_leg(index: int, start: int, end: int) -> Dict[str, Any]:
+        leg = {"index": index, "from_index": start, "to_index": end,
+               "status": "ok", "route": None, "error": None, "cached": False}
+        try:
+            async with semaphore:
+                route, leg["cached"] = await cached_driving_route(
+                    client, amap_key, points[start], points[end], request.strategy
+                )
+            leg["route"] = route.model_dump()
+        except AmapServiceError as e:
+            leg.update(status="error", error=f"路径规划失败: {e}")
+        except httpx.TimeoutException:
+            leg.update(status="error", error="路径规划服务超时")
+        except Exception as e:
+            print(f"❌ 路段 {index + 1} 规划错误: {str(e)}")
+            leg.update(status="error", error=f"路径规划服务错误: {str(e)}")
+        return leg
+
+    legs = await asyncio.gather(*(plan_leg(i, start, end) for i, (start, end) in enumerate(pairs)))
+    routes = [leg["route"] for leg in legs if leg["route"]]
+    return {
+        "waypoints": kept,  # 保留的路点在请求中的下标
+        "legs": legs,
+        "distance": sum(route["distance"] for route in routes),
+        "duration": sum(route["duration"] for route in routes),
+    }
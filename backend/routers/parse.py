@@ -5,21 +5,13 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import json
-import os
-from openai import OpenAI
 
-router = APIRouter()
+import json_repair
+from json_repair import JSONRepairError
+from llm import get_llm_client, DEFAULT_MODEL
+from admission import admission_controller, AdmissionTimeout, Priority
 
-def get_dashscope_client():
-    """获取阿里云百炼API客户端"""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="DASHSCOPE_API_KEY未配置")
-    return OpenAI(
-        api_key=api_key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-    )
+router = APIRouter()
 
 class ParseRequest(BaseModel):
     text: str
@@ -38,7 +30,7 @@ async def parse_voice_text(request: ParseRequest):
     使用AI解析语音识别的文本，提取旅行信息
     """
     try:
-        client = get_dashscope_client()
+        client = get_llm_client()
         
         # 构建AI提示词
         prompt = f"""请从以下语音识别的文本中提取旅行规划信息，并以JSON格式返回。
@@ -74,42 +66,42 @@ async def parse_voice_text(request: ParseRequest):
   "start_date": "YYYY-MM-DD格式日期或null"
 }}"""
 
-        response = client.chat.completions.create(
-            model="qwen-plus",
-            messages=[
-                {"role": "system", "content": "你是一个专业的文本信息提取助手，擅长从自然语言中提取结构化信息。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,  # 降低温度以获得更稳定的输出
-        )
+        # 语音解析是交互式调用，排队时优先于行程生成和预算建议
+        async with admission_controller.slot(Priority.INTERACTIVE):
+            response = await client.chat.completions.create(
+                model=DEFAULT_MODEL,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的文本信息提取助手，擅长从自然语言中提取结构化信息。"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,  # 降低温度以获得更稳定的输出
+            )
         
         ai_response = response.choices[0].message.content.strip()
         print(f"AI解析响应: {ai_response}")
         
-        # 尝试提取JSON
-        json_start = ai_response.find('{')
-        json_end = ai_response.rfind('}') + 1
-        
-        if json_start != -1 and json_end > json_start:
-            json_str = ai_response[json_start:json_end]
-            parsed_data = json.loads(json_str)
-            
-            # 验证和清理数据
-            result = ParsedTravelInfo(
-                destination=parsed_data.get("destination"),
-                days=parsed_data.get("days"),
-                budget=parsed_data.get("budget"),
-                travelers=parsed_data.get("travelers"),
-                preferences=parsed_data.get("preferences"),
-                start_date=parsed_data.get("start_date")
-            )
-            
-            print(f"解析结果: {result}")
-            return result
-        else:
+        # 提取并修复JSON（容忍代码块标记、尾逗号等格式问题）
+        parsed_data = json_repair.loads(ai_response)
+        if not isinstance(parsed_data, dict):
             raise ValueError("AI未返回有效的JSON格式")
+        
+        # 验证和清理数据
+        result = ParsedTravelInfo(
+            destination=parsed_data.get("destination"),
+            days=parsed_data.get("days"),
+            budget=parsed_data.get("budget"),
+            travelers=parsed_data.get("travelers"),
+            preferences=parsed_data.get("preferences"),
+            start_date=parsed_data.get("start_date")
+        )
+        
+        print(f"解析结果: {result}")
+        return result
+    
+    except AdmissionTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
     
-    except json.JSONDecodeError as e:
+    except JSONRepairError as e:
         print(f"JSON解析错误: {str(e)}")
         print(f"AI响应内容: {ai_response}")
         raise HTTPException(status_code=500, detail=f"解析AI响应失败: {str(e)}")
@@ -2,17 +2,31 @@
 旅行规划路由
 使用阿里云百炼大语言模型生成旅行计划
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Body, Header, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import os
 import json
+import base64
 import asyncio
-from openai import OpenAI
+import uuid
 from datetime import datetime
 
-from database import get_db, Database
+from database import get_db
+from storage import Storage, PlanVersionConflict
+from json_patch import JsonPatchError, changed_path, format_pointer, validate_operations
+from llm import get_llm_client, DEFAULT_MODEL
+from admission import admission_controller, AdmissionTimeout, Priority
+from plan_cache import plan_cache, plan_cache_key
+from broadcast import EventBroadcast
+from jobs import Job, JobManager, QueueFullError
+from json_stream import IncrementalItineraryParser
+from telemetry import GenerationTimer, generation_telemetry
+from prompts import build_plan_messages, build_skeleton_messages, build_day_messages, prompt_cache_stats
+import json_repair
+from json_repair import JSONRepairError
+from serialization import FastJSONResponse, encode_sse
 
 router = APIRouter()
 
@@ -34,114 +48,425 @@ class TravelPlan(BaseModel):
     itinerary: Dict[str, Any]
     estimated_cost: float
 
-def get_dashscope_client():
-    """获取阿里云百炼客户端"""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
+# 长途旅行分天并发生成：天数阈值和最大并发数
+PLAN_FANOUT_MIN_DAYS = int(os.getenv("PLAN_FANOUT_MIN_DAYS", "7"))
+PLAN_FANOUT_MAX_CONCURRENCY = int(os.getenv("PLAN_FANOUT_MAX_CONCURRENCY", "4"))
+
+# 流式片段的中文名称
+SECTION_NAMES = {
+    "transportation": "交通方案",
+    "cost_breakdown": "费用预算",
+    "tips": "出行建议",
+}
+
+def parse_itinerary(ai_response: str, timer: Optional[GenerationTimer] = None) -> Dict[str, Any]:
+    """解析AI返回的行程JSON，必要时修复格式问题（修复过时标记 timer.degraded）"""
+    try:
+        itinerary, repaired = json_repair.loads_with_status(ai_response)
+    except JSONRepairError as e:
+        print(f"❌ JSON解析失败: {str(e)}")
+        print(f"AI响应（前500字符）: {ai_response[:500]}")
+        raise ValueError(f"无法解析AI响应为JSON: {str(e)}")
     
-    if not api_key:
-        raise HTTPException(status_code=500, detail="DASHSCOPE_API_KEY未配置")
+    if not isinstance(itinerary, dict):
+        raise ValueError("AI响应不是有效的行程对象")
+    if repaired and timer is not None:
+        timer.degraded = True
     
-    # 阿里云百炼使用OpenAI兼容接口
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+    return itinerary
+
+def record_usage(usage: Any, timer: Optional[GenerationTimer], content: str = ""):
+    """记录一次调用的token用量（输出token数、上下文缓存命中数）"""
+    cached = prompt_cache_stats.record(usage)
+    if timer is None:
+        return
+    timer.cached_tokens += cached or 0
+    if usage is not None and usage.completion_tokens:
+        timer.add_usage(usage.completion_tokens)
+    elif content:
+        timer.add_text(content)
+
+async def complete_json(
+    messages: List[Dict[str, str]], timer: Optional[GenerationTimer] = None, kind: str = ""
+) -> Any:
+    """调用AI（非流式）并解析返回的JSON；传入 timer 时累计输出token数，kind 为准入控制的调用类型"""
+    client = get_llm_client()
+    async with admission_controller.slot(Priority.PLAN, kind=kind):
+        response = await client.chat.completions.create(
+            model=DEFAULT_MODEL,
+            messages=messages,
+            temperature=0.7
+        )
+    choice = response.choices[0]
+    record_usage(getattr(response, "usage", None), timer, choice.message.content)
+    value, repaired = json_repair.loads_with_status(choice.message.content)
+    if timer is not None and (repaired or getattr(choice, "finish_reason", None) == "length"):
+        timer.degraded = True
+    return value
+
+def _cost(value: Any) -> float:
+    """把模型给出的费用转换为数字"""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _dict(value: Any) -> Dict[str, Any]:
+    """模型输出中应为对象的字段，类型不对时按空对象处理"""
+    return value if isinstance(value, dict) else {}
+
+def _dicts(value: Any) -> List[Dict[str, Any]]:
+    """模型输出中应为对象数组的字段，跳过不是对象的元素"""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+def compute_cost_breakdown(itinerary: Dict[str, Any], shopping: float = 0) -> Dict[str, float]:
+    """
+    根据每日行程和交通方案重新计算费用汇总（模型输出的字段类型不对时跳过，不中断生成）
+    购物没有逐项明细，使用行程骨架给出的购物预算
+    """
+    days = _dicts(itinerary.get("days"))
+    activities = sum(_cost(item.get("estimated_cost")) for day in days for item in _dicts(day.get("activities")))
+    food = sum(_cost(item.get("estimated_cost")) for day in days for item in _dicts(day.get("meals")))
+    accommodation = sum(_cost(_dict(day.get("accommodation")).get("estimated_cost")) for day in days)
+
+    transportation_plan = _dict(itinerary.get("transportation"))
+    transportation = (
+        _cost(_dict(transportation_plan.get("outbound")).get("cost"))
+        + _cost(_dict(transportation_plan.get("return")).get("cost"))
+        + _cost(_dict(transportation_plan.get("local")).get("estimated_daily_cost")) * len(days)
     )
+
+    breakdown = {
+        "transportation": transportation,
+        "accommodation": accommodation,
+        "food": food,
+        "activities": activities,
+        "shopping": shopping,
+    }
+    breakdown["total"] = sum(breakdown.values())
+    return breakdown
+
+async def stream_fanout_itinerary_events(request: TravelRequest):
+    """
+    长途旅行分三步生成：
+    1. 生成行程骨架（每天的区域、住宿、交通）
+    2. 按天并发生成详细行程（并发数受 PLAN_FANOUT_MAX_CONCURRENCY 限制）
+    3. 合并结果并在服务端重新计算费用
+    """
+    timer = GenerationTimer(request.days)
+    yield {'progress': 10, 'message': '连接AI服务...'}
+    yield {'progress': 20, 'message': f'正在规划{request.destination}{request.days}天行程框架...'}
+
+    skeleton = await complete_json(build_skeleton_messages(request), timer, kind="skeleton")
+    if not isinstance(skeleton, dict):
+        raise ValueError("AI未返回有效的行程框架")
+
+    outlines = [outline for outline in skeleton.get("days") or [] if isinstance(outline, dict)]
+    outlines = outlines[:request.days]
+    for day in range(len(outlines) + 1, request.days + 1):
+        outlines.append({"day": day})
+    for index, outline in enumerate(outlines):
+        outline["day"] = index + 1
+
+    yield {'progress': 30, 'message': f'行程框架已生成，正在并发规划{request.days}天的详细行程...'}
+    if skeleton.get("transportation"):
+        yield {'progress': 30, 'message': '交通方案已生成', 'partial': {'section': 'transportation', 'data': skeleton["transportation"]}}
+
+    semaphore = asyncio.Semaphore(max(PLAN_FANOUT_MAX_CONCURRENCY, 1))
+
+    async def generate_day(index: int, outline: Dict[str, Any]):
+        async with semaphore:
+            messages = build_day_messages(request, outline, skeleton)
+            for attempt in range(2):
+                try:
+                    day_plan = await complete_json(messages, timer, kind="day")
+                    if isinstance(day_plan, dict):
+                        break
+                except ValueError:
+                    if attempt == 1:
+                        raise
+            else:
+                raise ValueError(f"第{outline['day']}天行程生成失败")
+        day_plan["day"] = outline["day"]
+        day_plan.setdefault("date", f"第{outline['day']}天")
+        if not day_plan.get("accommodation") and skeleton.get("hotel"):
+            day_plan["accommodation"] = skeleton["hotel"]
+        return index, day_plan
+
+    tasks = [asyncio.create_task(generate_day(index, outline)) for index, outline in enumerate(outlines)]
+    days: List[Optional[Dict[str, Any]]] = [None] * len(outlines)
+    try:
+        for completed, future in enumerate(asyncio.as_completed(tasks), start=1):
+            index, day_plan = await future
+            days[index] = day_plan
+            progress = 30 + 50 * completed // len(tasks)
+            yield {
+                'progress': progress,
+                'message': f'第{index + 1}天行程已生成（{completed}/{len(tasks)}）',
+                'partial': {'section': 'day', 'index': index, 'data': day_plan}
+            }
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    yield {'progress': 85, 'message': '合并行程并计算费用...'}
+
+    itinerary = {
+        "days": days,
+        "transportation": skeleton.get("transportation") or {},
+        "tips": skeleton.get("tips") or [],
+    }
+    itinerary["cost_breakdown"] = compute_cost_breakdown(itinerary, shopping=_cost(skeleton.get("shopping_budget")))
+
+    metrics = timer.finish()
+    generation_telemetry.record(metrics)
+    yield {"itinerary": itinerary, "metrics": metrics, "cacheable": not timer.degraded}
+
+async def stream_itinerary_events(request: TravelRequest):
+    """
+    调用AI生成行程，逐步产出进度事件
+    最后一个事件包含 itinerary 字段，cacheable 表示输出完整且未经修复（可写入缓存）
+    长途旅行（天数达到 PLAN_FANOUT_MIN_DAYS）按天并发生成
+    """
+    if request.days >= PLAN_FANOUT_MIN_DAYS:
+        events = stream_fanout_itinerary_events(request)
+    else:
+        events = stream_single_itinerary_events(request)
+    async for event in events:
+        yield event
+
+async def stream_single_itinerary_events(request: TravelRequest):
+    """一次AI调用生成完整行程（流式）"""
+    timer = GenerationTimer(request.days)
+
+    # 进度 10%: 初始化客户端
+    yield {'progress': 10, 'message': '连接AI服务...'}
+    client = get_llm_client()
+
+    # 进度 20%: 生成提示词（固定内容在前，便于命中服务商的上下文缓存）
+    yield {'progress': 20, 'message': '准备旅行规划提示...'}
+    messages = build_plan_messages(request)
+
+    # 进度 30%: 调用AI
+    yield {'progress': 30, 'message': f'正在为您规划{request.destination}之旅...'}
+
+    # 使用流式响应（整个流式输出期间占用一个调用配额）
+    async with admission_controller.slot(Priority.PLAN, kind="plan") as slot:
+        response = await client.chat.completions.create(
+            model=DEFAULT_MODEL,
+            messages=messages,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        # 进度 40-80%: 按已输出token数与同天数行程的预计长度之比推进；
+        # 每完成一天或一个顶层字段就推送该片段
+        parser = IncrementalItineraryParser()
+        progress = 40
+        finish_reason = None
+        async for chunk in response:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                record_usage(usage, timer)
+            if chunk.choices and getattr(chunk.choices[0], "finish_reason", None):
+                finish_reason = chunk.choices[0].finish_reason
+            if chunk.choices and chunk.choices[0].delta.content:
+                slot.first_token()
+                content = chunk.choices[0].delta.content
+                timer.add_text(content)
+                token_progress = 40 + int(40 * timer.fraction())
+                if token_progress > progress:
+                    progress = token_progress
+                    yield {'progress': progress, 'message': 'AI正在生成详细计划...'}
+                for part in parser.feed(content):
+                    if part["section"] == "day":
+                        progress = max(progress, 40 + 40 * (part["index"] + 1) // max(request.days, 1))
+                        message = f'第{part["index"] + 1}天行程已生成'
+                    else:
+                        message = f'{SECTION_NAMES.get(part["section"], part["section"])}已生成'
+                    yield {'progress': min(progress, 80), 'message': message, 'partial': part}
+    ai_response = parser.buffer
+    if finish_reason == "length":
+        timer.degraded = True  # 达到最大输出长度被截断
+
+    # 进度 85%: 解析结果（单次线性修复常见的JSON格式问题）
+    yield {'progress': 85, 'message': '解析旅行计划...'}
     
-    return client
-
-def generate_travel_plan_prompt(request: TravelRequest) -> str:
-    """生成旅行规划提示词"""
-    # 获取当前日期和年份
-    current_date = datetime.now()
-    current_year = 2025
-    current_date_str = current_date.strftime("%Y年%m月%d日")
+    itinerary = parse_itinerary(ai_response, timer)
     
-    prompt = f"""
-请为以下旅行需求生成详细的旅行计划：
-
-【重要时间信息】
-当前日期：{current_date_str}
-当前年份：{current_year}年
-注意：当用户提到"今年"时，指的是{current_year}年；"明年"指的是{current_year + 1}年
-
-目的地：{request.destination}
-旅行天数：{request.days}天
-预算：{request.budget}元人民币
-同行人数：{request.travelers}人
-旅行偏好：{request.preferences}
-
-请生成一个JSON格式的旅行计划，包含以下信息：
-1. 每天的详细行程（包括景点、餐厅、住宿建议）
-2. 交通方式建议
-3. 每个项目的预估费用
-4. 总费用预算分析
-5. 特别注意事项和建议
-
-返回格式示例：
-{{
-    "days": [
-        {{
-            "day": 1,
-            "date": "第一天",
-            "activities": [
-                {{
-                    "time": "09:00",
-                    "type": "景点",
-                    "name": "景点名称",
-                    "description": "详细描述",
-                    "estimated_cost": 100,
-                    "location": {{"lat": 35.6762, "lng": 139.6503}},
-                    "duration": "2小时"
-                }}
-            ],
-            "meals": [
-                {{
-                    "time": "12:00",
-                    "type": "午餐",
-                    "restaurant": "餐厅名称",
-                    "cuisine": "菜系",
-                    "estimated_cost": 150
-                }}
-            ],
-            "accommodation": {{
-                "name": "酒店名称",
-                "type": "酒店类型",
-                "estimated_cost": 500
-            }}
-        }}
-    ],
-    "transportation": {{
-        "outbound": {{"method": "飞机", "cost": 2000}},
-        "local": {{"method": "地铁+出租车", "estimated_daily_cost": 100}},
-        "return": {{"method": "飞机", "cost": 2000}}
-    }},
-    "cost_breakdown": {{
-        "transportation": 5000,
-        "accommodation": 3000,
-        "food": 2000,
-        "activities": 1500,
-        "shopping": 500,
-        "total": 12000
-    }},
-    "tips": [
-        "建议1",
-        "建议2"
-    ]
-}}
-
-请确保返回的是有效的JSON格式，不要包含其他文字说明。
-
-【重要】JSON格式要求：
-- 使用标准JSON格式，所有字段名和字符串值都用双引号
-- 不要使用单引号
-- 不要添加注释
-- 确保所有括号正确闭合
-- 不要在数组或对象的最后一个元素后添加逗号
-- 直接输出JSON，不要有任何前缀或后缀说明
-
-只需要返回上述JSON结构，不需要任何其他解释。
-"""
-    return prompt
+    metrics = timer.finish()
+    generation_telemetry.record(metrics)
+    yield {"itinerary": itinerary, "metrics": metrics, "cacheable": not timer.degraded}
+
+# 进行中的行程生成（单飞）：缓存键 -> 事件广播通道
+# 相同需求的并发请求共享一次AI生成，各自订阅同一事件流
+inflight_generations: Dict[str, EventBroadcast] = {}
+generation_tasks = set()
+generation_stats = {"started": 0, "coalesced": 0}
+# 关闭服务时等待进行中的生成完成的最长时间（秒），超时后取消
+PLAN_GENERATION_DRAIN_TIMEOUT = float(os.getenv("PLAN_GENERATION_DRAIN_TIMEOUT", "5"))
+
+def join_plan_generation(request: TravelRequest) -> EventBroadcast:
+    """加入相同需求的进行中生成；没有则发起新的生成任务"""
+    key = plan_cache_key(request)
+    channel = inflight_generations.get(key)
+    if channel is not None:
+        generation_stats["coalesced"] += 1
+        return channel
+
+    channel = EventBroadcast()
+    inflight_generations[key] = channel
+    generation_stats["started"] += 1
+    task = asyncio.create_task(run_plan_generation(key, request, channel))
+    generation_tasks.add(task)
+    task.add_done_callback(generation_tasks.discard)
+    return channel
+
+async def run_plan_generation(key: str, request: TravelRequest, channel: EventBroadcast):
+    """执行一次AI生成并把事件广播给所有订阅者（不依赖任一订阅者的连接）"""
+    try:
+        async for event in stream_itinerary_events(request):
+            if event.get("cacheable"):
+                plan_cache.set(request, event["itinerary"])
+            channel.publish(event)
+    except Exception as e:
+        import traceback
+        print(f"行程生成错误: {traceback.format_exc()}")
+        channel.publish({"error": str(e)})
+    except asyncio.CancelledError:
+        channel.publish({"error": "服务正在关闭，生成已取消"})
+        raise
+    finally:
+        inflight_generations.pop(key, None)
+        channel.close()
+
+async def stop_plan_generations(timeout: float = PLAN_GENERATION_DRAIN_TIMEOUT):
+    """
+    关闭服务前处理进行中的生成任务：最多等待 timeout 秒让它们完成，剩余的取消
+    必须在关闭AI客户端和HTTP客户端之前调用，否则任务会在已关闭的客户端上失败
+    """
+    tasks = list(generation_tasks)
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+async def plan_events(request: TravelRequest, user_id: str, db: Storage):
+    """
+    生成并保存旅行计划的完整事件序列（SSE流和后台任务共用）
+    最后一个事件包含 result 字段
+    """
+    # 进度 0%: 开始
+    yield {'progress': 0, 'message': '开始生成旅行计划...'}
+    
+    # 命中缓存：跳过AI生成，直接返回相同需求的行程
+    itinerary = plan_cache.get(request)
+    cached = itinerary is not None
+    metrics = None
+    if cached:
+        yield {'progress': 80, 'message': '已找到相同需求的行程，快速生成中...', 'cached': True}
+    else:
+        # 相同需求正在生成时直接订阅，否则发起新的生成
+        channel = join_plan_generation(request)
+        async for event in channel.subscribe():
+            if "error" in event:
+                raise ValueError(event["error"])
+            if "itinerary" in event:
+                itinerary = event["itinerary"]
+                metrics = event.get("metrics")
+            else:
+                yield event
+        
+        if itinerary is None:
+            raise ValueError("行程生成意外中断")
+
+    # 进度 90%: 保存到数据库
+    yield {'progress': 90, 'message': '保存计划到数据库...'}
+    
+    plan_data = {
+        "destination": request.destination,
+        "days": request.days,
+        "budget": request.budget,
+        "travelers": request.travelers,
+        "preferences": request.preferences,
+        "start_date": request.start_date,
+        "itinerary": itinerary
+    }
+    
+    saved_plan = await db.create_travel_plan(user_id, plan_data)
+    
+    # 进度 100%: 完成
+    result = TravelPlan(
+        id=saved_plan.get("id"),
+        destination=request.destination,
+        days=request.days,
+        budget=request.budget,
+        travelers=request.travelers,
+        preferences=request.preferences,
+        itinerary=itinerary,
+        estimated_cost=itinerary.get("cost_breakdown", {}).get("total", 0)
+    )
+    
+    # 生成耗时指标（首token延迟、输出速度、总耗时），命中缓存时为 null
+    yield {'progress': 100, 'message': '完成！', 'cached': cached, 'metrics': metrics, 'result': result.model_dump()}
+
+# 后台生成任务：与HTTP连接解耦，刷新页面或代理超时不会浪费已发起的生成
+PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "4"))
+PLAN_JOB_QUEUE_SIZE = int(os.getenv("PLAN_JOB_QUEUE_SIZE", "50"))
+PLAN_JOB_RETENTION = float(os.getenv("PLAN_JOB_RETENTION", "3600"))
+
+async def run_plan_job(job: Job) -> Dict[str, Any]:
+    """执行后台生成任务，完成后计划已保存到数据库"""
+    result = None
+    async for event in plan_events(job.payload, job.user_id, get_db()):
+        job.publish(event)
+        if "result" in event:
+            result = event["result"]
+    return result
+
+plan_jobs = JobManager(
+    run_plan_job,
+    workers=PLAN_JOB_WORKERS,
+    max_queue=PLAN_JOB_QUEUE_SIZE,
+    retention=PLAN_JOB_RETENTION,
+)
+
+def submit_plan_job(request: TravelRequest, user_id: str) -> Job:
+    """提交后台生成任务，队列已满时返回429"""
+    try:
+        return plan_jobs.submit(user_id, request)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def get_user_job(job_id: str, user_id: str) -> Job:
+    """获取属于该用户的任务"""
+    job = plan_jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+def event_stream_response(events) -> StreamingResponse:
+    """把事件序列包装为SSE响应"""
+    async def generate():
+        async for event in events:
+            yield encode_sse(event)
+    
+    return StreamingResponse(
+        generate(), 
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Connection": "keep-alive",
+        }
+    )
 
 @router.get("/plan-stream")
 async def create_travel_plan_stream(
@@ -152,9 +477,13 @@ async def create_travel_plan_stream(
     travelers: int,
     preferences: str,
     start_date: str = None,
-    db: Database = Depends(get_db)
+    background: bool = False,
+    db: Storage = Depends(get_db)
 ):
-    """生成AI旅行计划（流式返回，带进度）"""
+    """
+    生成AI旅行计划（流式返回，带进度）
+    background=true 时生成在后台任务中进行，断开后可通过 /jobs/{job_id}/events 重新订阅
+    """
     # 构建请求对象
     request = TravelRequest(
         destination=destination,
@@ -164,251 +493,96 @@ async def create_travel_plan_stream(
         preferences=preferences,
         start_date=start_date
     )
-    async def generate():
+    
+    if background:
+        job = submit_plan_job(request, user_id)
+        return event_stream_response(job.channel.subscribe())
+    
+    async def guarded_events():
         try:
-            # 进度 0%: 开始
-            yield f"data: {json.dumps({'progress': 0, 'message': '开始生成旅行计划...'})}\n\n"
-            await asyncio.sleep(0.5)
-            
-            # 进度 10%: 初始化客户端
-            yield f"data: {json.dumps({'progress': 10, 'message': '连接AI服务...'})}\n\n"
-            client = get_dashscope_client()
-            await asyncio.sleep(0.3)
-            
-            # 进度 20%: 生成提示词
-            yield f"data: {json.dumps({'progress': 20, 'message': '准备旅行规划提示...'})}\n\n"
-            prompt = generate_travel_plan_prompt(request)
-            await asyncio.sleep(0.3)
-            
-            # 进度 30%: 调用AI
-            yield f"data: {json.dumps({'progress': 30, 'message': f'正在为您规划{request.destination}之旅...'})}\n\n"
-            
-            # 获取当前年份
-            current_year = datetime.now().year
-            
-            # 使用流式响应
-            response = client.chat.completions.create(
-                model="qwen-plus",
-                messages=[
-                    {"role": "system", "content": f"""你是一个专业的旅行规划师，擅长为用户制定详细的旅行计划。
-
-重要时间信息：
-- 当前年份是{current_year}年
-- 当用户说"今年"，指的是{current_year}年
-- 当用户说"明年"，指的是{current_year + 1}年
-- 请根据实际的{current_year}年日历来安排行程日期
-
-重要规则：
-1. 必须严格按照JSON格式返回，不要添加任何额外的文字说明
-2. 所有字段名必须使用双引号
-3. 不要在JSON中使用单引号
-4. 不要在JSON中添加注释
-5. 确保所有括号正确闭合
-6. 不要在最后一个元素后添加逗号
-7. 所有字符串值都要用双引号包裹
-8. 确保JSON格式完整有效"""},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                stream=True
-            )
-            
-            # 进度 40-80%: AI生成中
-            ai_response = ""
-            progress = 40
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    ai_response += chunk.choices[0].delta.content
-                    progress = min(80, progress + 1)
-                    if len(ai_response) % 50 == 0:  # 每50个字符更新一次进度
-                        yield f"data: {json.dumps({'progress': progress, 'message': 'AI正在生成详细计划...'})}\n\n"
-            
-            # 进度 85%: 解析结果
-            yield f"data: {json.dumps({'progress': 85, 'message': '解析旅行计划...'})}\n\n"
-            
-            # 尝试提取和修复JSON
-            json_start = ai_response.find('{')
-            json_end = ai_response.rfind('}') + 1
-            
-            if json_start != -1 and json_end > json_start:
-                json_str = ai_response[json_start:json_end]
-                
-                # 尝试多种方法解析JSON
-                itinerary = None
-                parse_errors = []
-                
-                # 方法1: 直接解析
-                try:
-                    itinerary = json.loads(json_str)
-                    print("✅ JSON解析成功（方法1：直接解析）")
-                except json.JSONDecodeError as e:
-                    parse_errors.append(f"方法1失败: {str(e)}")
-                    
-                    # 方法2: 修复常见JSON错误
-                    try:
-                        # 修复尾部逗号问题
-                        fixed_json = json_str.replace(',]', ']').replace(',}', '}')
-                        # 修复单引号问题
-                        fixed_json = fixed_json.replace("'", '"')
-                        # 移除注释
-                        import re
-                        fixed_json = re.sub(r'//.*?$', '', fixed_json, flags=re.MULTILINE)
-                        fixed_json = re.sub(r'/\*.*?\*/', '', fixed_json, flags=re.DOTALL)
-                        
-                        itinerary = json.loads(fixed_json)
-                        print("✅ JSON解析成功（方法2：修复后解析）")
-                    except json.JSONDecodeError as e2:
-                        parse_errors.append(f"方法2失败: {str(e2)}")
-                        
-                        # 方法3: 使用正则表达式提取关键信息
-                        try:
-                            print("⚠️ JSON格式错误，尝试提取关键信息...")
-                            print(f"错误的JSON（前500字符）: {json_str[:500]}")
-                            print(f"错误的JSON（后500字符）: {json_str[-500:]}")
-                            
-                            # 创建一个基本的行程结构
-                            itinerary = {
-                                "daily_plans": [],
-                                "estimated_cost": request.budget,
-                                "tips": ["由于AI生成格式异常，建议重新生成计划以获得完整信息。"]
-                            }
-                            
-                            # 尝试提取每日计划的文本信息
-                            import re
-                            days_pattern = r'"day["\s]*:\s*(\d+)'
-                            days_found = re.findall(days_pattern, json_str, re.IGNORECASE)
-                            
-                            for day_num in days_found[:request.days]:
-                                itinerary["daily_plans"].append({
-                                    "day": int(day_num),
-                                    "activities": [{
-                                        "time": "全天",
-                                        "name": f"第{day_num}天行程",
-                                        "description": "由于格式解析问题，请重新生成计划",
-                                        "location": request.destination,
-                                        "estimated_cost": request.budget / request.days
-                                    }]
-                                })
-                            
-                            # 如果没有找到任何天数，创建基本结构
-                            if not itinerary["daily_plans"]:
-                                for day in range(1, request.days + 1):
-                                    itinerary["daily_plans"].append({
-                                        "day": day,
-                                        "activities": [{
-                                            "time": "全天",
-                                            "name": f"第{day}天行程",
-                                            "description": "计划生成中遇到格式问题，建议重新生成",
-                                            "location": request.destination,
-                                            "estimated_cost": request.budget / request.days
-                                        }]
-                                    })
-                            
-                            print("⚠️ 使用降级方案创建基本行程结构")
-                            
-                        except Exception as e3:
-                            parse_errors.append(f"方法3失败: {str(e3)}")
-                            print(f"❌ 所有JSON解析方法都失败")
-                            print(f"解析错误汇总: {parse_errors}")
-                            raise ValueError(f"无法解析AI响应为JSON。错误: {'; '.join(parse_errors)}")
-                
-                if itinerary is None:
-                    raise ValueError(f"无法解析AI响应为JSON。错误: {'; '.join(parse_errors)}")
-                    
-            else:
-                raise ValueError("无法从AI响应中提取JSON")
-            
-            # 进度 90%: 保存到数据库
-            yield f"data: {json.dumps({'progress': 90, 'message': '保存计划到数据库...'})}\n\n"
-            
-            plan_data = {
-                "destination": request.destination,
-                "days": request.days,
-                "budget": request.budget,
-                "travelers": request.travelers,
-                "preferences": request.preferences,
-                "start_date": request.start_date,
-                "itinerary": itinerary
-            }
-            
-            saved_plan = await db.create_travel_plan(user_id, plan_data)
-            
-            # 进度 100%: 完成
-            result = TravelPlan(
-                id=saved_plan.get("id"),
-                destination=request.destination,
-                days=request.days,
-                budget=request.budget,
-                travelers=request.travelers,
-                preferences=request.preferences,
-                itinerary=itinerary,
-                estimated_cost=itinerary.get("cost_breakdown", {}).get("total", 0)
-            )
-            
-            yield f"data: {json.dumps({'progress': 100, 'message': '完成！', 'result': result.model_dump()})}\n\n"
-        
+            async for event in plan_events(request, user_id, db):
+                yield event
         except Exception as e:
             import traceback
             print(f"流式生成错误: {traceback.format_exc()}")
-            yield f"data: {json.dumps({'error': str(e), 'message': f'生成失败: {str(e)}'})}\n\n"
+            yield {'error': str(e), 'message': f'生成失败: {str(e)}'}
     
-    return StreamingResponse(
-        generate(), 
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        }
-    )
+    return event_stream_response(guarded_events())
+
+@router.get("/jobs/{job_id}")
+async def get_plan_job(job_id: str, user_id: str):
+    """查询后台生成任务的状态和结果"""
+    return get_user_job(job_id, user_id).to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def subscribe_plan_job(job_id: str, user_id: str):
+    """订阅后台生成任务的事件（先重放已有进度，再推送后续事件）"""
+    job = get_user_job(job_id, user_id)
+    return event_stream_response(job.channel.subscribe())
 
 @router.post("/plan", response_model=TravelPlan)
 async def create_travel_plan(
     request: TravelRequest,
     user_id: str,
-    db: Database = Depends(get_db)
+    background: bool = False,
+    db: Storage = Depends(get_db)
 ):
-    """生成AI旅行计划（普通版本，无进度显示）"""
+    """
+    生成AI旅行计划（普通版本，无进度显示）
+    background=true 时立即返回任务ID（202），通过 /jobs/{job_id} 查询结果
+    """
+    if background:
+        job = submit_plan_job(request, user_id)
+        return FastJSONResponse(
+            status_code=202,
+            content={
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/api/travel/jobs/{job.id}?user_id={user_id}",
+                "events_url": f"/api/travel/jobs/{job.id}/events?user_id={user_id}",
+            }
+        )
+    
     try:
-        # 调用阿里云百炼生成旅行计划
-        client = get_dashscope_client()
+        # 命中缓存时直接复用相同需求的行程
+        itinerary = plan_cache.get(request)
+        if itinerary is None and request.days >= PLAN_FANOUT_MIN_DAYS:
+            # 长途旅行按天并发生成
+            async for event in stream_fanout_itinerary_events(request):
+                if "itinerary" in event:
+                    itinerary = event["itinerary"]
+                    if event.get("cacheable"):
+                        plan_cache.set(request, itinerary)
+        elif itinerary is None:
+            # 调用阿里云百炼生成旅行计划
+            client = get_llm_client()
         
-        prompt = generate_travel_plan_prompt(request)
+            timer = GenerationTimer(request.days)
         
-        # 获取当前年份
-        current_year = datetime.now().year
+            async with admission_controller.slot(Priority.PLAN, kind="plan"):
+                response = await client.chat.completions.create(
+                    model=DEFAULT_MODEL,  # 或使用其他模型如 qwen-turbo, qwen-max
+                    messages=build_plan_messages(request),
+                    temperature=0.7
+                )
         
-        response = client.chat.completions.create(
-            model="qwen-plus",  # 或使用其他模型如 qwen-turbo, qwen-max
-            messages=[
-                {"role": "system", "content": f"""你是一个专业的旅行规划师，擅长为用户制定详细的旅行计划。
-
-重要时间信息：
-- 当前年份是{current_year}年
-- 当用户说"今年"，指的是{current_year}年
-- 当用户说"明年"，指的是{current_year + 1}年
-- 请根据实际的{current_year}年日历来安排行程日期"""},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
-        
-        # 解析AI返回的JSON
-        ai_response = response.choices[0].message.content
+            # 解析AI返回的JSON
+            ai_response = response.choices[0].message.content
+            record_usage(response.usage, timer, ai_response)
         
-        # 打印AI响应以便调试
-        print(f"AI响应长度: {len(ai_response)}")
-        print(f"AI响应前500字符: {ai_response[:500]}")
+            # 打印AI响应以便调试
+            print(f"AI响应长度: {len(ai_response)}")
+            print(f"AI响应前500字符: {ai_response[:500]}")
         
-        # 尝试提取JSON（AI可能在JSON前后加了说明文字）
-        json_start = ai_response.find('{')
-        json_end = ai_response.rfind('}') + 1
-        
-        if json_start != -1 and json_end > json_start:
-            json_str = ai_response[json_start:json_end]
-            itinerary = json.loads(json_str)
-        else:
-            raise ValueError("无法从AI响应中提取JSON")
+            # 提取并修复JSON（AI可能在JSON前后加了说明文字）
+            itinerary = parse_itinerary(ai_response, timer)
+            if getattr(response.choices[0], "finish_reason", None) == "length":
+                timer.degraded = True
+            generation_telemetry.record(timer.finish())
+            
+            # 只缓存完整且无需修复的行程
+            if not timer.degraded:
+                plan_cache.set(request, itinerary)
         
         # 保存到数据库
         plan_data = {
@@ -434,50 +608,199 @@ async def create_travel_plan(
             estimated_cost=itinerary.get("cost_breakdown", {}).get("total", 0)
         )
     
+    except AdmissionTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         # 打印详细错误信息
         import traceback
         print(f"错误详情: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"生成旅行计划失败: {str(e)}")
 
+# 计划列表分页
+PLAN_PAGE_SIZE = int(os.getenv("PLAN_PAGE_SIZE", "20"))
+PLAN_PAGE_SIZE_MAX = 100
+
+def encode_plan_cursor(plan: Dict[str, Any]) -> str:
+    """用一页最后一条计划的 (created_at, id) 生成翻页游标"""
+    raw = json.dumps([plan["created_at"], plan["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_plan_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    解析翻页游标，格式错误时返回400
+    游标由客户端传回，会拼进 PostgREST 的过滤表达式：两个字段都按类型解析后重新序列化，不透传原始字符串
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, plan_id = json.loads(raw)
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(plan_id))
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
 @router.get("/plans")
 async def get_travel_plans(
     user_id: str,
-    db: Database = Depends(get_db)
+    limit: int = PLAN_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: Storage = Depends(get_db)
 ):
-    """获取用户的所有旅行计划"""
+    """
+    获取用户的旅行计划列表（摘要，不含 itinerary）
+    按创建时间倒序分页：next_cursor 不为空时，用它作为 cursor 获取下一页
+    完整行程通过 /plans/{plan_id} 获取
+    """
+    limit = max(1, min(limit, PLAN_PAGE_SIZE_MAX))
+    after = decode_plan_cursor(cursor) if cursor else None
     try:
-        plans = await db.get_user_travel_plans(user_id)
-        return {"plans": plans}
+        # 多取一条用于判断是否还有下一页
+        plans = await db.get_user_travel_plan_summaries(user_id, limit=limit + 1, after=after)
+        next_cursor = encode_plan_cursor(plans[limit - 1]) if len(plans) > limit else None
+        return {"plans": plans[:limit], "next_cursor": next_cursor}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取旅行计划失败: {str(e)}")
 
+# 计划 ETag 的缓存时间（秒），过期后客户端携带 If-None-Match 重新验证，未修改时返回 304
+PLAN_ETAG_MAX_AGE = int(os.getenv("PLAN_ETAG_MAX_AGE", "0"))
+
+def plan_etag(version: Any) -> str:
+    """计划版本对应的 ETag"""
+    return f'"{version or 1}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """解析 If-Match 请求头为期望的版本号，未提供或为 * 时不检查版本"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise HTTPException(status_code=400, detail="无效的 If-Match 请求头")
+    return int(value)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否匹配当前 ETag（弱比较）"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+def plan_response(content: Any, version: Any, if_none_match: Optional[str]) -> Response:
+    """带 ETag 的计划响应，If-None-Match 匹配时返回 304（不含响应体）"""
+    etag = plan_etag(version)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={PLAN_ETAG_MAX_AGE}, must-revalidate"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(content=content, headers=headers)
+
+def nest_plan_fields(selected: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """把 {"itinerary.cost_breakdown": ...} 还原为嵌套结构"""
+    result: Dict[str, Any] = {}
+    for field in fields:
+        *parents, leaf = field.split(".")
+        node = result
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = selected.get(field)
+    return result
+
 @router.get("/plans/{plan_id}")
 async def get_travel_plan(
     plan_id: str,
     user_id: str,
-    db: Database = Depends(get_db)
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Storage = Depends(get_db)
 ):
-    """获取特定旅行计划"""
+    """
+    获取特定旅行计划（ETag 为计划版本，修改时作为 If-Match 发送）
+    fields 为逗号分隔的投影字段，只返回这些字段，例如 fields=destination,itinerary.cost_breakdown
+    """
     try:
+        if fields:
+            requested = [field.strip() for field in fields.split(",") if field.strip()]
+            try:
+                selected = await db.get_travel_plan_fields(plan_id, user_id, requested)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if selected is None:
+                raise HTTPException(status_code=404, detail="旅行计划不存在")
+            return plan_response(nest_plan_fields(selected, requested), selected["version"], if_none_match)
+
         plan = await db.get_travel_plan(plan_id, user_id)
         
         if not plan:
             raise HTTPException(status_code=404, detail="旅行计划不存在")
         
-        return plan
+        return plan_response(plan, plan.get("version"), if_none_match)
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取旅行计划失败: {str(e)}")
 
+@router.get("/plans/{plan_id}/days/{day}")
+async def get_travel_plan_day(
+    plan_id: str,
+    day: int,
+    user_id: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Storage = Depends(get_db)
+):
+    """获取计划中第 day 天（从1开始）的行程，只从数据库读取这一天的数据"""
+    if day < 1:
+        raise HTTPException(status_code=404, detail="该天的行程不存在")
+    field = f"itinerary.days.{day - 1}"
+    try:
+        selected = await db.get_travel_plan_fields(plan_id, user_id, [field])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取行程失败: {str(e)}")
+
+    if selected is None:
+        raise HTTPException(status_code=404, detail="旅行计划不存在")
+    if selected[field] is None:
+        raise HTTPException(status_code=404, detail="该天的行程不存在")
+    return plan_response(selected[field], selected["version"], if_none_match)
+
+@router.patch("/plans/{plan_id}")
+async def patch_travel_plan(
+    plan_id: str,
+    user_id: str,
+    response: Response,
+    operations: List[Dict[str, Any]] = Body(...),
+    if_match: Optional[str] = Header(None),
+    db: Storage = Depends(get_db)
+):
+    """
+    用 JSON Patch（RFC 6902）局部修改行程，路径相对于 itinerary，例如：
+    [{"op": "replace", "path": "/days/0/activities/1/time", "value": "10:00"}]
+    If-Match 携带 GET 返回的 ETag 时进行乐观并发检查，版本不一致返回 412。
+    只返回被修改的最小子树：{"path": 子树路径, "value": 修改后的子树, "version": 新版本}
+    """
+    expected_version = parse_if_match(if_match)
+    try:
+        validate_operations(operations)
+        return_path = changed_path(operations)
+        result = await db.patch_travel_plan(plan_id, user_id, operations, expected_version, return_path)
+    except JsonPatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except PlanVersionConflict as e:
+        raise HTTPException(status_code=412, detail=str(e), headers={"ETag": plan_etag(e.current_version)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"修改旅行计划失败: {str(e)}")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="旅行计划不存在")
+
+    response.headers["ETag"] = plan_etag(result["version"])
+    return {"path": format_pointer(return_path), "value": result["value"], "version": result["version"]}
+
 @router.delete("/plans/{plan_id}")
 async def delete_travel_plan(
     plan_id: str,
     user_id: str,
-    db: Database = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """删除旅行计划"""
     try:
@@ -0,0 +1,49 @@
+"""
+基于 orjson 的 JSON 序列化
+行程是较大的嵌套字典，orjson 的编码速度约为标准库 json 的数倍，
+并且直接输出 UTF-8（中文不再转义为 \\uXXXX），传输字节更少。
+- FastJSONResponse：所有路由的默认响应类（main.py 中设置）
+- encode_sse：把事件编码为一条 SSE 消息
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """orjson 不能直接编码的类型"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """编码为 UTF-8 JSON 字节串"""
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+def loads(data: Any) -> Any:
+    return orjson.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 编码的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def encode_sse(event: Any) -> bytes:
+    """编码一条 SSE 消息：data: {json}\\n\\n"""
+    return b"data: " + dumps(event) + b"\n\n"
@@ -0,0 +1,337 @@
+"""
+嵌入式 SQLite 存储实现
+表结构和索引与 database_setup.sql 一致，不需要 Supabase 项目即可运行整个 API：
+- itinerary 以JSON文本保存，estimated_cost 是用 JSON1 从 cost_breakdown.total 计算的生成列
+- plan_budget_totals 由触发器随费用增删改增量维护
+- 每次修改计划 version 加一，用于乐观并发控制
+- 查询在线程池中执行，不阻塞事件循环
+用于本地压测、性能分析和快速的 CI 测试（STORAGE_BACKEND=sqlite）。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from storage import (
+    EXPENSE_COLUMNS, PLAN_COLUMNS, PLAN_SUMMARY_COLUMNS, Storage, parse_plan_field, patch_plan_itinerary,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS travel_plans (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    days INTEGER NOT NULL,
+    budget REAL,
+    travelers INTEGER,
+    preferences TEXT,
+    itinerary TEXT CHECK (itinerary IS NULL OR json_valid(itinerary)),
+    estimated_cost REAL GENERATED ALWAYS AS (
+        CASE WHEN json_type(itinerary, '$.cost_breakdown.total') IN ('integer', 'real')
+             THEN json_extract(itinerary, '$.cost_breakdown.total') END
+    ) STORED,
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_travel_plans_user_id ON travel_plans(user_id);
+CREATE INDEX IF NOT EXISTS idx_travel_plans_created_at ON travel_plans(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_travel_plans_user_created_id ON travel_plans(user_id, created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    plan_id TEXT NOT NULL REFERENCES travel_plans(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT,
+    date TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses(user_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_plan_id ON expenses(plan_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date DESC);
+
+CREATE TABLE IF NOT EXISTS plan_budget_totals (
+    plan_id TEXT NOT NULL REFERENCES travel_plans(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    expense_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (plan_id, category)
+);
+
+CREATE INDEX IF NOT EXISTS idx_plan_budget_totals_user_id ON plan_budget_totals(user_id);
+
+CREATE TRIGGER IF NOT EXISTS expenses_budget_totals_insert AFTER INSERT ON expenses
+BEGIN
+    INSERT INTO plan_budget_totals (plan_id, user_id, category, total, expense_count)
+    VALUES (NEW.plan_id, NEW.user_id, NEW.category, NEW.amount, 1)
+    ON CONFLICT (plan_id, category) DO UPDATE
+        SET total = total + excluded.total, expense_count = expense_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_budget_totals_delete AFTER DELETE ON expenses
+BEGIN
+    UPDATE plan_budget_totals SET total = total - OLD.amount, expense_count = expense_count - 1
+        WHERE plan_id = OLD.plan_id AND category = OLD.category;
+    DELETE FROM plan_budget_totals
+        WHERE plan_id = OLD.plan_id AND category = OLD.category AND expense_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_budget_totals_update AFTER UPDATE OF plan_id, category, amount ON expenses
+BEGIN
+    UPDATE plan_budget_totals SET total = total - OLD.amount, expense_count = expense_count - 1
+        WHERE plan_id = OLD.plan_id AND category = OLD.category;
+    DELETE FROM plan_budget_totals
+        WHERE plan_id = OLD.plan_id AND category = OLD.category AND expense_count <= 0;
+    INSERT INTO plan_budget_totals (plan_id, user_id, category, total, expense_count)
+    VALUES (NEW.plan_id, NEW.user_id, NEW.category, NEW.amount, 1)
+    ON CONFLICT (plan_id, category) DO UPDATE
+        SET total = total + excluded.total, expense_count = expense_count + 1;
+END;
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _plan_row(row: sqlite3.Row) -> Dict[str, Any]:
+    plan = dict(row)
+    if plan.get("itinerary") is not None:
+        plan["itinerary"] = json.loads(plan["itinerary"])
+    return plan
+
+
+def _json_path(path: List[str]) -> str:
+    """路径片段转为 SQLite JSON 路径，如 ['days', '0'] -> $."days"[0]"""
+    return "$" + "".join(f"[{segment}]" if segment.isdigit() else f'."{segment}"' for segment in path)
+
+
+def _json_column(value: Any) -> Any:
+    return None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+
+
+class SQLiteDatabase(Storage):
+    """嵌入式 SQLite 存储"""
+
+    local = True
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在线程池中以单个事务执行"""
+        def call():
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    result = fn(self._conn)
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+                return result
+        return await asyncio.to_thread(call)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _insert_plan(conn: sqlite3.Connection, plan: Dict[str, Any], ignore_existing: bool = False) -> Optional[Dict[str, Any]]:
+        values = {column: plan.get(column) for column in PLAN_COLUMNS}
+        values["itinerary"] = _json_column(values["itinerary"])
+        created_at = plan.get("created_at") or _now()
+        values.update(
+            id=plan.get("id") or str(uuid.uuid4()), user_id=plan["user_id"], version=plan.get("version") or 1,
+            created_at=created_at, updated_at=created_at,
+        )
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{column}" for column in values)
+        verb = "INSERT OR IGNORE" if ignore_existing else "INSERT"
+        row = conn.execute(f"{verb} INTO travel_plans ({columns}) VALUES ({placeholders}) RETURNING *", values).fetchone()
+        return _plan_row(row) if row else None
+
+    async def create_travel_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """创建旅行计划"""
+        plan = {**{column: plan_data.get(column) for column in PLAN_COLUMNS}, "user_id": user_id}
+        return await self._run(lambda conn: self._insert_plan(conn, plan))
+
+    async def create_travel_plans(self, plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量写入已带 id 和 created_at 的计划（发件箱使用），已存在的 id 忽略"""
+        def insert(conn):
+            rows = (self._insert_plan(conn, plan, ignore_existing=True) for plan in plans)
+            return [row for row in rows if row is not None]
+        return await self._run(insert)
+
+    async def get_user_travel_plans(self, user_id: str) -> List[Dict[str, Any]]:
+        """获取用户的所有旅行计划"""
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT * FROM travel_plans WHERE user_id = ? ORDER BY created_at DESC", (user_id,)
+        ).fetchall())
+        return [_plan_row(row) for row in rows]
+
+    async def get_user_travel_plan_summaries(
+        self,
+        user_id: str,
+        limit: int = 20,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """按创建时间倒序分页获取计划摘要（键集分页，使用 idx_travel_plans_user_created_id）"""
+        sql = f"SELECT {PLAN_SUMMARY_COLUMNS} FROM travel_plans WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if after is not None:
+            sql += " AND (created_at, id) < (?, ?)"
+            params.extend(after)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        rows = await self._run(lambda conn: conn.execute(sql, params).fetchall())
+        return [dict(row) for row in rows]
+
+    async def get_travel_plan(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """获取特定旅行计划"""
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT * FROM travel_plans WHERE id = ? AND user_id = ?", (plan_id, user_id)
+        ).fetchone())
+        return _plan_row(row) if row else None
+
+    async def get_travel_plan_fields(self, plan_id: str, user_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """只读取计划的部分字段，itinerary 子路径用 JSON1 的 json_extract 在库内选择"""
+        select = ["version"]
+        params: List[Any] = []
+        for field in fields:
+            column, path = parse_plan_field(field)
+            if column == "itinerary":
+                select.append("json_quote(json_extract(itinerary, ?))")
+                params.append(_json_path(path))
+            else:
+                select.append(column)
+        params.extend([plan_id, user_id])
+        row = await self._run(lambda conn: conn.execute(
+            f"SELECT {', '.join(select)} FROM travel_plans WHERE id = ? AND user_id = ?", params
+        ).fetchone())
+        if row is None:
+            return None
+        selected = {"version": row[0]}
+        for index, field in enumerate(fields, start=1):
+            value = row[index]
+            selected[field] = json.loads(value) if field.split(".")[0] == "itinerary" and value is not None else value
+        return selected
+
+    async def update_travel_plan(self, plan_id: str, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """更新旅行计划（只更新可写列）"""
+        values = {column: plan_data[column] for column in PLAN_COLUMNS if column in plan_data}
+        if "itinerary" in values:
+            values["itinerary"] = _json_column(values["itinerary"])
+        values["updated_at"] = _now()
+        assignments = ", ".join(f"{column} = :{column}" for column in values) + ", version = version + 1"
+        values.update(plan_id=plan_id, user_id=user_id)
+        row = await self._run(lambda conn: conn.execute(
+            f"UPDATE travel_plans SET {assignments} WHERE id = :plan_id AND user_id = :user_id RETURNING *", values
+        ).fetchone())
+        return _plan_row(row) if row else None
+
+    async def patch_travel_plan(
+        self,
+        plan_id: str,
+        user_id: str,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+        return_path: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """在同一事务中读取、应用 JSON Patch 并写回 itinerary"""
+        def patch(conn):
+            row = conn.execute(
+                "SELECT itinerary, version FROM travel_plans WHERE id = ? AND user_id = ?", (plan_id, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+            itinerary, result = patch_plan_itinerary(_plan_row(row), operations, expected_version, return_path or [])
+            conn.execute(
+                "UPDATE travel_plans SET itinerary = ?, version = ?, updated_at = ? WHERE id = ?",
+                (_json_column(itinerary), result["version"], _now(), plan_id),
+            )
+            return result
+        return await self._run(patch)
+
+    async def delete_travel_plan(self, plan_id: str, user_id: str) -> bool:
+        """删除旅行计划"""
+        rows = await self._run(lambda conn: conn.execute(
+            "DELETE FROM travel_plans WHERE id = ? AND user_id = ? RETURNING id", (plan_id, user_id)
+        ).fetchall())
+        return len(rows) > 0
+
+    @staticmethod
+    def _insert_expense(conn: sqlite3.Connection, user_id: str, expense: Dict[str, Any]) -> Dict[str, Any]:
+        values = {column: expense.get(column) for column in EXPENSE_COLUMNS}
+        values.update(id=str(uuid.uuid4()), user_id=user_id, created_at=_now())
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{column}" for column in values)
+        return dict(conn.execute(f"INSERT INTO expenses ({columns}) VALUES ({placeholders}) RETURNING *", values).fetchone())
+
+    async def create_expense(self, user_id: str, plan_id: str, expense_data: Dict[str, Any]) -> Dict[str, Any]:
+        """创建费用记录"""
+        expense = {**expense_data, "plan_id": plan_id}
+        return await self._run(lambda conn: self._insert_expense(conn, user_id, expense))
+
+    async def create_expenses(self, user_id: str, expenses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量创建费用记录（同一事务），返回的记录与输入顺序一致"""
+        if not expenses:
+            return []
+        return await self._run(lambda conn: [self._insert_expense(conn, user_id, expense) for expense in expenses])
+
+    async def get_plan_expenses(self, plan_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """获取计划的所有费用记录"""
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT * FROM expenses WHERE plan_id = ? AND user_id = ? ORDER BY date DESC", (plan_id, user_id)
+        ).fetchall())
+        return [dict(row) for row in rows]
+
+    async def update_expense(self, expense_id: str, user_id: str, expense_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """修改费用记录，返回修改后的记录（不存在时为None）"""
+        values = {column: expense_data[column] for column in EXPENSE_COLUMNS if column in expense_data}
+        if not values:
+            rows = await self._run(lambda conn: conn.execute(
+                "SELECT * FROM expenses WHERE id = ? AND user_id = ?", (expense_id, user_id)
+            ).fetchone())
+            return dict(rows) if rows else None
+        assignments = ", ".join(f"{column} = :{column}" for column in values)
+        values.update(expense_id=expense_id, user_id=user_id)
+        row = await self._run(lambda conn: conn.execute(
+            f"UPDATE expenses SET {assignments} WHERE id = :expense_id AND user_id = :user_id RETURNING *", values
+        ).fetchone())
+        return dict(row) if row else None
+
+    async def delete_expense(self, expense_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """删除费用记录，返回被删除的记录（不存在时为None）"""
+        row = await self._run(lambda conn: conn.execute(
+            "DELETE FROM expenses WHERE id = ? AND user_id = ? RETURNING *", (expense_id, user_id)
+        ).fetchone())
+        return dict(row) if row else None
+
+    async def get_plan_budget_totals(self, plan_id: str, user_id: str) -> Dict[str, float]:
+        """获取计划按类别的费用汇总（由触发器随费用增删改维护）"""
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT category, total FROM plan_budget_totals WHERE plan_id = ? AND user_id = ?", (plan_id, user_id)
+        ).fetchall())
+        return {row["category"]: float(row["total"]) for row in rows}
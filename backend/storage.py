@@ -0,0 +1,168 @@
+"""
+存储接口
+路由只依赖这里定义的方法，具体实现可以替换：
+- database.Database：Supabase（PostgREST）
+- sqlite_storage.SQLiteDatabase：嵌入式 SQLite，用于本地压测和快速测试
+实现通过 config.Settings.storage_backend 选择。
+"""
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from json_patch import apply_patch, get_value
+
+# 计划列表只返回这些列（不含 itinerary），estimated_cost 由存储层预先计算
+PLAN_SUMMARY_COLUMNS = "id,destination,start_date,end_date,days,budget,travelers,preferences,estimated_cost,version,created_at"
+
+# 计划行的可写列
+PLAN_COLUMNS = (
+    "destination", "start_date", "end_date", "days", "budget",
+    "travelers", "preferences", "itinerary",
+)
+
+# fields= 投影可选择的列；itinerary 之外的列不能再选择子路径
+PLAN_FIELD_COLUMNS = PLAN_COLUMNS + ("id", "estimated_cost", "version", "created_at", "updated_at")
+
+_FIELD_SEGMENT = re.compile(r"^[A-Za-z0-9_]+$")
+
+# 费用行的可写列
+EXPENSE_COLUMNS = ("plan_id", "category", "amount", "description", "date")
+
+
+class PlanVersionConflict(Exception):
+    """计划已被修改，与请求的版本不一致"""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"旅行计划已被修改（当前版本 {current_version}）")
+        self.current_version = current_version
+
+
+def patch_plan_itinerary(
+    plan: Dict[str, Any],
+    operations: List[Dict[str, Any]],
+    expected_version: Optional[int],
+    return_path: List[str],
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    在内存中对计划的 itinerary 应用 JSON Patch（嵌入式存储使用）
+    返回 (新的 itinerary, {"version": 新版本, "value": return_path 处的子树})
+    """
+    version = plan.get("version") or 1
+    if expected_version is not None and expected_version != version:
+        raise PlanVersionConflict(version)
+    itinerary = apply_patch(plan.get("itinerary") or {}, operations)
+    return itinerary, {"version": version + 1, "value": get_value(itinerary, return_path)}
+
+
+def parse_plan_field(field: str) -> Tuple[str, List[str]]:
+    """
+    解析投影字段：列名，或 itinerary 下用点分隔的JSON路径（纯数字片段为数组下标），
+    例如 destination、itinerary.cost_breakdown、itinerary.days.0
+    """
+    column, *path = field.split(".")
+    if column not in PLAN_FIELD_COLUMNS:
+        raise ValueError(f"未知的字段: {column}")
+    if path and column != "itinerary":
+        raise ValueError(f"只有 itinerary 可以选择子路径: {field}")
+    if not all(_FIELD_SEGMENT.match(segment) for segment in path):
+        raise ValueError(f"无效的字段路径: {field}")
+    return column, path
+
+
+def select_plan_fields(plan: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """从完整的计划行中取出投影字段（嵌入式存储和发件箱使用）"""
+    selected = {"version": plan.get("version") or 1}
+    for field in fields:
+        column, path = parse_plan_field(field)
+        selected[field] = get_value(plan.get(column), path)
+    return selected
+
+
+class Storage(ABC):
+    """旅行计划和费用的存储接口"""
+
+    # 数据保存在本机（嵌入式存储）时为 True，此时写入本身就是本地的，不需要发件箱
+    local = False
+
+    @abstractmethod
+    async def close(self):
+        """释放连接"""
+
+    @abstractmethod
+    async def create_travel_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """创建旅行计划，返回写入后的行"""
+
+    @abstractmethod
+    async def create_travel_plans(self, plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量写入已带 id 和 created_at 的计划，已存在的 id 忽略"""
+
+    @abstractmethod
+    async def get_user_travel_plans(self, user_id: str) -> List[Dict[str, Any]]:
+        """获取用户的所有旅行计划（按创建时间倒序）"""
+
+    @abstractmethod
+    async def get_user_travel_plan_summaries(
+        self,
+        user_id: str,
+        limit: int = 20,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """按 (created_at, id) 倒序键集分页获取计划摘要"""
+
+    @abstractmethod
+    async def get_travel_plan(self, plan_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """获取特定旅行计划"""
+
+    @abstractmethod
+    async def get_travel_plan_fields(self, plan_id: str, user_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        只读取计划的部分字段（见 parse_plan_field），在存储层完成JSON路径选择
+        返回以字段为键的字典并附带 version，路径不存在时值为None，计划不存在时返回None
+        """
+
+    @abstractmethod
+    async def update_travel_plan(self, plan_id: str, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """更新旅行计划，返回更新后的行"""
+
+    @abstractmethod
+    async def patch_travel_plan(
+        self,
+        plan_id: str,
+        user_id: str,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+        return_path: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        对计划的 itinerary 原子地应用 JSON Patch，版本号加一
+        返回 {"version": 新版本, "value": return_path 处的子树}，计划不存在时返回None；
+        版本不一致抛出 PlanVersionConflict，补丁无法应用抛出 JsonPatchError
+        """
+
+    @abstractmethod
+    async def delete_travel_plan(self, plan_id: str, user_id: str) -> bool:
+        """删除旅行计划（费用记录级联删除）"""
+
+    @abstractmethod
+    async def create_expense(self, user_id: str, plan_id: str, expense_data: Dict[str, Any]) -> Dict[str, Any]:
+        """创建费用记录"""
+
+    @abstractmethod
+    async def create_expenses(self, user_id: str, expenses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量创建费用记录，返回的记录与输入顺序一致"""
+
+    @abstractmethod
+    async def get_plan_expenses(self, plan_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """获取计划的所有费用记录（按日期倒序）"""
+
+    @abstractmethod
+    async def update_expense(self, expense_id: str, user_id: str, expense_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """修改费用记录，不存在时返回None"""
+
+    @abstractmethod
+    async def delete_expense(self, expense_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """删除费用记录，返回被删除的记录（不存在时为None）"""
+
+    @abstractmethod
+    async def get_plan_budget_totals(self, plan_id: str, user_id: str) -> Dict[str, float]:
+        """获取计划按类别的费用汇总"""
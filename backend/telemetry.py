@@ -0,0 +1,155 @@
+"""
+行程生成遥测
+- ExpectedLengthModel: 按行程天数学习AI输出的token数，用于计算真实的生成进度
+- GenerationTimer: 记录一次生成的首token延迟、输出速度和总耗时
+- GenerationStatsStore: 进程内保存最近的生成记录并汇总指标
+"""
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# 没有历史数据时的输出长度估计：基础部分 + 每天的token数
+EXPECTED_BASE_TOKENS = int(os.getenv("PLAN_EXPECTED_BASE_TOKENS", "600"))
+EXPECTED_TOKENS_PER_DAY = int(os.getenv("PLAN_EXPECTED_TOKENS_PER_DAY", "700"))
+
+# 统计保留的最近生成记录数
+TELEMETRY_HISTORY = int(os.getenv("PLAN_TELEMETRY_HISTORY", "500"))
+
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> float:
+    """粗略估算文本的token数：中文约每字1个token，其余字符约每4个1个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) / 4
+
+
+class ExpectedLengthModel:
+    """按天数学习的输出长度模型（指数移动平均）"""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.by_days: Dict[int, float] = {}
+        self.per_day: Optional[float] = None  # 所有天数共享的每天token数，用于没见过的天数
+        self.calibration = 1.0  # 实际token数 / 估算token数
+
+    def expected(self, days: int) -> float:
+        """预计输出的token数"""
+        if days in self.by_days:
+            return self.by_days[days]
+        per_day = self.per_day if self.per_day is not None else EXPECTED_TOKENS_PER_DAY
+        return EXPECTED_BASE_TOKENS + per_day * max(days, 1)
+
+    def observe(self, days: int, tokens: float):
+        """记录一次完成的生成"""
+        if tokens <= 0:
+            return
+        previous = self.by_days.get(days)
+        self.by_days[days] = tokens if previous is None else previous + self.alpha * (tokens - previous)
+        per_day = max(tokens - EXPECTED_BASE_TOKENS, tokens / 2) / max(days, 1)
+        self.per_day = per_day if self.per_day is None else self.per_day + self.alpha * (per_day - self.per_day)
+
+    def calibrate(self, estimated: float, actual: float):
+        """用服务商返回的实际token数校准本地估算"""
+        if estimated > 0 and actual > 0:
+            self.calibration += self.alpha * (actual / estimated - self.calibration)
+
+
+class GenerationTimer:
+    """一次生成的计时和token计数"""
+
+    def __init__(self, days: int, model: Optional[ExpectedLengthModel] = None):
+        self.days = days
+        self.model = model or expected_length_model
+        self.expected_tokens = self.model.expected(days)
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.estimated_tokens = 0.0
+        self.usage_tokens: Optional[int] = None
+        self.cached_tokens = 0  # 命中服务商上下文缓存的输入token数
+        self.degraded = False  # 输出被截断或JSON经过修复，结果不写入行程缓存
+
+    def add_text(self, text: str):
+        """流式输出收到新文本"""
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.estimated_tokens += estimate_tokens(text) * self.model.calibration
+
+    def add_usage(self, completion_tokens: Optional[int]):
+        """累加服务商返回的实际输出token数（分天生成时每次调用累加一次；非流式调用以首个响应返回的时间作为首token时间）"""
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        if completion_tokens:
+            self.usage_tokens = (self.usage_tokens or 0) + completion_tokens
+
+    @property
+    def output_tokens(self) -> float:
+        return self.usage_tokens if self.usage_tokens is not None else self.estimated_tokens
+
+    def fraction(self) -> float:
+        """按已输出token数估算的完成比例（完成前最多0.99）"""
+        return min(self.output_tokens / max(self.expected_tokens, 1), 0.99)
+
+    def finish(self) -> Dict[str, Any]:
+        """结束计时，更新输出长度模型并返回本次生成的指标"""
+        self.finished_at = time.monotonic()
+        if self.usage_tokens is not None and self.estimated_tokens > 0:
+            self.model.calibrate(self.estimated_tokens / self.model.calibration, self.usage_tokens)
+        self.model.observe(self.days, self.output_tokens)
+
+        total = self.finished_at - self.started
+        ttft = self.first_token_at - self.started if self.first_token_at is not None else None
+        generating = self.finished_at - (self.first_token_at or self.started)
+        return {
+            "days": self.days,
+            "ttft": round(ttft, 3) if ttft is not None else None,
+            "total_time": round(total, 3),
+            "output_tokens": round(self.output_tokens),
+            "tokens_per_sec": round(self.output_tokens / generating, 1) if generating > 0 else None,
+            "token_source": "usage" if self.usage_tokens is not None else "estimate",
+            "cached_prompt_tokens": self.cached_tokens,
+            "degraded": self.degraded,
+        }
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+
+class GenerationStatsStore:
+    """最近生成记录的进程内统计"""
+
+    def __init__(self, history: int = TELEMETRY_HISTORY):
+        self.records: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.total = 0
+
+    def record(self, metrics: Dict[str, Any]):
+        self.records.append(metrics)
+        self.total += 1
+
+    def stats(self) -> Dict[str, Any]:
+        ttfts = [r["ttft"] for r in self.records if r.get("ttft") is not None]
+        totals = [r["total_time"] for r in self.records]
+        speeds = [r["tokens_per_sec"] for r in self.records if r.get("tokens_per_sec")]
+        return {
+            "generations": self.total,
+            "ttft_p50": _percentile(ttfts, 0.5),
+            "ttft_p95": _percentile(ttfts, 0.95),
+            "total_time_p50": _percentile(totals, 0.5),
+            "total_time_p95": _percentile(totals, 0.95),
+            "tokens_per_sec_avg": round(sum(speeds) / len(speeds), 1) if speeds else None,
+            "expected_tokens_by_days": {
+                days: round(tokens) for days, tokens in sorted(expected_length_model.by_days.items())
+            },
+        }
+
+
+# 全局实例
+expected_length_model = ExpectedLengthModel()
+generation_telemetry = GenerationStatsStore()
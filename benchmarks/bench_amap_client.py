@@ -0,0 +1,169 @@
+"""
+高德客户端连接复用延迟基准
+在本地启动一个模拟高德Web服务的 HTTPS 服务（自签名证书），模拟一次地理编码未命中：
+POI 搜索无结果后再请求地理编码接口，对比：
+1. 旧实现：每次请求新建 httpx.AsyncClient（每次都做 TCP + TLS 握手）
+2. 新实现：共享的连接池客户端（http_clients.create_amap_client）
+
+需要 cryptography 生成自签名证书。本地模拟服务使用 uvicorn（仅 HTTP/1.1），
+因此这里测到的是 keep-alive 的收益；HTTP/2 多路复用在真实高德接口上额外生效。
+
+运行: python benchmarks/bench_amap_client.py [请求数] [并发数]
+"""
+import asyncio
+import datetime
+import ipaddress
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from http_clients import create_amap_client
+from routers.geocode import geocode_by_address, search_poi
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+except ImportError:  # 可选依赖
+    x509 = None
+
+fake_amap = FastAPI()
+
+
+@fake_amap.get("/v3/place/text")
+async def fake_place_text():
+    return {"status": "1", "count": "0", "pois": []}
+
+
+@fake_amap.get("/v3/geocode/geo")
+async def fake_geocode():
+    return {"status": "1", "count": "1", "geocodes": [{"location": "120.15,30.25", "formatted_address": "杭州市西湖区"}]}
+
+
+def write_self_signed_cert(directory: str):
+    """生成 127.0.0.1 的自签名证书，返回 (证书路径, 私钥路径)"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+def start_server(cert_path: str, key_path: str) -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(fake_amap, host="127.0.0.1", port=port, log_level="error",
+                            ssl_certfile=cert_path, ssl_keyfile=key_path)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+async def old_lookup(base_url: str, cert_path: str):
+    """旧实现：每个接口调用各建一个客户端"""
+    for path in ("/v3/place/text", "/v3/geocode/geo"):
+        async with httpx.AsyncClient(timeout=5.0, verify=cert_path) as client:
+            await client.get(base_url + path, params={"key": "bench", "address": "西湖区"})
+
+
+async def new_lookup(client: httpx.AsyncClient):
+    """新实现：共享客户端"""
+    if not await search_poi(client, "bench", "西湖区"):
+        await geocode_by_address(client, "bench", "西湖区")
+
+
+async def measure(lookup, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await lookup()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "rps": requests / elapsed,
+    }
+
+
+async def run(base_url: str, cert_path: str, requests: int, concurrency: int):
+    old = await measure(lambda: old_lookup(base_url, cert_path), requests, concurrency)
+
+    client = create_amap_client(base_url, verify=cert_path)
+    await measure(lambda: new_lookup(client), concurrency, concurrency)  # 预热连接池
+    new = await measure(lambda: new_lookup(client), requests, concurrency)
+    await client.aclose()
+    return old, new
+
+
+def main():
+    if x509 is None:
+        print("需要安装 cryptography 生成自签名证书: pip install cryptography")
+        return
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = write_self_signed_cert(directory)
+        port = start_server(cert_path, key_path)
+        base_url = f"https://127.0.0.1:{port}"
+
+        # 屏蔽路由里的调试输出
+        devnull = open(os.devnull, "w")
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            old, new = asyncio.run(run(base_url, cert_path, requests, concurrency))
+        finally:
+            sys.stdout = stdout
+            devnull.close()
+
+    print("=" * 64)
+    print(f"地理编码未命中（2次接口调用） 请求数: {requests}  并发: {concurrency}")
+    print("=" * 64)
+    print(f"{'':12}{'p50(ms)':>12}{'p99(ms)':>12}{'吞吐(req/s)':>16}")
+    print(f"{'每次新建':12}{old['p50']:12.2f}{old['p99']:12.2f}{old['rps']:16.1f}")
+    print(f"{'共享连接池':12}{new['p50']:12.2f}{new['p99']:12.2f}{new['rps']:16.1f}")
+    print(f"\np50 降低 {old['p50'] / new['p50']:.1f}x，吞吐提升 {new['rps'] / old['rps']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+数据层并发压测
+在本地启动一个模拟 PostgREST 接口（每次查询固定延迟），对比：
+1. 旧实现：async 方法里调用同步 supabase-py 的 .execute()（阻塞事件循环）
+2. 新实现：database.Database（共享的异步连接池）
+
+运行: python benchmarks/bench_database.py [并发数] [查询延迟毫秒]
+"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from supabase import create_client
+
+from database import Database
+
+QUERY_DELAY = 0.02  # 模拟每次查询的数据库耗时（秒）
+
+BENCH_KEY = "bench-key"
+
+fake_app = FastAPI()
+
+PLANS = [
+    {"id": f"plan-{i}", "user_id": "bench-user", "destination": "杭州", "days": 3, "itinerary": {"days": []}}
+    for i in range(10)
+]
+
+
+@fake_app.get("/rest/v1/travel_plans")
+async def fake_select(request: Request):
+    """模拟 PostgREST 的查询接口"""
+    await asyncio.sleep(QUERY_DELAY)
+    return PLANS
+
+
+def start_fake_server() -> str:
+    """在后台线程启动模拟服务，返回 base_url"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    config = uvicorn.Config(fake_app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def run_sync_client(base_url: str, concurrency: int) -> float:
+    """旧实现：同步 supabase-py 客户端"""
+    client = create_client(base_url, BENCH_KEY)
+
+    async def one_query():
+        return client.table("travel_plans").select("*").eq("user_id", "bench-user").order("created_at", desc=True).execute().data
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_query() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_async_client(base_url: str, concurrency: int) -> float:
+    """新实现：Database 的异步连接池"""
+    db = Database(base_url, BENCH_KEY)
+    await db.get_user_travel_plans("bench-user")  # 预热连接
+
+    start = time.perf_counter()
+    await asyncio.gather(*(db.get_user_travel_plans("bench-user") for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return elapsed
+
+
+async def main():
+    global QUERY_DELAY
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    if len(sys.argv) > 2:
+        QUERY_DELAY = int(sys.argv[2]) / 1000
+    base_url = start_fake_server()
+
+    print("=" * 60)
+    print(f"并发查询数: {concurrency}  单次查询延迟: {QUERY_DELAY * 1000:.0f}ms  单个事件循环")
+    print("=" * 60)
+
+    sync_time = await run_sync_client(base_url, concurrency)
+    print(f"同步 supabase-py（阻塞事件循环）: {sync_time:.2f}s  吞吐 {concurrency / sync_time:.0f} 查询/秒")
+
+    async_time = await run_async_client(base_url, concurrency)
+    print(f"异步连接池 Database:              {async_time:.2f}s  吞吐 {concurrency / async_time:.0f} 查询/秒")
+
+    print(f"加速比: {sync_time / async_time:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+JSON修复基准测试
+基于 tests/data/json_repair_corpus.json 语料，对比：
+1. 旧实现：json.loads → 全局替换单引号 + 正则去注释 → 失败即降级
+2. 新实现：json_repair.loads 单次线性修复
+统计修复成功率（与预期结果完全一致）和平均解析耗时。
+
+运行: python benchmarks/bench_json_repair.py [重复次数]
+"""
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from json_repair import loads
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'json_repair_corpus.json')
+
+
+def legacy_loads(text):
+    """旧版 create_travel_plan_stream 中的解析流程（不含降级占位结构）"""
+    json_start = text.find('{')
+    json_end = text.rfind('}') + 1
+    if json_start == -1 or json_end <= json_start:
+        raise ValueError("无法从AI响应中提取JSON")
+    json_str = text[json_start:json_end]
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        fixed_json = json_str.replace(',]', ']').replace(',}', '}')
+        fixed_json = fixed_json.replace("'", '"')
+        fixed_json = re.sub(r'//.*?$', '', fixed_json, flags=re.MULTILINE)
+        fixed_json = re.sub(r'/\*.*?\*/', '', fixed_json, flags=re.DOTALL)
+        return json.loads(fixed_json)
+
+
+def run(name, parse, corpus, repeat):
+    success = 0
+    failures = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for case in corpus:
+            try:
+                result = parse(case["input"])
+            except ValueError:
+                result = None
+            if _ == 0:
+                if result == case["expected"]:
+                    success += 1
+                else:
+                    failures.append(case["name"])
+    elapsed = time.perf_counter() - start
+    per_parse_us = elapsed / (repeat * len(corpus)) * 1e6
+    print(f"{name}: 成功率 {success}/{len(corpus)} ({success / len(corpus):.0%})  平均耗时 {per_parse_us:.1f}µs")
+    if failures:
+        print(f"  失败用例: {', '.join(failures)}")
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    print("=" * 60)
+    print(f"语料条数: {len(corpus)}  重复次数: {repeat}")
+    print("=" * 60)
+    run("旧实现（三段式回退）", legacy_loads, corpus, repeat)
+    run("json_repair        ", loads, corpus, repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+并发流式生成压测
+在本地启动一个模拟 DashScope 流式接口（OpenAI兼容 SSE），对比：
+1. 旧实现：在异步生成器里迭代同步 OpenAI 客户端（阻塞事件循环）
+2. 新实现：共享的 AsyncOpenAI 客户端（llm.create_llm_client）
+
+运行: python benchmarks/bench_llm_concurrency.py [并发数] [每条流的chunk数]
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from openai import OpenAI
+
+from llm import create_llm_client
+
+CHUNK_DELAY = 0.02  # 模拟每个token的生成间隔（秒）
+
+fake_app = FastAPI()
+
+
+@fake_app.post("/v1/chat/completions")
+async def fake_chat_completions(body: dict):
+    """模拟 DashScope 的流式 chat completions"""
+    chunks = int(body.get("max_tokens") or 50)
+
+    async def stream():
+        for i in range(chunks):
+            await asyncio.sleep(CHUNK_DELAY)
+            payload = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": f"t{i} "}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def start_fake_server() -> str:
+    """在后台线程启动模拟服务，返回 base_url"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    config = uvicorn.Config(fake_app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run_sync_streams(base_url: str, concurrency: int, chunks: int) -> float:
+    """旧实现：同步客户端在事件循环中迭代"""
+    client = OpenAI(api_key="bench", base_url=base_url)
+
+    async def one_stream():
+        response = client.chat.completions.create(
+            model="qwen-plus",
+            messages=[{"role": "user", "content": "bench"}],
+            max_tokens=chunks,
+            stream=True,
+        )
+        text = ""
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+        return text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+async def run_async_streams(base_url: str, concurrency: int, chunks: int) -> float:
+    """新实现：共享的异步客户端"""
+    client = create_llm_client("bench", base_url=base_url)
+
+    async def one_stream():
+        response = await client.chat.completions.create(
+            model="qwen-plus",
+            messages=[{"role": "user", "content": "bench"}],
+            max_tokens=chunks,
+            stream=True,
+        )
+        text = ""
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+        return text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed
+
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    base_url = start_fake_server()
+
+    single = chunks * CHUNK_DELAY
+    print("=" * 60)
+    print(f"并发流数: {concurrency}  每条流chunk数: {chunks}  单流理论耗时: {single:.2f}s")
+    print("=" * 60)
+
+    sync_time = await run_sync_streams(base_url, concurrency, chunks)
+    print(f"同步客户端（阻塞事件循环）: {sync_time:.2f}s  吞吐 {concurrency / sync_time:.1f} 流/秒")
+
+    async_time = await run_async_streams(base_url, concurrency, chunks)
+    print(f"共享异步客户端:             {async_time:.2f}s  吞吐 {concurrency / async_time:.1f} 流/秒")
+
+    print(f"加速比: {sync_time / async_time:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
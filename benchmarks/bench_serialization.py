@@ -0,0 +1,90 @@
+"""
+行程序列化和压缩微基准
+对比典型的 5 天和 14 天行程：
+1. 编码耗时：标准库 json.dumps（旧实现，ensure_ascii）vs orjson
+2. 传输字节：未压缩 / gzip / brotli（已安装时）
+
+运行: python benchmarks/bench_serialization.py [重复次数]
+"""
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from serialization import dumps
+from compression import COMPRESSION_BROTLI_QUALITY, COMPRESSION_GZIP_LEVEL, brotli
+
+SPOTS = ["西湖", "灵隐寺", "雷峰塔", "河坊街", "西溪湿地", "宋城", "龙井村", "九溪烟树"]
+
+
+def make_itinerary(days: int) -> dict:
+    """构造与模型输出结构一致的行程"""
+    return {
+        "days": [
+            {
+                "day": day,
+                "date": f"2026-05-{day:02d}",
+                "theme": f"第{day}天：湖光山色与人文古迹",
+                "activities": [
+                    {
+                        "time": f"{9 + i * 2:02d}:00",
+                        "name": SPOTS[(day + i) % len(SPOTS)],
+                        "type": "景点",
+                        "description": "沿湖步行游览，欣赏断桥残雪、苏堤春晓等经典景观，适合拍照和休闲散步。",
+                        "location": {"address": f"浙江省杭州市西湖区{SPOTS[i % len(SPOTS)]}路{day * 10 + i}号",
+                                     "lat": 30.25 + i * 0.01, "lng": 120.15 + day * 0.01},
+                        "cost": 80 + i * 20,
+                        "duration": "2小时",
+                        "tips": "建议提前在官方小程序预约，避开周末高峰。",
+                    }
+                    for i in range(5)
+                ],
+                "meals": [
+                    {"type": meal, "restaurant": "知味观", "dishes": ["西湖醋鱼", "东坡肉", "龙井虾仁"], "cost": 120}
+                    for meal in ("早餐", "午餐", "晚餐")
+                ],
+                "accommodation": {"name": "西湖边精品酒店", "address": "杭州市上城区南山路", "cost": 600},
+                "transportation": "地铁1号线 + 步行",
+            }
+            for day in range(1, days + 1)
+        ],
+        "cost_breakdown": {"transportation": 800, "accommodation": 600 * days, "food": 360 * days,
+                           "attractions": 500 * days, "total": 800 + 1460 * days},
+        "tips": ["杭州春季多雨，请携带雨具", "景区周边停车困难，建议公共交通出行"],
+    }
+
+
+def time_encode(encode, value, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(value)
+    return (time.perf_counter() - start) / repeat * 1e6  # 微秒
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("=" * 72)
+    print(f"重复次数: {repeat}  gzip级别: {COMPRESSION_GZIP_LEVEL}  brotli: {'已安装' if brotli else '未安装'}")
+    print("=" * 72)
+
+    for days in (5, 14):
+        plan = {"id": "plan-id", "destination": "杭州", "days": days, "itinerary": make_itinerary(days)}
+        old = json.dumps(plan).encode("utf-8")
+        new = dumps(plan)
+
+        old_us = time_encode(lambda v: json.dumps(v).encode("utf-8"), plan, repeat)
+        new_us = time_encode(dumps, plan, repeat)
+        print(f"\n{days}天行程")
+        print(f"  编码  json.dumps: {old_us:8.1f}µs   orjson: {new_us:8.1f}µs   加速 {old_us / new_us:.1f}x")
+        print(f"  字节  json.dumps: {len(old):8d}     orjson: {len(new):8d}     (中文不转义)")
+        print(f"  gzip  json.dumps: {len(gzip.compress(old, COMPRESSION_GZIP_LEVEL)):8d}     "
+              f"orjson: {len(gzip.compress(new, COMPRESSION_GZIP_LEVEL)):8d}")
+        if brotli is not None:
+            print(f"  br    orjson: {len(brotli.compress(new, quality=COMPRESSION_BROTLI_QUALITY)):8d}")
+
+
+if __name__ == "__main__":
+    main()
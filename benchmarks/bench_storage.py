@@ -0,0 +1,82 @@
+"""
+离线 API 吞吐压测（嵌入式 SQLite 存储，不需要 Supabase 项目）
+预先写入一批计划和费用，然后并发请求计划列表、计划详情和预算分析接口。
+
+运行: python benchmarks/bench_storage.py [计划数] [请求数] [并发数]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import httpx
+
+from main import app
+from database import get_db
+from sqlite_storage import SQLiteDatabase
+
+USERS = 20
+
+
+async def seed(db: SQLiteDatabase, plans: int):
+    """按用户均匀写入计划，每个计划 10 笔费用"""
+    plan_ids = []
+    for i in range(plans):
+        user_id = f"user-{i % USERS}"
+        plan = await db.create_travel_plan(user_id, {
+            "destination": "杭州", "days": 5, "budget": 5000, "travelers": 2, "preferences": "美食",
+            "itinerary": {
+                "days": [{"day": d, "activities": [{"name": f"景点{d}-{a}", "cost": 50} for a in range(5)]} for d in range(1, 6)],
+                "cost_breakdown": {"total": 4200},
+            },
+        })
+        await db.create_expenses(user_id, [
+            {"plan_id": plan["id"], "category": ("餐饮", "交通", "门票")[k % 3], "amount": 20 + k, "date": "2026-05-01"}
+            for k in range(10)
+        ])
+        plan_ids.append((user_id, plan["id"]))
+    return plan_ids
+
+
+async def run(plans: int, requests: int, concurrency: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = SQLiteDatabase(path)
+    start = time.perf_counter()
+    plan_ids = await seed(db, plans)
+    print(f"写入 {plans} 个计划（含 {plans * 10} 笔费用）: {time.perf_counter() - start:.2f}s")
+
+    app.dependency_overrides[get_db] = lambda: db
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        def urls(i):
+            user_id, plan_id = plan_ids[i % len(plan_ids)]
+            return [
+                f"/api/travel/plans?user_id={user_id}&limit=20",
+                f"/api/travel/plans/{plan_id}?user_id={user_id}",
+                f"/api/budget/analysis/{plan_id}?user_id={user_id}",
+            ][i % 3]
+
+        async def one(i):
+            async with semaphore:
+                response = await client.get(urls(i))
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    app.dependency_overrides.clear()
+    await db.close()
+    print(f"{requests} 个请求（并发 {concurrency}）: {elapsed:.2f}s  吞吐 {requests / elapsed:.0f} 请求/秒")
+
+
+if __name__ == "__main__":
+    plans = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    asyncio.run(run(plans, requests, concurrency))
@@ -129,3 +129,326 @@ CREATE TRIGGER update_travel_plans_updated_at
 
 
 
+
+-- ============================================
+-- 计划列表：预计算总费用 + 键集分页索引
+-- 列表接口只查询摘要列，不再传输 itinerary
+-- ============================================
+
+ALTER TABLE travel_plans ADD COLUMN IF NOT EXISTS estimated_cost NUMERIC(12, 2);
+
+-- 写入或修改 itinerary 时从 cost_breakdown.total 计算总费用（非数字时为空）
+CREATE OR REPLACE FUNCTION update_plan_estimated_cost()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF jsonb_typeof(NEW.itinerary->'cost_breakdown'->'total') = 'number' THEN
+        NEW.estimated_cost = (NEW.itinerary->'cost_breakdown'->>'total')::numeric;
+    ELSE
+        NEW.estimated_cost = NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_travel_plans_estimated_cost ON travel_plans;
+CREATE TRIGGER update_travel_plans_estimated_cost
+    BEFORE INSERT OR UPDATE OF itinerary ON travel_plans
+    FOR EACH ROW
+    EXECUTE FUNCTION update_plan_estimated_cost();
+
+-- 回填已有计划
+UPDATE travel_plans SET itinerary = itinerary WHERE estimated_cost IS NULL AND itinerary IS NOT NULL;
+
+-- 按用户、创建时间倒序的键集分页
+CREATE INDEX IF NOT EXISTS idx_travel_plans_user_created_id ON travel_plans(user_id, created_at DESC, id DESC);
+
+-- ============================================
+-- 每个计划的费用汇总（按类别），由触发器随 expenses 增删改增量维护
+-- 预算分析直接读取汇总，不再遍历全部费用记录
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS plan_budget_totals (
+    plan_id UUID NOT NULL REFERENCES travel_plans(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES auth.users(id),
+    category TEXT NOT NULL,
+    total NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    expense_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (plan_id, category)
+);
+
+CREATE INDEX IF NOT EXISTS idx_plan_budget_totals_user_id ON plan_budget_totals(user_id);
+
+ALTER TABLE plan_budget_totals ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own budget totals" ON plan_budget_totals;
+CREATE POLICY "Users can view own budget totals" ON plan_budget_totals
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- 新增的一笔费用计入汇总
+CREATE OR REPLACE FUNCTION plan_budget_totals_add(p_plan_id UUID, p_user_id UUID, p_category TEXT, p_amount NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO plan_budget_totals (plan_id, user_id, category, total, expense_count)
+    VALUES (p_plan_id, p_user_id, p_category, p_amount, 1)
+    ON CONFLICT (plan_id, category) DO UPDATE
+        SET total = plan_budget_totals.total + EXCLUDED.total,
+            expense_count = plan_budget_totals.expense_count + 1,
+            updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- 从汇总中扣除一笔费用（只更新已有的行：计划被删除级联删除费用时，汇总行可能已不存在）
+CREATE OR REPLACE FUNCTION plan_budget_totals_remove(p_plan_id UUID, p_category TEXT, p_amount NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE plan_budget_totals
+        SET total = total - p_amount,
+            expense_count = expense_count - 1,
+            updated_at = NOW()
+        WHERE plan_id = p_plan_id AND category = p_category;
+    DELETE FROM plan_budget_totals
+        WHERE plan_id = p_plan_id AND category = p_category AND expense_count <= 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 以定义者权限运行，固定 search_path，防止调用方用同名对象劫持函数内引用的表和函数
+CREATE OR REPLACE FUNCTION update_plan_budget_totals()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM plan_budget_totals_remove(OLD.plan_id, OLD.category, OLD.amount);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM plan_budget_totals_add(NEW.plan_id, NEW.user_id, NEW.category, NEW.amount);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp;
+
+DROP TRIGGER IF EXISTS update_expenses_budget_totals ON expenses;
+CREATE TRIGGER update_expenses_budget_totals
+    AFTER INSERT OR DELETE OR UPDATE OF plan_id, category, amount ON expenses
+    FOR EACH ROW
+    EXECUTE FUNCTION update_plan_budget_totals();
+
+-- 根据已有费用记录重建汇总
+INSERT INTO plan_budget_totals (plan_id, user_id, category, total, expense_count)
+SELECT plan_id, MIN(user_id::text)::uuid, category, SUM(amount), COUNT(*)
+FROM expenses
+GROUP BY plan_id, category
+ON CONFLICT (plan_id, category) DO UPDATE
+    SET total = EXCLUDED.total,
+        expense_count = EXCLUDED.expense_count,
+        updated_at = NOW();
+
+-- ============================================
+-- 行程的局部修改：JSON Patch（RFC 6902）在数据库内执行
+-- 只传输补丁和修改后的子树；version 用于乐观并发控制（HTTP ETag / If-Match）
+-- 错误码 PTxxx 由 PostgREST 映射为 HTTP 状态码 xxx
+-- ============================================
+
+ALTER TABLE travel_plans ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+-- 每次修改计划版本号加一
+CREATE OR REPLACE FUNCTION increment_travel_plan_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.version = OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_travel_plans_version ON travel_plans;
+CREATE TRIGGER update_travel_plans_version
+    BEFORE UPDATE ON travel_plans
+    FOR EACH ROW
+    EXECUTE FUNCTION increment_travel_plan_version();
+
+-- JSON Pointer（RFC 6901）解析为路径数组，'' 表示整个文档
+CREATE OR REPLACE FUNCTION jsonb_pointer_path(p_pointer TEXT)
+RETURNS TEXT[] AS $$
+BEGIN
+    IF p_pointer IS NULL OR (p_pointer <> '' AND left(p_pointer, 1) <> '/') THEN
+        RAISE EXCEPTION '无效的JSON Pointer: %', p_pointer USING ERRCODE = 'PT422';
+    END IF;
+    IF p_pointer = '' THEN
+        RETURN ARRAY[]::TEXT[];
+    END IF;
+    RETURN ARRAY(
+        SELECT replace(replace(token, '~1', '/'), '~0', '~')
+        FROM unnest(regexp_split_to_array(substr(p_pointer, 2), '/')) WITH ORDINALITY AS t(token, n)
+        ORDER BY n
+    );
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 取路径对应的值，不存在时为 NULL（数组下标只接受非负整数，不使用 jsonb 的负数下标）
+CREATE OR REPLACE FUNCTION jsonb_patch_get(p_doc JSONB, p_path TEXT[])
+RETURNS JSONB AS $$
+DECLARE
+    v_node JSONB := p_doc;
+    v_key TEXT;
+BEGIN
+    FOREACH v_key IN ARRAY p_path LOOP
+        IF jsonb_typeof(v_node) = 'object' THEN
+            v_node := v_node -> v_key;
+        ELSIF jsonb_typeof(v_node) = 'array' AND v_key ~ '^(0|[1-9][0-9]{0,8})$' THEN
+            v_node := v_node -> v_key::INTEGER;
+        ELSE
+            RETURN NULL;
+        END IF;
+        IF v_node IS NULL THEN
+            RETURN NULL;
+        END IF;
+    END LOOP;
+    RETURN v_node;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 替换路径处的值（路径必须已存在）
+CREATE OR REPLACE FUNCTION jsonb_patch_set(p_doc JSONB, p_path TEXT[], p_value JSONB)
+RETURNS JSONB AS $$
+BEGIN
+    IF cardinality(p_path) = 0 THEN
+        RETURN p_value;
+    END IF;
+    RETURN jsonb_set(p_doc, p_path, p_value, false);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION jsonb_patch_add(p_doc JSONB, p_path TEXT[], p_value JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_parent_path TEXT[];
+    v_parent JSONB;
+    v_key TEXT;
+    v_length INTEGER;
+BEGIN
+    IF cardinality(p_path) = 0 THEN
+        RETURN p_value;
+    END IF;
+    v_parent_path := p_path[1:cardinality(p_path) - 1];
+    v_parent := jsonb_patch_get(p_doc, v_parent_path);
+    v_key := p_path[cardinality(p_path)];
+
+    IF jsonb_typeof(v_parent) = 'object' THEN
+        RETURN jsonb_patch_set(p_doc, v_parent_path, v_parent || jsonb_build_object(v_key, p_value));
+    ELSIF jsonb_typeof(v_parent) = 'array' THEN
+        v_length := jsonb_array_length(v_parent);
+        IF v_key = '-' OR v_key = v_length::TEXT THEN
+            RETURN jsonb_patch_set(p_doc, v_parent_path, v_parent || jsonb_build_array(p_value));
+        ELSIF v_key ~ '^(0|[1-9][0-9]{0,8})$' AND v_key::INTEGER < v_length THEN
+            RETURN jsonb_insert(p_doc, p_path, p_value, false);
+        END IF;
+        RAISE EXCEPTION '数组下标无效: %', v_key USING ERRCODE = 'PT422';
+    END IF;
+    RAISE EXCEPTION '父节点不存在: %', array_to_string(p_path, '/') USING ERRCODE = 'PT422';
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION jsonb_patch_remove(p_doc JSONB, p_path TEXT[])
+RETURNS JSONB AS $$
+BEGIN
+    IF cardinality(p_path) = 0 THEN
+        RAISE EXCEPTION '不能删除整个文档' USING ERRCODE = 'PT422';
+    END IF;
+    IF jsonb_patch_get(p_doc, p_path) IS NULL THEN
+        RAISE EXCEPTION '路径不存在: %', array_to_string(p_path, '/') USING ERRCODE = 'PT422';
+    END IF;
+    RETURN p_doc #- p_path;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 按顺序应用 RFC 6902 补丁，任一操作失败则整个补丁失败
+CREATE OR REPLACE FUNCTION jsonb_patch(p_doc JSONB, p_patch JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_op JSONB;
+    v_path TEXT[];
+    v_from TEXT[];
+    v_value JSONB;
+BEGIN
+    IF jsonb_typeof(p_patch) IS DISTINCT FROM 'array' THEN
+        RAISE EXCEPTION '补丁必须是操作数组' USING ERRCODE = 'PT422';
+    END IF;
+
+    FOR v_op IN SELECT value FROM jsonb_array_elements(p_patch) LOOP
+        v_path := jsonb_pointer_path(v_op->>'path');
+        IF v_op->>'op' IN ('add', 'replace', 'test') AND NOT v_op ? 'value' THEN
+            RAISE EXCEPTION '操作缺少 value: %', v_op USING ERRCODE = 'PT422';
+        END IF;
+
+        CASE v_op->>'op'
+            WHEN 'add' THEN
+                p_doc := jsonb_patch_add(p_doc, v_path, v_op->'value');
+            WHEN 'remove' THEN
+                p_doc := jsonb_patch_remove(p_doc, v_path);
+            WHEN 'replace' THEN
+                IF jsonb_patch_get(p_doc, v_path) IS NULL THEN
+                    RAISE EXCEPTION '路径不存在: %', v_op->>'path' USING ERRCODE = 'PT422';
+                END IF;
+                p_doc := jsonb_patch_set(p_doc, v_path, v_op->'value');
+            WHEN 'move' THEN
+                v_from := jsonb_pointer_path(v_op->>'from');
+                IF cardinality(v_path) > cardinality(v_from) AND v_path[1:cardinality(v_from)] = v_from THEN
+                    RAISE EXCEPTION '不能把节点移动到它自己的子节点下' USING ERRCODE = 'PT422';
+                END IF;
+                v_value := jsonb_patch_get(p_doc, v_from);
+                IF v_value IS NULL THEN
+                    RAISE EXCEPTION '路径不存在: %', v_op->>'from' USING ERRCODE = 'PT422';
+                END IF;
+                p_doc := jsonb_patch_add(jsonb_patch_remove(p_doc, v_from), v_path, v_value);
+            WHEN 'copy' THEN
+                v_value := jsonb_patch_get(p_doc, jsonb_pointer_path(v_op->>'from'));
+                IF v_value IS NULL THEN
+                    RAISE EXCEPTION '路径不存在: %', v_op->>'from' USING ERRCODE = 'PT422';
+                END IF;
+                p_doc := jsonb_patch_add(p_doc, v_path, v_value);
+            WHEN 'test' THEN
+                IF jsonb_patch_get(p_doc, v_path) IS DISTINCT FROM v_op->'value' THEN
+                    RAISE EXCEPTION 'test 失败: %', v_op->>'path' USING ERRCODE = 'PT409';
+                END IF;
+            ELSE
+                RAISE EXCEPTION '无效的操作: %', v_op->>'op' USING ERRCODE = 'PT422';
+        END CASE;
+    END LOOP;
+    RETURN p_doc;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 对计划的 itinerary 应用补丁，返回 {version, value}（value 为 p_return_path 处修改后的子树）
+-- 以调用者身份执行，行级安全策略照常生效
+CREATE OR REPLACE FUNCTION patch_travel_plan_itinerary(
+    p_plan_id UUID,
+    p_user_id UUID,
+    p_patch JSONB,
+    p_expected_version INTEGER DEFAULT NULL,
+    p_return_path TEXT[] DEFAULT ARRAY[]::TEXT[]
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_itinerary JSONB;
+    v_version INTEGER;
+BEGIN
+    SELECT itinerary, version INTO v_itinerary, v_version
+    FROM travel_plans
+    WHERE id = p_plan_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION '旅行计划不存在' USING ERRCODE = 'PT404';
+    END IF;
+    IF p_expected_version IS NOT NULL AND p_expected_version <> v_version THEN
+        RAISE EXCEPTION '旅行计划已被修改' USING ERRCODE = 'PT412', DETAIL = v_version::TEXT;
+    END IF;
+
+    v_itinerary := jsonb_patch(COALESCE(v_itinerary, '{}'::JSONB), p_patch);
+
+    UPDATE travel_plans SET itinerary = v_itinerary
+    WHERE id = p_plan_id
+    RETURNING version INTO v_version;
+
+    RETURN jsonb_build_object('version', v_version, 'value', jsonb_patch_get(v_itinerary, p_return_path));
+END;
+$$ LANGUAGE plpgsql;
@@ -78,10 +78,12 @@ async function generateTravelPlan(formData) {
   const progressContainer = document.getElementById("progressContainer");
   const progressBar = document.getElementById("progressBar");
   const progressMessage = document.getElementById("progressMessage");
+  const progressPreview = document.getElementById("progressPreview");
   const generateBtn = document.getElementById("generateBtn");
 
   // 显示进度条，隐藏结果区域
   progressContainer.style.display = "block";
+  progressPreview.innerHTML = "";
   document.getElementById("resultSection").style.display = "none";
   generateBtn.disabled = true;
   progressBar.style.width = "0%";
@@ -120,6 +122,11 @@ async function generateTravelPlan(formData) {
             data.message || `进度 ${data.progress}%`;
         }
 
+        if (data.partial && data.partial.section === "day") {
+          // 某一天的行程已生成，先展示概要
+          renderDayPreview(progressPreview, data.partial);
+        }
+
         if (data.result) {
           // 生成完成
           currentPlan = data.result;
@@ -157,6 +164,20 @@ async function generateTravelPlan(formData) {
   }
 }
 
+// 展示生成过程中已完成的某一天行程概要
+function renderDayPreview(container, partial) {
+  const day = partial.data || {};
+  const names = (day.activities || [])
+    .map((activity) => activity.name)
+    .filter(Boolean)
+    .slice(0, 4);
+  const item = document.createElement("li");
+  item.textContent = `第${day.day || partial.index + 1}天：${
+    names.length ? names.join(" → ") : "行程已生成"
+  }`;
+  container.appendChild(item);
+}
+
 // 显示旅行计划
 function displayTravelPlan(plan) {
   const resultSection = document.getElementById("resultSection");
@@ -363,21 +384,26 @@ document.getElementById("saveBtn").addEventListener("click", () => {
   }
 });
 
-// 加载用户计划
-async function loadUserPlans() {
+// 加载用户计划（分页，cursor 为空时从第一页开始）
+let plansNextCursor = null;
+
+async function loadUserPlans(cursor = null) {
   if (!currentUser) return;
 
   try {
-    const response = await fetch(
-      `${API_BASE_URL}/travel/plans?user_id=${currentUser.user_id}`
-    );
+    let url = `${API_BASE_URL}/travel/plans?user_id=${currentUser.user_id}`;
+    if (cursor) {
+      url += `&cursor=${encodeURIComponent(cursor)}`;
+    }
+    const response = await fetch(url);
 
     if (!response.ok) {
       throw new Error("加载计划失败");
     }
 
     const data = await response.json();
-    displayUserPlans(data.plans);
+    plansNextCursor = data.next_cursor;
+    displayUserPlans(data.plans, Boolean(cursor));
   } catch (error) {
     console.error("Error:", error);
     document.getElementById("plansList").innerHTML =
@@ -673,16 +699,18 @@ function getSmartKeywords(name, context = 'destination') {
 }
 
 // 显示用户计划列表
-function displayUserPlans(plans) {
+function displayUserPlans(plans, append = false) {
   const plansList = document.getElementById("plansList");
+  const loadMore = document.getElementById("plansLoadMore");
+  if (loadMore) loadMore.remove();
 
-  if (!plans || plans.length === 0) {
+  if (!append && (!plans || plans.length === 0)) {
     plansList.innerHTML =
       '<p class="hint">还没有旅行计划，快去创建一个吧！</p>';
     return;
   }
 
-  plansList.innerHTML = plans
+  const cards = plans
     .map(
       (plan) => {
         // 为每个目的地生成独特的渐变色
@@ -700,6 +728,7 @@ function displayUserPlans(plans) {
                 <div class="plan-meta">
                     <span>📅 ${plan.days}天</span>
                     <span>💰 ¥${plan.budget}</span>
+                    ${plan.estimated_cost != null ? `<span>🧾 预计¥${plan.estimated_cost}</span>` : ''}
                     <span>👥 ${plan.travelers}人</span>
                 </div>
                 ${plan.preferences ? `<p class="plan-preferences">${plan.preferences}</p>` : ''}
@@ -714,6 +743,19 @@ function displayUserPlans(plans) {
       }
     )
     .join("");
+
+  if (append) {
+    plansList.insertAdjacentHTML("beforeend", cards);
+  } else {
+    plansList.innerHTML = cards;
+  }
+
+  if (plansNextCursor) {
+    plansList.insertAdjacentHTML(
+      "beforeend",
+      '<button id="plansLoadMore" class="btn btn-secondary" onclick="loadUserPlans(plansNextCursor)">加载更多</button>'
+    );
+  }
 }
 
 // 查看计划详情
@@ -899,31 +941,26 @@ async function showPlanOnMap() {
   mapProgressMessage.textContent = "正在定位地点...";
 
   try {
-    // 为每个地点获取坐标（使用智能方案）
-    const locationsWithCoords = [];
-    for (let i = 0; i < uniqueLocations.length; i++) {
-      const location = uniqueLocations[i];
-
-      // 更新进度
-      const progress = ((i + 1) / uniqueLocations.length) * 100;
-      mapProgressBar.style.width = `${progress}%`;
-      mapProgressMessage.textContent = `正在定位地点 ${i + 1}/${
-        uniqueLocations.length
-      }: ${location.name}`;
+    // 批量获取所有地点坐标（后端批量接口，失败的地点再逐个定位）
+    const coordsList = await getLocationsCoords(
+      uniqueLocations.map((location) => location.address),
+      (completed, total, address) => {
+        mapProgressBar.style.width = `${(completed / total) * 100}%`;
+        mapProgressMessage.textContent = `正在定位地点 ${completed}/${total}: ${address}`;
+      }
+    );
 
-      try {
-        // 使用新的 getLocationCoords 函数（支持三重保障）
-        const coords = await getLocationCoords(location.address);
+    const locationsWithCoords = [];
+    uniqueLocations.forEach((location, i) => {
+      if (coordsList[i]) {
         locationsWithCoords.push({
           ...location,
-          location: coords,
+          location: coordsList[i],
         });
-        console.log(`✓ ${location.name} - 坐标已获取`);
-      } catch (error) {
-        console.warn(`❌ 无法定位: ${location.name}`, error.message);
-        // 继续处理其他地点，不中断
+      } else {
+        console.warn(`❌ 无法定位: ${location.name}`);
       }
-    }
+    });
 
     // 隐藏进度条
     mapProgressContainer.style.display = "none";
@@ -97,16 +97,24 @@ async function loadTravelPlansForBudget() {
       return;
     }
 
-    const response = await fetch(
-      `${API_BASE_URL}/travel/plans?user_id=${user.user_id}`
-    );
-
-    if (!response.ok) {
-      throw new Error("获取旅行计划失败");
-    }
-
-    const data = await response.json();
-    const plans = data.plans || [];
+    // 列表接口分页返回，依次获取所有页
+    const plans = [];
+    let cursor = null;
+    do {
+      let url = `${API_BASE_URL}/travel/plans?user_id=${user.user_id}&limit=100`;
+      if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+      }
+      const response = await fetch(url);
+
+      if (!response.ok) {
+        throw new Error("获取旅行计划失败");
+      }
+
+      const data = await response.json();
+      plans.push(...(data.plans || []));
+      cursor = data.next_cursor;
+    } while (cursor);
 
     const selectElement = document.getElementById("budgetPlanSelect");
     selectElement.innerHTML =
@@ -251,12 +259,38 @@ function renderExpensesList() {
             </div>
           </div>
           <div class="expense-amount">-¥${expense.amount.toLocaleString()}</div>
+          <button class="btn btn-secondary btn-sm expense-delete" onclick="deleteExpense('${expense.id}')">删除</button>
         </div>
       `;
     })
     .join("");
 }
 
+// 删除费用记录
+async function deleteExpense(expenseId) {
+  if (!confirm("确定要删除这条费用记录吗？")) return;
+
+  try {
+    const user = await getCurrentUser();
+    if (!user) return;
+
+    const response = await fetch(
+      `${API_BASE_URL}/budget/expense/${expenseId}?user_id=${user.user_id}`,
+      { method: "DELETE" }
+    );
+
+    if (!response.ok) {
+      throw new Error("删除费用记录失败");
+    }
+
+    await loadExpenses();
+    refreshBudgetOverview();
+  } catch (error) {
+    console.error("删除费用记录失败:", error);
+    alert("删除失败");
+  }
+}
+
 // 渲染分类统计图表
 function renderCategoryChart() {
   const container = document.getElementById("categoryChart");
@@ -97,6 +97,44 @@ async function getLocationCoords(address) {
   }
 }
 
+// 批量获取地点坐标：先通过后端批量接口解析（服务端缓存 + 并发），
+// 后端找不到的地点再逐个使用 getLocationCoords 的其他方案
+// onProgress(已完成数, 总数, 地址) 用于更新进度条；返回与 addresses 顺序一致的坐标数组（失败为 null）
+async function getLocationsCoords(addresses, onProgress = () => {}) {
+  const coords = new Array(addresses.length).fill(null);
+  let completed = 0;
+
+  try {
+    await geocodeAddressesViaBackend(addresses, (item) => {
+      if (item.status === "ok") {
+        coords[item.index] = {
+          lng: item.result.lng,
+          lat: item.result.lat,
+          name: item.result.name,
+          formatted_address: item.result.formatted_address,
+        };
+        completed += 1;
+        onProgress(completed, addresses.length, item.address);
+      }
+    });
+  } catch (error) {
+    console.warn("⚠️ 批量地理编码失败，改为逐个定位:", error);
+  }
+
+  for (let i = 0; i < addresses.length; i++) {
+    if (coords[i]) continue;
+    try {
+      coords[i] = await getLocationCoords(addresses[i]);
+    } catch (error) {
+      console.warn("❌ 无法定位:", addresses[i], error.message);
+    }
+    completed += 1;
+    onProgress(completed, addresses.length, addresses[i]);
+  }
+
+  return coords;
+}
+
 // 在主地图上显示标记
 function showLocationsOnMainMap(locations, title = "旅行地图") {
   if (!mainMap) {
@@ -392,30 +430,44 @@ async function drawTravelRoute(locations) {
   let successCount = 0;
   let failCount = 0;
 
-  // 为连续的地点规划路线
-  for (let i = 0; i < locations.length - 1; i++) {
-    const startLoc = locations[i];
-    const endLoc = locations[i + 1];
-
-    if (!startLoc.location || !endLoc.location) {
-      console.log(`⚠️ 跳过路线 ${i + 1}: 缺少坐标信息`);
-      continue;
+  // 一次请求当天所有路段：后端并发规划、按坐标缓存，并合并相距不足10米的相邻地点
+  const routable = locations.filter((loc) => loc.location);
+  let legs = [];
+  try {
+    const response = await fetch(`${API_BASE_URL}/map/day-route`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({
+        waypoints: routable.map((loc) => ({
+          lng: loc.location.lng,
+          lat: loc.location.lat,
+          name: loc.name,
+        })),
+      }),
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || "路线规划失败");
     }
+    legs = (await response.json()).legs;
+  } catch (error) {
+    console.warn("⚠️ 整日路线规划失败，使用虚线直连:", error.message);
+    // 后端不可用时按相邻地点逐段绘制虚线
+    legs = routable.slice(1).map((_, i) => ({
+      index: i,
+      from_index: i,
+      to_index: i + 1,
+      status: "error",
+      error: error.message,
+    }));
+  }
 
-    // 检查起点和终点是否太近（小于10米视为同一地点）
-    const distance = AMap.GeometryUtil.distance(
-      [startLoc.location.lng, startLoc.location.lat],
-      [endLoc.location.lng, endLoc.location.lat]
-    );
-
-    if (distance < 10) {
-      console.log(
-        `⚠️ 跳过路线 ${i + 1}: ${startLoc.name} 和 ${
-          endLoc.name
-        } 距离太近 (${Math.round(distance)}米)`
-      );
-      continue;
-    }
+  for (const leg of legs) {
+    const i = leg.index;
+    const startLoc = routable[leg.from_index];
+    const endLoc = routable[leg.to_index];
 
     // 根据地点类型选择线条颜色
     let strokeColor = "#2563eb"; // 默认蓝色
@@ -426,93 +478,68 @@ async function drawTravelRoute(locations) {
     }
 
     try {
-      // 调用后端API获取路线
-      const response = await fetch(`${API_BASE_URL}/map/driving-route`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          origin_lng: startLoc.location.lng,
-          origin_lat: startLoc.location.lat,
-          destination_lng: endLoc.location.lng,
-          destination_lat: endLoc.location.lat,
-        }),
-      });
-
-      if (response.ok) {
-        const routeData = await response.json();
-
-        console.log(`  └─ 后端返回的完整数据:`, routeData);
-        console.log(
-          `  └─ Polyline原始数据（前100字符）:`,
-          routeData.polyline ? routeData.polyline.substring(0, 100) : "(空)"
-        );
+      if (leg.status !== "ok") {
+        throw new Error(leg.error || "路线规划失败");
+      }
+      const routeData = leg.route;
 
-        // 解析polyline坐标串并绘制路线
-        const path = parsePolyline(routeData.polyline);
+      // 解析polyline坐标串并绘制路线
+      const path = parsePolyline(routeData.polyline);
 
-        console.log(`  └─ 解析后路径点数: ${path.length}`);
-        if (path.length > 0) {
-          console.log(`  └─ 第一个点:`, path[0]);
-          console.log(`  └─ 最后一个点:`, path[path.length - 1]);
-        }
+      console.log(`  └─ 解析后路径点数: ${path.length}${leg.cached ? "（缓存）" : ""}`);
 
-        if (path.length < 2) {
-          throw new Error("路径点数不足");
-        }
+      if (path.length < 2) {
+        throw new Error("路径点数不足");
+      }
 
-        const polyline = new AMap.Polyline({
-          path: path,
-          strokeColor: strokeColor,
-          strokeWeight: 5,
-          strokeOpacity: 0.8,
-          strokeStyle: "solid",
-          lineJoin: "round",
-          lineCap: "round",
-          extData: { routeIndex: i + 1 }, // 保存路线序号
-        });
+      const polyline = new AMap.Polyline({
+        path: path,
+        strokeColor: strokeColor,
+        strokeWeight: 5,
+        strokeOpacity: 0.8,
+        strokeStyle: "solid",
+        lineJoin: "round",
+        lineCap: "round",
+        extData: { routeIndex: i + 1 }, // 保存路线序号
+      });
 
-        mainMap.add(polyline);
-        routePolylines.push(polyline);
+      mainMap.add(polyline);
+      routePolylines.push(polyline);
 
-        // 在路线中点添加序号标记
-        const midPointIndex = Math.floor(path.length / 2);
-        const midPoint = path[midPointIndex];
+      // 在路线中点添加序号标记
+      const midPointIndex = Math.floor(path.length / 2);
+      const midPoint = path[midPointIndex];
 
-        const routeMarker = new AMap.Marker({
-          position: midPoint,
-          content: `<div class="route-number-marker">${i + 1}</div>`,
-          offset: new AMap.Pixel(-15, -15),
-          zIndex: 1000,
-        });
+      const routeMarker = new AMap.Marker({
+        position: midPoint,
+        content: `<div class="route-number-marker">${i + 1}</div>`,
+        offset: new AMap.Pixel(-15, -15),
+        zIndex: 1000,
+      });
 
-        mainMap.add(routeMarker);
-        routePolylines.push(routeMarker); // 也加入清除列表
-
-        // 保存路线信息
-        const routeInfo = {
-          index: i + 1,
-          from: startLoc.name,
-          to: endLoc.name,
-          distance: routeData.distance,
-          duration: routeData.duration,
-          type: startLoc.type || "activity",
-          color: strokeColor,
-          polyline: polyline,
-        };
-        routeInfoList.push(routeInfo);
-
-        successCount++;
-        console.log(`✓ 路线 ${i + 1}: ${startLoc.name} → ${endLoc.name}`);
-        console.log(
-          `  └─ 距离: ${(routeData.distance / 1000).toFixed(
-            1
-          )}km, 时间: ${Math.round(routeData.duration / 60)}分钟`
-        );
-      } else {
-        throw new Error("路线规划失败");
-      }
+      mainMap.add(routeMarker);
+      routePolylines.push(routeMarker); // 也加入清除列表
+
+      // 保存路线信息
+      const routeInfo = {
+        index: i + 1,
+        from: startLoc.name,
+        to: endLoc.name,
+        distance: routeData.distance,
+        duration: routeData.duration,
+        type: startLoc.type || "activity",
+        color: strokeColor,
+        polyline: polyline,
+      };
+      routeInfoList.push(routeInfo);
+
+      successCount++;
+      console.log(`✓ 路线 ${i + 1}: ${startLoc.name} → ${endLoc.name}`);
+      console.log(
+        `  └─ 距离: ${(routeData.distance / 1000).toFixed(
+          1
+        )}km, 时间: ${Math.round(routeData.duration / 60)}分钟`
+      );
     } catch (error) {
       failCount++;
       console.warn(
@@ -874,6 +901,39 @@ async function geocodeAddressViaBackend(address) {
   }
 }
 
+// 调用后端批量地理编码API（NDJSON流式返回，每解析完一个地点回调一次）
+async function geocodeAddressesViaBackend(addresses, onResult) {
+  console.log(`🌐 调用后端批量地理编码API: ${addresses.length} 个地点`);
+
+  const response = await fetch(`${API_BASE_URL}/map/geocode-batch`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ addresses: addresses, stream: true }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || "后端批量地理编码失败");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    lines.filter((line) => line.trim()).forEach((line) => onResult(JSON.parse(line)));
+  }
+  if (buffer.trim()) {
+    onResult(JSON.parse(buffer));
+  }
+}
+
 // 获取常见城市坐标（备用方案2）
 function getCityCoordinates(cityName) {
   // 常见城市坐标库
@@ -0,0 +1,90 @@
+"""
+地理编码缓存预热
+批量解析常用景点/地址并写入地理编码缓存（内存 + 本地SQLite），
+服务启动后这些地址直接命中磁盘缓存，不再请求高德。
+
+输入文件每行一个地址，可用制表符附带城市："西湖<TAB>杭州"；空行和 # 开头的行忽略。
+
+运行: python scripts/warm_geocode_cache.py landmarks.txt [--city 杭州] [--concurrency 4] [--force]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from geocode_cache import geocode_cache
+from http_clients import close_http_clients, get_amap_client, init_http_clients
+from routers.geocode import fetch_address, get_geocode_providers
+
+
+def read_addresses(path: str, default_city):
+    """读取 (地址, 城市) 列表，重复的地址只保留一个"""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    entries = {}
+    with stream:
+        for line in stream:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            address, _, city = line.partition("\t")
+            entries[(address.strip(), city.strip() or default_city)] = None
+    return list(entries)
+
+
+async def warm(entries, concurrency: int, force: bool):
+    await init_http_clients()
+    providers = get_geocode_providers(get_amap_client())
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"cached": 0, "found": 0, "not_found": 0, "failed": 0}
+
+    async def resolve(address, city):
+        if force:
+            await geocode_cache.delete(address, city)
+        elif await geocode_cache.contains(address, city):
+            counts["cached"] += 1
+            return
+        async with semaphore:
+            try:
+                result = await fetch_address(providers, address, city)
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"❌ {address}: {e}")
+                return
+        counts["found" if result else "not_found"] += 1
+
+    try:
+        await asyncio.gather(*(resolve(address, city) for address, city in entries))
+    finally:
+        await close_http_clients()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地理编码缓存预热")
+    parser.add_argument("input", help="地址文件，每行一个地址（- 表示标准输入）")
+    parser.add_argument("--city", default=None, help="未指定城市的地址使用的默认城市")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求数（注意高德QPS配额）")
+    parser.add_argument("--force", action="store_true", help="忽略已有缓存重新解析")
+    args = parser.parse_args()
+
+    entries = read_addresses(args.input, args.city)
+    print(f"共 {len(entries)} 个地址，缓存文件: {geocode_cache.disk_path or '(仅内存)'}")
+
+    start = time.perf_counter()
+    counts = asyncio.run(warm(entries, args.concurrency, args.force))
+    elapsed = time.perf_counter() - start
+
+    print(f"已缓存跳过 {counts['cached']}，找到 {counts['found']}，找不到 {counts['not_found']}，"
+          f"失败 {counts['failed']}，耗时 {elapsed:.1f}s")
+    geocode_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+大模型调用准入控制测试
+运行: pytest tests/test_admission.py
+"""
+import asyncio
+import sys
+import os
+
+import httpx
+import openai
+import pytest
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from admission import AdmissionController, AdmissionTimeout, Priority
+from rate_limit import TokenBucket
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://dashscope.example/v1/chat/completions")
+    return openai.RateLimitError("too many requests", response=httpx.Response(429, request=request), body=None)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=100, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert 0 < bucket.wait_time() <= 0.01
+
+
+def test_waiters_admitted_by_priority():
+    """并发已满时，释放的配额先给高优先级的等待者"""
+    controller = AdmissionController(rate=1000, burst=1000, max_concurrency=1, min_concurrency=1)
+    order = []
+
+    async def call(priority, name, hold=0.0):
+        async with controller.slot(priority, api_key="k"):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def run():
+        first = asyncio.create_task(call(Priority.PLAN, "first", hold=0.05))
+        await asyncio.sleep(0.01)
+        waiters = [
+            asyncio.create_task(call(Priority.BUDGET, "budget")),
+            asyncio.create_task(call(Priority.PLAN, "plan")),
+            asyncio.create_task(call(Priority.INTERACTIVE, "parse")),
+        ]
+        await asyncio.sleep(0.01)
+        depth = controller.stats()[0]["queue_depth"]
+        await asyncio.gather(first, *waiters)
+        return depth
+
+    depth = asyncio.run(run())
+    assert depth == 3
+    assert order == ["first", "parse", "plan", "budget"]
+
+
+def test_deadline_rejects_queued_call():
+    controller = AdmissionController(rate=1000, burst=1000, max_concurrency=1, min_concurrency=1)
+
+    async def run():
+        async with controller.slot(Priority.PLAN, api_key="k"):
+            with pytest.raises(AdmissionTimeout):
+                async with controller.slot(Priority.BUDGET, api_key="k", timeout=0.05):
+                    pass
+        # 超时的等待者不占用配额
+        async with controller.slot(Priority.BUDGET, api_key="k", timeout=0.05):
+            pass
+
+    asyncio.run(run())
+    stats = controller.stats()[0]
+    assert stats["timeouts"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_rate_limit_halves_concurrency_then_recovers():
+    controller = AdmissionController(rate=1000, burst=1000, max_concurrency=8, min_concurrency=2)
+
+    async def run():
+        with pytest.raises(openai.RateLimitError):
+            async with controller.slot(Priority.PLAN, api_key="k"):
+                raise rate_limit_error()
+        limit_after_429 = controller.stats()[0]["concurrency_limit"]
+        for _ in range(5):
+            async with controller.slot(Priority.PLAN, api_key="k"):
+                pass
+        return limit_after_429, controller.stats()[0]
+
+    limit_after_429, stats = asyncio.run(run())
+    assert limit_after_429 == 4
+    assert 4 < stats["concurrency_limit"] <= 8
+    assert stats["upstream_429"] == 1
+
+
+def test_token_bucket_limits_admission_rate():
+    controller = AdmissionController(rate=20, burst=1, max_concurrency=8, min_concurrency=1)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(4):
+            async with controller.slot(Priority.PLAN, api_key="k"):
+                pass
+        return loop.time() - start
+
+    elapsed = asyncio.run(run())
+    # 首个请求使用突发令牌，其余3个按每秒20个的速率放行
+    assert elapsed >= 0.14
+
+
+def test_streaming_and_full_latencies_use_separate_floors():
+    controller = AdmissionController(rate=1000, burst=1000, max_concurrency=8, min_concurrency=1)
+
+    async def run():
+        for _ in range(6):
+            # 流式调用：首token很快，之后还要继续生成
+            async with controller.slot(Priority.PLAN, api_key="k") as slot:
+                await asyncio.sleep(0.01)
+                slot.first_token()
+                await asyncio.sleep(0.05)
+            # 非流式调用：完整耗时远大于首token延迟，但属于正常情况
+            async with controller.slot(Priority.PLAN, api_key="k"):
+                await asyncio.sleep(0.06)
+        return controller.stats()[0]
+
+    stats = asyncio.run(run())
+    # 若混用同一基线，每次非流式调用都会被当作拥塞而收缩并发
+    assert stats["concurrency_limit"] == 8
+
+
+def test_call_kinds_of_different_length_use_separate_floors():
+    controller = AdmissionController(rate=1000, burst=1000, max_concurrency=8, min_concurrency=1)
+
+    async def run():
+        for _ in range(6):
+            # 单天行程输出短，完整行程输出长，耗时差异来自输出长度而不是拥塞
+            async with controller.slot(Priority.PLAN, api_key="k", kind="day"):
+                await asyncio.sleep(0.01)
+            async with controller.slot(Priority.PLAN, api_key="k", kind="plan"):
+                await asyncio.sleep(0.05)
+        return controller.stats()[0]
+
+    assert asyncio.run(run())["concurrency_limit"] == 8
@@ -0,0 +1,104 @@
+"""
+预算分析使用费用汇总的测试
+运行: pytest tests/test_budget_totals.py
+"""
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import get_db
+from data_cache import CachedDatabase, MemoryCacheBackend
+from routers import budget
+
+
+class TotalsDatabase:
+    """按费用增删改维护汇总的内存数据库（模拟 plan_budget_totals 触发器）"""
+
+    def __init__(self):
+        self.expenses = {}
+        self.totals = {}
+        self.expense_reads = 0
+
+    def _apply(self, expense, sign):
+        key = (expense["plan_id"], expense["category"])
+        self.totals[key] = self.totals.get(key, 0) + sign * expense["amount"]
+        if abs(self.totals[key]) < 1e-9:
+            del self.totals[key]
+
+    async def get_travel_plan(self, plan_id, user_id):
+        return {"id": plan_id, "budget": 1000, "destination": "杭州", "days": 2}
+
+    async def get_plan_expenses(self, plan_id, user_id):
+        self.expense_reads += 1
+        return [e for e in self.expenses.values() if e["plan_id"] == plan_id]
+
+    async def create_expense(self, user_id, plan_id, expense_data):
+        expense = {"id": f"e{len(self.expenses) + 1}", "plan_id": plan_id, **expense_data}
+        self.expenses[expense["id"]] = expense
+        self._apply(expense, 1)
+        return expense
+
+    async def update_expense(self, expense_id, user_id, expense_data):
+        expense = self.expenses.get(expense_id)
+        if expense is None:
+            return None
+        self._apply(expense, -1)
+        expense.update(expense_data)
+        self._apply(expense, 1)
+        return expense
+
+    async def delete_expense(self, expense_id, user_id):
+        expense = self.expenses.pop(expense_id, None)
+        if expense is not None:
+            self._apply(expense, -1)
+        return expense
+
+    async def get_plan_budget_totals(self, plan_id, user_id):
+        return {category: total for (pid, category), total in self.totals.items() if pid == plan_id}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    raw = TotalsDatabase()
+    db = CachedDatabase(raw, MemoryCacheBackend())
+    app.dependency_overrides[get_db] = lambda: db
+
+    async def no_recommendations(*args):
+        return []
+
+    monkeypatch.setattr(budget, "generate_budget_recommendations", no_recommendations)
+    yield TestClient(app), raw
+    app.dependency_overrides.clear()
+
+
+def test_analysis_reads_aggregates_and_follows_edits(client):
+    http, raw = client
+    params = {"user_id": "u1"}
+    for category, amount in [("餐饮", 100), ("餐饮", 50), ("交通", 30)]:
+        http.post("/api/budget/expense", params=params, json={"plan_id": "p1", "category": category, "amount": amount, "description": "x"})
+
+    first = http.get("/api/budget/analysis/p1", params=params).json()
+    assert first["total_spent"] == 180
+    assert first["category_breakdown"] == {"餐饮": 150, "交通": 30}
+
+    assert http.put("/api/budget/expense/e2", params=params, json={"amount": 70}).status_code == 200
+    assert http.delete("/api/budget/expense/e3", params=params).status_code == 200
+    second = http.get("/api/budget/analysis/p1", params=params).json()
+    assert second["category_breakdown"] == {"餐饮": 170}
+    assert second["remaining"] == 830
+
+    # 预算分析不再读取费用明细
+    assert raw.expense_reads == 0
+
+
+def test_missing_expense_returns_404(client):
+    http, _ = client
+    assert http.delete("/api/budget/expense/nope", params={"user_id": "u1"}).status_code == 404
+    assert http.put("/api/budget/expense/nope", params={"user_id": "u1"}, json={"amount": 1}).status_code == 404
+    assert http.put("/api/budget/expense/nope", params={"user_id": "u1"}, json={}).status_code == 400
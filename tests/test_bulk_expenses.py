@@ -0,0 +1,166 @@
+"""
+批量费用导入测试
+运行: pytest tests/test_bulk_expenses.py
+"""
+import asyncio
+import json
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import get_db
+from routers import budget
+from bulk_import import iter_lines
+
+
+class FakeDatabase:
+    """记录每次多行插入的内存数据库"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def create_expenses(self, user_id, expenses):
+        if any(expense["description"] == "违反约束" for expense in expenses):
+            raise RuntimeError("violates check constraint")
+        self.batches.append(expenses)
+        offset = sum(len(batch) for batch in self.batches[:-1])
+        return [{"id": f"e{offset + i}", "user_id": user_id, **expense} for i, expense in enumerate(expenses)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = FakeDatabase()
+    app.dependency_overrides[get_db] = lambda: db
+    monkeypatch.setattr(budget, "BULK_EXPENSE_CHUNK_SIZE", 2)
+    yield TestClient(app), db
+    app.dependency_overrides.clear()
+
+
+def test_json_rows_are_validated_and_inserted_in_chunks(client):
+    http, db = client
+    rows = [
+        {"plan_id": "p1", "category": "餐饮", "amount": 50, "description": "午餐", "date": "2026-05-01"},
+        {"plan_id": "p1", "category": "交通", "amount": "abc", "description": "地铁"},
+        {"plan_id": "p1", "category": "门票", "amount": 120, "description": "博物馆"},
+        {"plan_id": "p1", "category": "购物", "amount": 300, "description": "纪念品"},
+    ]
+    response = http.post("/api/budget/expenses/bulk", params={"user_id": "u1"}, json={"expenses": rows})
+    data = response.json()
+
+    assert data["total"] == 4 and data["created"] == 3 and data["failed"] == 1
+    assert [r["status"] for r in data["results"]] == ["created", "invalid", "created", "created"]
+    assert "amount" in data["results"][1]["error"]
+    assert [len(batch) for batch in db.batches] == [2, 1]
+    assert db.batches[0][0]["date"] == "2026-05-01"
+
+
+def test_ndjson_body_reports_bad_lines(client):
+    http, db = client
+    body = "\n".join([
+        json.dumps({"plan_id": "p1", "category": "餐饮", "amount": 30, "description": "早餐"}, ensure_ascii=False),
+        "{not json",
+        "",
+        json.dumps({"plan_id": "p1", "category": "住宿", "amount": 400, "description": "酒店"}, ensure_ascii=False),
+    ])
+    response = http.post(
+        "/api/budget/expenses/bulk",
+        params={"user_id": "u1"},
+        content=body.encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    results = response.json()["results"]
+    assert [(r["row"], r["status"]) for r in results] == [(1, "created"), (2, "invalid"), (3, "created")]
+    assert sum(len(batch) for batch in db.batches) == 2
+
+
+def test_rows_beyond_limit_are_not_parsed(client, monkeypatch):
+    http, db = client
+    monkeypatch.setattr(budget, "BULK_EXPENSE_MAX_ROWS", 3)
+    line = json.dumps({"plan_id": "p1", "category": "餐饮", "amount": 30, "description": "早餐"}, ensure_ascii=False)
+    response = http.post(
+        "/api/budget/expenses/bulk",
+        params={"user_id": "u1"},
+        content="\n".join([line] * 1000).encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    data = response.json()
+    assert data["total"] == 3 and data["created"] == 3
+    assert "上限3行" in data["error"]
+    assert sum(len(batch) for batch in db.batches) == 3
+
+
+def test_failed_chunk_is_retried_row_by_row(client):
+    http, db = client
+    rows = [
+        {"plan_id": "p1", "category": "餐饮", "amount": 50, "description": "午餐"},
+        {"plan_id": "p1", "category": "交通", "amount": 20, "description": "违反约束"},
+        {"plan_id": "p1", "category": "门票", "amount": 120, "description": "博物馆"},
+    ]
+    data = http.post("/api/budget/expenses/bulk", params={"user_id": "u1"}, json=rows).json()
+    assert [r["status"] for r in data["results"]] == ["created", "failed", "created"]
+    assert "check constraint" in data["results"][1]["error"]
+    assert sum(len(batch) for batch in db.batches) == 2
+
+
+def test_stream_error_keeps_processed_rows(client, monkeypatch):
+    http, db = client
+
+    async def broken_records(chunks):
+        yield 1, {"plan_id": "p1", "category": "餐饮", "amount": 30, "description": "早餐"}, None
+        raise ConnectionResetError("客户端断开")
+
+    monkeypatch.setattr(budget, "iter_ndjson_records", broken_records)
+    response = http.post(
+        "/api/budget/expenses/bulk",
+        params={"user_id": "u1"},
+        content=b"{}",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    data = response.json()
+    assert response.status_code == 200
+    assert data["created"] == 1 and "客户端断开" in data["error"]
+
+
+def test_csv_body_with_quoted_fields(client):
+    http, db = client
+    body = (
+        "\ufeffplan_id,category,amount,description,date\r\n"
+        "p1,餐饮,88.5,\"火锅, 两人\",2026-05-02\r\n"
+        "p1,其他,12,\"备注\n第二行\",\r\n"
+    )
+    response = http.post(
+        "/api/budget/expenses/bulk",
+        params={"user_id": "u1"},
+        content=body.encode("utf-8"),
+        headers={"Content-Type": "text/csv"},
+    )
+    data = response.json()
+    assert data["created"] == 2
+    inserted = [expense for batch in db.batches for expense in batch]
+    assert inserted[0]["description"] == "火锅, 两人" and inserted[0]["amount"] == 88.5
+    assert inserted[1]["description"] == "备注\n第二行"
+
+
+def test_unsupported_content_type(client):
+    http, _ = client
+    response = http.post("/api/budget/expenses/bulk", params={"user_id": "u1"}, content=b"x", headers={"Content-Type": "text/plain"})
+    assert response.status_code == 415
+
+
+def test_lines_split_across_multibyte_chunks():
+    data = "第一行\n第二行".encode("utf-8")
+
+    async def chunks():
+        for i in range(len(data)):
+            yield data[i:i + 1]
+
+    async def run():
+        return [line async for line in iter_lines(chunks())]
+
+    assert asyncio.run(run()) == ["第一行", "第二行"]
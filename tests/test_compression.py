@@ -0,0 +1,109 @@
+"""
+orjson 序列化和响应压缩测试
+运行: pytest tests/test_compression.py
+"""
+import asyncio
+import gzip
+import json
+import sys
+import os
+from decimal import Decimal
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import get_db
+from sqlite_storage import SQLiteDatabase
+from compression import CompressionMiddleware, choose_encoding
+from serialization import FastJSONResponse, dumps, encode_sse
+
+
+def test_encoding_keeps_utf8_and_handles_decimals():
+    assert dumps({"城市": "杭州", "cost": Decimal("12.50")}) == '{"城市":"杭州","cost":12.5}'.encode("utf-8")
+    assert encode_sse({"progress": 10}) == b'data: {"progress":10}\n\n'
+
+
+def test_accept_encoding_negotiation():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("") is None
+
+
+def make_app():
+    demo = FastAPI(default_response_class=FastJSONResponse)
+    demo.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @demo.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @demo.get("/large")
+    async def large():
+        return {"activities": [{"name": f"景点{i}", "description": "西湖边的步行路线" * 5} for i in range(50)]}
+
+    @demo.get("/tagged")
+    async def tagged():
+        return FastJSONResponse(
+            {"activities": [{"name": f"景点{i}", "description": "西湖边的步行路线" * 5} for i in range(50)]},
+            headers={"ETag": '"3"'},
+        )
+
+    @demo.get("/events")
+    async def events():
+        async def generate():
+            for i in range(3):
+                yield encode_sse({"progress": i * 50, "message": "生成中" * 200})
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    return demo
+
+
+def test_only_large_non_streaming_responses_are_compressed():
+    client = TestClient(make_app())
+    headers = {"Accept-Encoding": "gzip"}
+
+    small = client.get("/small", headers=headers)
+    assert "content-encoding" not in small.headers
+
+    large = client.get("/large", headers=headers)
+    assert large.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in large.headers["vary"]
+    assert int(large.headers["content-length"]) < len(large.content)  # 客户端已自动解压
+    assert large.json()["activities"][0]["name"] == "景点0"
+
+    events = client.get("/events", headers=headers)
+    assert "content-encoding" not in events.headers
+    assert events.text.count("data: ") == 3
+
+
+def test_compressed_responses_carry_weak_etags():
+    client = TestClient(make_app())
+
+    compressed = client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"] == 'W/"3"'
+
+    identity = client.get("/tagged", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] == '"3"'
+
+
+def test_plan_responses_are_compressed_end_to_end():
+    db = SQLiteDatabase()
+    itinerary = {"days": [{"day": d, "activities": [{"name": "西湖", "description": "环湖骑行" * 20}] * 5} for d in range(1, 6)]}
+    plan = asyncio.run(db.create_travel_plan("u1", {"destination": "杭州", "days": 5, "itinerary": itinerary}))
+    app.dependency_overrides[get_db] = lambda: db
+    try:
+        client = TestClient(app)
+        with client.stream("GET", f"/api/travel/plans/{plan['id']}", params={"user_id": "u1"},
+                           headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+        assert response.headers["content-encoding"] == "gzip"
+        assert json.loads(gzip.decompress(raw))["itinerary"]["days"][4]["day"] == 5
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,173 @@
+"""
+计划和费用读穿透缓存测试
+运行: pytest tests/test_data_cache.py
+"""
+import asyncio
+import sys
+import os
+
+import pytest
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from data_cache import CachedDatabase, MemoryCacheBackend
+
+
+class CountingDatabase:
+    """记录读取次数的内存数据库"""
+
+    def __init__(self):
+        self.plans = {("u1", "p1"): {"id": "p1", "destination": "杭州"}}
+        self.expenses = {("u1", "p1"): []}
+        self.reads = 0
+        self.read_delay = 0.0
+
+    async def get_travel_plan(self, plan_id, user_id):
+        self.reads += 1
+        plan = self.plans.get((user_id, plan_id))
+        await asyncio.sleep(self.read_delay)
+        return dict(plan) if plan else None
+
+    async def get_user_travel_plans(self, user_id):
+        self.reads += 1
+        return [dict(p) for (uid, _), p in self.plans.items() if uid == user_id]
+
+    async def get_travel_plan_fields(self, plan_id, user_id, fields):
+        self.reads += 1
+        plan = self.plans.get((user_id, plan_id))
+        return {field: plan.get(field) for field in fields} if plan else None
+
+    async def get_user_travel_plan_summaries(self, user_id, limit=20, after=None):
+        self.reads += 1
+        rows = sorted((p for (uid, _), p in self.plans.items() if uid == user_id), key=lambda p: p["id"], reverse=True)
+        if after is not None:
+            rows = [p for p in rows if p["id"] < after[1]]
+        return [{"id": p["id"], "destination": p["destination"]} for p in rows[:limit]]
+
+    async def create_travel_plan(self, user_id, plan_data):
+        plan = dict(plan_data)
+        self.plans[(user_id, plan["id"])] = plan
+        return plan
+
+    async def get_plan_expenses(self, plan_id, user_id):
+        self.reads += 1
+        return list(self.expenses.get((user_id, plan_id), []))
+
+    async def update_travel_plan(self, plan_id, user_id, plan_data):
+        self.plans[(user_id, plan_id)].update(plan_data)
+        return self.plans[(user_id, plan_id)]
+
+    async def delete_travel_plan(self, plan_id, user_id):
+        return self.plans.pop((user_id, plan_id), None) is not None
+
+    async def create_expense(self, user_id, plan_id, expense_data):
+        self.expenses.setdefault((user_id, plan_id), []).append(expense_data)
+        return expense_data
+
+
+def test_reads_are_cached_until_a_write_invalidates():
+    db = CountingDatabase()
+    cached = CachedDatabase(db, MemoryCacheBackend())
+
+    async def run():
+        first = await cached.get_travel_plan("p1", "u1")
+        first["destination"] = "被调用方修改"  # 缓存返回的是副本
+        second = await cached.get_travel_plan("p1", "u1")
+        await cached.get_plan_expenses("p1", "u1")
+        await cached.get_plan_expenses("p1", "u1")
+        reads_before_write = db.reads
+
+        await cached.create_expense("u1", "p1", {"amount": 50})
+        expenses = await cached.get_plan_expenses("p1", "u1")
+        plan = await cached.get_travel_plan("p1", "u1")  # 费用写入不影响计划缓存
+
+        await cached.update_travel_plan("p1", "u1", {"destination": "苏州"})
+        updated = await cached.get_travel_plan("p1", "u1")
+        await cached.delete_travel_plan("p1", "u1")
+        deleted = await cached.get_travel_plan("p1", "u1")
+        return second, reads_before_write, expenses, plan, updated, deleted
+
+    second, reads_before_write, expenses, plan, updated, deleted = asyncio.run(run())
+
+    assert second["destination"] == "杭州"
+    assert reads_before_write == 2
+    assert expenses == [{"amount": 50}]
+    assert plan["destination"] == "杭州"
+    assert updated["destination"] == "苏州"
+    assert deleted is None
+    assert cached.stats()["hits"] == 3
+    assert cached._versions == {}
+
+
+def test_write_during_read_does_not_repopulate_stale_value():
+    db = CountingDatabase()
+    db.read_delay = 0.05
+    cached = CachedDatabase(db, MemoryCacheBackend())
+
+    async def run():
+        read = asyncio.create_task(cached.get_travel_plan("p1", "u1"))
+        await asyncio.sleep(0.01)
+        await cached.update_travel_plan("p1", "u1", {"destination": "苏州"})
+        await read
+        db.read_delay = 0
+        return await cached.get_travel_plan("p1", "u1")
+
+    assert asyncio.run(run())["destination"] == "苏州"
+    # 读取结束后不再保留失效版本
+    assert cached._versions == {} and cached._readers == {}
+
+
+def test_workers_sharing_a_backend_see_each_others_invalidations():
+    db = CountingDatabase()
+    shared = MemoryCacheBackend()
+    worker_a = CachedDatabase(db, shared)
+    worker_b = CachedDatabase(db, shared)
+
+    async def run():
+        await worker_a.get_plan_expenses("p1", "u1")
+        await worker_b.get_plan_expenses("p1", "u1")
+        reads = db.reads
+        await worker_a.create_expense("u1", "p1", {"amount": 80})
+        return reads, await worker_b.get_plan_expenses("p1", "u1")
+
+    reads, expenses = asyncio.run(run())
+    assert reads == 1
+    assert expenses == [{"amount": 80}]
+
+
+def test_field_reads_and_summary_pages_are_cached_per_variant():
+    db = CountingDatabase()
+    cached = CachedDatabase(db, MemoryCacheBackend())
+
+    async def run():
+        await cached.create_travel_plan("u1", {"id": "p2", "destination": "南京"})
+        fields = await cached.get_travel_plan_fields("p1", "u1", ["destination"])
+        ids = await cached.get_travel_plan_fields("p1", "u1", ["id"])
+        first_page = await cached.get_user_travel_plan_summaries("u1", limit=1)
+        second_page = await cached.get_user_travel_plan_summaries("u1", limit=1, after=("", "p2"))
+        reads = db.reads
+        assert await cached.get_travel_plan_fields("p1", "u1", ["destination"]) == fields
+        assert await cached.get_travel_plan_fields("p1", "u1", ["id"]) == ids
+        assert await cached.get_user_travel_plan_summaries("u1", limit=1) == first_page
+        assert await cached.get_user_travel_plan_summaries("u1", limit=1, after=("", "p2")) == second_page
+        assert db.reads == reads
+
+        await cached.update_travel_plan("p1", "u1", {"destination": "苏州"})
+        return (
+            second_page,
+            await cached.get_travel_plan_fields("p1", "u1", ["destination"]),
+            await cached.get_user_travel_plan_summaries("u1", limit=1, after=("", "p2")),
+        )
+
+    before, fields, page = asyncio.run(run())
+    assert before == [{"id": "p1", "destination": "杭州"}]
+    assert fields == {"destination": "苏州"}
+    assert page == [{"id": "p1", "destination": "苏州"}]
+
+
+def test_every_storage_method_is_implemented_explicitly():
+    cached = CachedDatabase(CountingDatabase(), MemoryCacheBackend())
+    # 不再把未知方法转发给底层数据库
+    with pytest.raises(AttributeError):
+        cached.ping
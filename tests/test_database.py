@@ -0,0 +1,138 @@
+"""
+异步数据层测试（使用 httpx.MockTransport 模拟 PostgREST）
+运行: pytest tests/test_database.py
+"""
+import asyncio
+import json
+import sys
+import os
+
+import httpx
+import pytest
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from database import Database, DatabaseError
+
+
+def make_db(handler):
+    return Database("https://project.supabase.co", "service-key", transport=httpx.MockTransport(handler))
+
+
+def test_queries_use_postgrest_filters_and_auth_headers():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if request.method == "POST":
+            return httpx.Response(201, json=[{"id": "p1", **json.loads(request.content)}])
+        if request.method == "DELETE":
+            return httpx.Response(200, json=[])
+        return httpx.Response(200, json=[{"id": "p1"}])
+
+    async def run():
+        db = make_db(handler)
+        created = await db.create_travel_plan("u1", {"destination": "杭州", "days": 2})
+        plans = await db.get_user_travel_plans("u1")
+        plan = await db.get_travel_plan("p1", "u1")
+        deleted = await db.delete_travel_plan("p1", "u1")
+        await db.close()
+        return created, plans, plan, deleted
+
+    created, plans, plan, deleted = asyncio.run(run())
+
+    assert created["destination"] == "杭州" and created["user_id"] == "u1"
+    assert plans == [{"id": "p1"}] and plan == {"id": "p1"}
+    assert deleted is False
+
+    insert, listing, single, delete = requests
+    assert insert.url.path == "/rest/v1/travel_plans"
+    assert insert.headers["Prefer"] == "return=representation"
+    assert insert.headers["apikey"] == "service-key"
+    assert insert.headers["Authorization"] == "Bearer service-key"
+    assert dict(listing.url.params) == {"select": "*", "user_id": "eq.u1", "order": "created_at.desc"}
+    assert dict(single.url.params) == {"select": "*", "id": "eq.p1", "user_id": "eq.u1"}
+    assert delete.method == "DELETE"
+
+
+def test_error_response_raises_database_error():
+    def handler(request: httpx.Request):
+        return httpx.Response(400, json={"message": "invalid input syntax for type uuid"})
+
+    async def run():
+        db = make_db(handler)
+        try:
+            await db.get_travel_plan("bad", "u1")
+        finally:
+            await db.close()
+
+    with pytest.raises(DatabaseError) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 400
+    assert "uuid" in str(excinfo.value)
+
+
+def test_summary_listing_projects_columns_and_seeks_after_cursor():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, json=[])
+
+    async def run():
+        db = make_db(handler)
+        await db.get_user_travel_plan_summaries("u1", limit=21, after=("2026-01-01T00:00:00+00:00", "p9"))
+        await db.close()
+
+    asyncio.run(run())
+
+    params = requests[0].url.params
+    assert "itinerary" not in params["select"] and "estimated_cost" in params["select"]
+    assert params["order"] == "created_at.desc,id.desc"
+    assert params["limit"] == "21"
+    assert params["or"] == (
+        '(created_at.lt."2026-01-01T00:00:00+00:00",'
+        'and(created_at.eq."2026-01-01T00:00:00+00:00",id.lt."p9"))'
+    )
+
+
+def test_json_patch_runs_as_rpc_and_maps_errors():
+    from json_patch import JsonPatchTestFailed
+    from storage import PlanVersionConflict
+
+    responses = [
+        httpx.Response(200, json={"version": 4, "value": "15:00"}),
+        httpx.Response(412, json={"code": "PT412", "message": "旅行计划已被修改", "details": "5"}),
+        httpx.Response(409, json={"code": "PT409", "message": "test 失败: /days/0/day"}),
+        httpx.Response(404, json={"code": "PT404", "message": "旅行计划不存在"}),
+    ]
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    operations = [{"op": "replace", "path": "/days/0/time", "value": "15:00"}]
+
+    async def run():
+        db = make_db(handler)
+        result = await db.patch_travel_plan("p1", "u1", operations, 3, ["days", "0", "time"])
+        with pytest.raises(PlanVersionConflict) as conflict:
+            await db.patch_travel_plan("p1", "u1", operations, 3)
+        with pytest.raises(JsonPatchTestFailed):
+            await db.patch_travel_plan("p1", "u1", operations)
+        missing = await db.patch_travel_plan("p1", "u1", operations)
+        await db.close()
+        return result, conflict.value, missing
+
+    result, conflict, missing = asyncio.run(run())
+
+    assert result == {"version": 4, "value": "15:00"}
+    assert conflict.current_version == 5
+    assert missing is None
+    assert requests[0].url.path == "/rest/v1/rpc/patch_travel_plan_itinerary"
+    assert json.loads(requests[0].content) == {
+        "p_plan_id": "p1", "p_user_id": "u1", "p_patch": operations,
+        "p_expected_version": 3, "p_return_path": ["days", "0", "time"],
+    }
@@ -0,0 +1,94 @@
+"""
+整日多段路线规划测试
+运行: pytest tests/test_day_route.py
+"""
+import asyncio
+import sys
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from http_clients import create_amap_client, get_amap_client
+from route_planning import drop_near_duplicates, route_cache_key
+from routers import geocode
+from ttl_cache import LRUCache
+
+# 西湖 → 断桥（约3米外的重复点）→ 灵隐寺 → 雷峰塔 → 河坊街
+WAYPOINTS = [
+    {"lng": 120.1500, "lat": 30.2500, "name": "西湖"},
+    {"lng": 120.15003, "lat": 30.25001, "name": "断桥"},
+    {"lng": 120.1000, "lat": 30.2400, "name": "灵隐寺"},
+    {"lng": 120.1500, "lat": 30.2300, "name": "雷峰塔"},
+    {"lng": 120.1700, "lat": 30.2400, "name": "河坊街"},
+]
+
+
+def test_near_duplicates_and_quantized_keys():
+    points = [(p["lng"], p["lat"]) for p in WAYPOINTS]
+    assert drop_near_duplicates(points) == [0, 2, 3, 4]
+    assert route_cache_key((120.15, 30.25), (120.1, 30.24), 0) == route_cache_key((120.15002, 30.24998), (120.1, 30.24), 0)
+    assert route_cache_key((120.15, 30.25), (120.1, 30.24), 0) != route_cache_key((120.15, 30.25), (120.1, 30.24), 2)
+
+
+@pytest.fixture
+def amap(monkeypatch):
+    state = {"requests": [], "active": 0, "peak": 0}
+
+    async def handler(request: httpx.Request):
+        state["requests"].append(request)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.02)
+        state["active"] -= 1
+        if request.url.params["origin"] == "120.15,30.23":
+            return httpx.Response(200, json={"status": "0", "info": "OVER_DIRECTION_RANGE"})
+        return httpx.Response(200, json={"status": "1", "route": {"paths": [{
+            "distance": "1500", "duration": "300",
+            "steps": [{"instruction": "直行", "polyline": f"{request.url.params['origin']};{request.url.params['destination']}"}],
+        }]}})
+
+    client = create_amap_client("https://amap.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(geocode, "route_cache", LRUCache(max_entries=100))
+    app.dependency_overrides[get_amap_client] = lambda: client
+    yield state
+    app.dependency_overrides.clear()
+
+
+def test_day_route_plans_legs_concurrently_and_caches(amap):
+    client = TestClient(app)
+    body = client.post("/api/map/day-route", json={"waypoints": WAYPOINTS}).json()
+
+    assert body["waypoints"] == [0, 2, 3, 4]
+    assert [(leg["from_index"], leg["to_index"], leg["status"]) for leg in body["legs"]] == [
+        (0, 2, "ok"), (2, 3, "ok"), (3, 4, "error"),
+    ]
+    assert body["legs"][2]["error"] == "路径规划失败: OVER_DIRECTION_RANGE"
+    assert body["legs"][0]["route"]["polyline"] == "120.15,30.25;120.1,30.24"
+    assert body["distance"] == 3000 and body["duration"] == 600
+    assert len(amap["requests"]) == 3 and amap["peak"] > 1
+
+    # 再次请求（起点偏移约3米）全部命中缓存，失败的路段不缓存
+    shifted = [dict(WAYPOINTS[0], lng=120.15002)] + WAYPOINTS[1:]
+    again = client.post("/api/map/day-route", json={"waypoints": shifted}).json()
+    assert [leg["cached"] for leg in again["legs"]] == [True, True, False]
+    assert len(amap["requests"]) == 4
+
+    # 单段接口共用缓存
+    single = client.post("/api/map/driving-route", json={
+        "origin_lng": 120.1, "origin_lat": 30.24, "destination_lng": 120.15, "destination_lat": 30.23,
+    })
+    assert single.json()["distance"] == 1500 and len(amap["requests"]) == 4
+
+
+def test_day_route_edge_cases(amap):
+    client = TestClient(app)
+    assert client.post("/api/map/day-route", json={"waypoints": WAYPOINTS[:2]}).json()["legs"] == []
+    too_many = [{"lng": 120 + i * 0.01, "lat": 30.0} for i in range(geocode.DAY_ROUTE_MAX_WAYPOINTS + 1)]
+    assert client.post("/api/map/day-route", json={"waypoints": too_many}).status_code == 400
+    assert amap["requests"] == []
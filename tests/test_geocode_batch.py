@@ -0,0 +1,105 @@
+"""
+批量地理编码测试
+运行: pytest tests/test_geocode_batch.py
+"""
+import asyncio
+import json
+import sys
+import os
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from geocode_cache import GeocodeCache
+from http_clients import RateLimiter
+from routers import geocode
+from routers.geocode import GeocodeResponse
+
+PLACES = {"西湖": (120.15, 30.25), "灵隐寺": (120.10, 30.24), "雷峰塔": (120.15, 30.23)}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    state = {"calls": [], "active": 0, "peak": 0}
+
+    async def search_poi(client, amap_key, keyword, city=None):
+        state["calls"].append((keyword, city))
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01 if keyword != "雷峰塔" else 0.05)
+        state["active"] -= 1
+        if keyword == "超时":
+            raise httpx.ReadTimeout("timeout")
+        if keyword in PLACES:
+            lng, lat = PLACES[keyword]
+            return GeocodeResponse(lng=lng, lat=lat, name=keyword)
+        return None
+
+    async def geocode_by_address(client, amap_key, address, city=None):
+        return None
+
+    monkeypatch.setattr(geocode, "geocode_cache", GeocodeCache(disk_path=None))
+    monkeypatch.setattr(geocode, "search_poi", search_poi)
+    monkeypatch.setattr(geocode, "geocode_by_address", geocode_by_address)
+    monkeypatch.setattr(geocode, "GEOCODE_BATCH_CONCURRENCY", 2)
+    return state
+
+
+def test_batch_dedupes_and_keeps_input_order(upstream):
+    client = TestClient(app)
+    body = {"city": "杭州", "addresses": [
+        "雷峰塔", "西湖", {"address": " 西湖 "}, "火星基地", "", "灵隐寺", "超时", {"address": "西湖", "city": "北京"},
+    ]}
+    results = client.post("/api/map/geocode-batch", json=body).json()["results"]
+
+    assert [r["index"] for r in results] == list(range(8))
+    assert [r["status"] for r in results] == ["ok", "ok", "ok", "not_found", "error", "ok", "error", "ok"]
+    assert results[2]["result"] == results[1]["result"]
+    assert results[6]["error"] == "地理编码服务超时"
+    # 规范化后相同的地址只请求一次，城市不同则分开请求
+    assert sorted(upstream["calls"]) == sorted([
+        ("雷峰塔", "杭州"), ("西湖", "杭州"), ("火星基地", "杭州"), ("灵隐寺", "杭州"), ("超时", "杭州"), ("西湖", "北京"),
+    ])
+    assert upstream["peak"] == 2
+
+    # 第二次全部来自缓存（超时的不缓存）
+    upstream["calls"].clear()
+    again = client.post("/api/map/geocode-batch", json=body).json()["results"]
+    assert upstream["calls"] == [("超时", "杭州")]
+    assert [r["cached"] for r in again] == [True, True, True, True, False, True, False, True]
+
+
+def test_batch_streams_ndjson_as_resolved(upstream):
+    client = TestClient(app)
+    client.post("/api/map/geocode-batch", json={"addresses": ["灵隐寺"]})
+
+    response = client.post("/api/map/geocode-batch", json={"addresses": ["雷峰塔", "西湖", "灵隐寺"], "stream": True})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # 缓存命中的先返回，慢的最后返回
+    assert [(r["address"], r["cached"]) for r in lines] == [("灵隐寺", True), ("西湖", False), ("雷峰塔", False)]
+
+
+def test_batch_limits(upstream):
+    client = TestClient(app)
+    assert client.post("/api/map/geocode-batch", json={"addresses": []}).status_code == 400
+    too_many = ["西湖"] * (geocode.GEOCODE_BATCH_MAX_ITEMS + 1)
+    assert client.post("/api/map/geocode-batch", json={"addresses": too_many}).status_code == 400
+
+
+def test_rate_limiter_spaces_requests():
+    async def run():
+        limiter = RateLimiter(50, burst=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        return time.monotonic() - start, limiter.waits
+
+    elapsed, waits = asyncio.run(run())
+    assert elapsed >= 0.07 and waits >= 4
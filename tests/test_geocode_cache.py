@@ -0,0 +1,108 @@
+"""
+地理编码缓存测试
+运行: pytest tests/test_geocode_cache.py
+"""
+import asyncio
+import sys
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from geocode_cache import GeocodeCache, geocode_cache_key
+from routers import geocode
+from routers.geocode import AmapServiceError, GeocodeResponse
+
+
+def test_key_normalizes_address_and_city():
+    assert geocode_cache_key("西湖 断桥", "杭州") == geocode_cache_key("西湖，断桥", " 杭州 ")
+    assert geocode_cache_key("ＡＢＣ Mall", None) == geocode_cache_key("abc mall", "")
+    assert geocode_cache_key("人民公园", "上海") != geocode_cache_key("人民公园", "成都")
+
+
+def test_disk_tier_survives_restart_and_not_found_expires_sooner(tmp_path):
+    path = str(tmp_path / "geocode.db")
+
+    async def first_run():
+        cache = GeocodeCache(ttl=3600, negative_ttl=60, disk_path=path)
+        await cache.set("西湖", "杭州", {"lng": 120.15, "lat": 30.25})
+        await cache.set("不存在的地方", "杭州", None)
+        cache.close()
+
+    async def second_run(restarted):
+        return [
+            await restarted.lookup("西湖", "杭州"),
+            await restarted.lookup("不存在的地方", "杭州"),
+            await restarted.lookup("灵隐寺", "杭州"),
+        ]
+
+    asyncio.run(first_run())
+    restarted = GeocodeCache(ttl=3600, negative_ttl=60, disk_path=path)
+    assert asyncio.run(second_run(restarted)) == [(True, {"lng": 120.15, "lat": 30.25}), (True, None), (False, None)]
+    assert restarted.stats()["disk_hits"] == 2
+
+    # 负缓存只保留 negative_ttl
+    expires = dict(restarted.disk._conn.execute("SELECT key, expires_at FROM geocode_cache").fetchall())
+    assert expires[geocode_cache_key("不存在的地方", "杭州")] < expires[geocode_cache_key("西湖", "杭州")] - 3000
+    restarted.close()
+
+
+def test_disk_hits_keep_their_remaining_ttl(tmp_path):
+    path = str(tmp_path / "geocode.db")
+    cache = GeocodeCache(ttl=3600, disk_path=path)
+    asyncio.run(cache.set("西湖", "杭州", {"lng": 120.15, "lat": 30.25}))
+    key = geocode_cache_key("西湖", "杭州")
+    cache.disk._conn.execute("UPDATE geocode_cache SET expires_at = ? WHERE key = ?", (time.time() + 100, key))
+    cache.disk._conn.commit()
+    cache.close()
+
+    restarted = GeocodeCache(ttl=3600, disk_path=path)
+    assert asyncio.run(restarted.lookup("西湖", "杭州"))[0]
+    _, expires_at, _ = restarted.memory._data[key]
+    assert expires_at - time.monotonic() <= 100
+    restarted.close()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+
+    async def search_poi(client, amap_key, keyword, city=None):
+        calls.append(("poi", keyword, city))
+        if keyword == "配额用尽":
+            raise AmapServiceError("DAILY_QUERY_OVER_LIMIT")
+        if keyword == "西湖":
+            return GeocodeResponse(lng=120.15, lat=30.25, name="西湖")
+        return None
+
+    async def geocode_by_address(client, amap_key, address, city=None):
+        calls.append(("geo", address, city))
+        return None
+
+    monkeypatch.setattr(geocode, "geocode_cache", GeocodeCache(disk_path=None))
+    monkeypatch.setattr(geocode, "search_poi", search_poi)
+    monkeypatch.setattr(geocode, "geocode_by_address", geocode_by_address)
+    return calls
+
+
+def test_endpoint_serves_hits_and_misses_from_cache(upstream):
+    client = TestClient(app)
+
+    for _ in range(3):
+        response = client.post("/api/map/geocode", json={"address": "西湖", "city": "杭州"})
+        assert response.json()["name"] == "西湖"
+        assert client.post("/api/map/geocode", json={"address": "火星基地", "city": "杭州"}).status_code == 404
+
+    assert upstream == [("poi", "西湖", "杭州"), ("poi", "火星基地", "杭州"), ("geo", "火星基地", "杭州")]
+
+
+def test_upstream_errors_are_not_cached(upstream):
+    client = TestClient(app)
+    for _ in range(2):
+        assert client.post("/api/map/geocode", json={"address": "配额用尽"}).status_code == 404
+    assert upstream.count(("poi", "配额用尽", None)) == 2
@@ -0,0 +1,123 @@
+"""
+并行对冲地理编码测试
+运行: pytest tests/test_geocoder.py
+"""
+import asyncio
+import sys
+import os
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from geocode_cache import GeocodeCache
+from geocoder import GeocodeCandidate, GeocodeProvider, NominatimProvider, hedged_resolve, wgs84_to_gcj02
+from routers import geocode
+from routers.geocode import get_geocode_providers
+
+
+class StubProvider(GeocodeProvider):
+    def __init__(self, name, delay=0.0, confidence=None, error=None):
+        self.name = name
+        self.delay = delay
+        self.confidence = confidence
+        self.error = error
+        self.started = None
+        self.cancelled = False
+
+    async def lookup(self, address, city=None):
+        self.started = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        if self.confidence is None:
+            return None
+        return GeocodeCandidate(self.name, {"lng": 120.15, "lat": 30.25, "name": self.name}, self.confidence)
+
+
+def resolve(providers, **kwargs):
+    async def run():
+        start = time.monotonic()
+        outcome = await hedged_resolve(providers, "西湖", "杭州", **kwargs)
+        return outcome, time.monotonic() - start, start
+    return asyncio.run(run())
+
+
+def test_confident_primary_skips_hedge():
+    poi, geo = StubProvider("poi", 0.01, 0.95), StubProvider("geo", 0.01, 0.9)
+    outcome, _, _ = resolve([poi, geo], hedge_delay=0.2)
+    assert outcome.best.provider == "poi" and geo.started is None
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    poi, geo = StubProvider("poi", 1.0, 0.95), StubProvider("geo", 0.01, 0.9)
+    outcome, elapsed, start = resolve([poi, geo], hedge_delay=0.05)
+    assert outcome.best.provider == "geo"
+    assert 0.04 <= geo.started - start < 0.2
+    assert poi.cancelled and elapsed < 0.5
+
+
+def test_miss_or_error_launches_next_immediately_and_best_wins():
+    poi = StubProvider("poi", 0.01, None)
+    geo = StubProvider("geo", 0.01, 0.6)
+    osm = StubProvider("osm", 0.01, 0.7)
+    outcome, elapsed, _ = resolve([poi, geo, osm], hedge_delay=0.5)
+    assert outcome.best.provider == "osm" and elapsed < 0.3
+
+    failing = StubProvider("poi", 0.0, error=RuntimeError("INVALID_USER_KEY"))
+    outcome, _, _ = resolve([failing, StubProvider("geo")], hedge_delay=0.5)
+    assert outcome.best is None and not outcome.definitive
+    assert resolve([StubProvider("poi"), StubProvider("geo")])[0].definitive
+
+
+def test_deadline_bounds_latency():
+    providers = [StubProvider("poi", 5.0, 0.9), StubProvider("geo", 5.0, 0.9)]
+    outcome, elapsed, _ = resolve(providers, hedge_delay=0.02, deadline=0.1)
+    assert outcome.deadline_exceeded and outcome.best is None
+    assert elapsed < 0.5 and all(p.cancelled for p in providers)
+
+
+def test_endpoint_uses_pluggable_providers(monkeypatch):
+    monkeypatch.setattr(geocode, "geocode_cache", GeocodeCache(disk_path=None))
+    monkeypatch.setattr(geocode, "hedged_resolve", lambda providers, address, city: hedged_resolve(
+        providers, address, city, hedge_delay=0.01, deadline=0.1))
+    client = TestClient(app)
+
+    app.dependency_overrides[get_geocode_providers] = lambda: [StubProvider("poi", 0.0, 0.5), StubProvider("osm", 0.0, 0.6)]
+    try:
+        response = client.post("/api/map/geocode", json={"address": "西湖"})
+        assert response.json()["name"] == "osm"
+
+        app.dependency_overrides[get_geocode_providers] = lambda: [StubProvider("poi", 1.0, 0.9)]
+        assert client.post("/api/map/geocode", json={"address": "灵隐寺"}).status_code == 504
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_nominatim_provider_converts_to_gcj02():
+    def handler(request: httpx.Request):
+        assert request.url.params["q"] == "杭州 西湖"
+        return httpx.Response(200, json=[{
+            "lon": "120.1440", "lat": "30.2460", "name": "西湖", "importance": 0.8,
+            "display_name": "西湖, 西湖区, 杭州市, 浙江省, 中国",
+        }])
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://osm.test", transport=httpx.MockTransport(handler)) as client:
+            return await NominatimProvider(client).lookup("西湖", "杭州")
+
+    candidate = asyncio.run(run())
+    assert candidate.result["name"] == "西湖"
+    assert candidate.confidence == pytest.approx(0.4 + 0.3 * 0.8 + 0.2)
+    # 国内 WGS-84 → GCJ-02 偏移约数百米，境外坐标不变
+    assert 0.002 < candidate.result["lng"] - 120.1440 < 0.01
+    assert wgs84_to_gcj02(2.2945, 48.8584) == (2.2945, 48.8584)
@@ -0,0 +1,64 @@
+"""
+共享上游HTTP客户端测试
+运行: pytest tests/test_http_clients.py
+"""
+import asyncio
+import sys
+import os
+
+import httpx
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import http_clients
+from main import app
+from geocode_cache import GeocodeCache
+from http_clients import create_amap_client, get_amap_client
+from routers import geocode
+
+
+def test_client_pool_and_timeouts():
+    client = create_amap_client("https://amap.test")
+    assert client.base_url == httpx.URL("https://amap.test")
+    assert client.timeout.connect == http_clients.AMAP_CONNECT_TIMEOUT
+    assert client.timeout.read == http_clients.AMAP_READ_TIMEOUT
+    asyncio.run(client.aclose())
+
+
+def test_init_and_close_share_one_client():
+    async def run():
+        await http_clients.init_http_clients()
+        shared = get_amap_client()
+        await http_clients.init_http_clients()
+        assert get_amap_client() is shared
+        await http_clients.close_http_clients()
+        assert shared.is_closed and http_clients.amap_client is None
+
+    asyncio.run(run())
+
+
+def test_geocode_uses_injected_client(monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if request.url.path == "/v3/place/text":
+            return httpx.Response(200, json={"status": "1", "count": "0", "pois": []})
+        return httpx.Response(200, json={"status": "1", "count": "1", "geocodes": [
+            {"location": "120.15,30.25", "formatted_address": "浙江省杭州市西湖区"},
+        ]})
+
+    client = create_amap_client("https://amap.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(geocode, "geocode_cache", GeocodeCache(disk_path=None))
+    app.dependency_overrides[get_amap_client] = lambda: client
+    try:
+        response = TestClient(app).post("/api/map/geocode", json={"address": "西湖区", "city": "杭州"})
+    finally:
+        app.dependency_overrides.clear()
+        asyncio.run(client.aclose())
+
+    assert response.json()["formatted_address"] == "浙江省杭州市西湖区"
+    assert [r.url.path for r in requests] == ["/v3/place/text", "/v3/geocode/geo"]
+    assert all(r.url.host == "amap.test" and r.url.params["city"] == "杭州" for r in requests)
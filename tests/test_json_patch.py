@@ -0,0 +1,114 @@
+"""
+JSON Patch 局部修改行程测试
+运行: pytest tests/test_json_patch.py
+"""
+import asyncio
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import get_db
+from sqlite_storage import SQLiteDatabase
+from json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch, changed_path, parse_pointer
+
+
+def test_rfc6902_operations():
+    doc = {"foo": ["bar", "baz"], "a/b": {"~c": 1}}
+    patched = apply_patch(doc, [
+        {"op": "add", "path": "/foo/1", "value": "qux"},
+        {"op": "add", "path": "/foo/-", "value": "end"},
+        {"op": "remove", "path": "/foo/0"},
+        {"op": "replace", "path": "/a~1b/~0c", "value": 2},
+        {"op": "copy", "from": "/foo/0", "path": "/first"},
+        {"op": "move", "from": "/first", "path": "/moved"},
+        {"op": "test", "path": "/a~1b/~0c", "value": 2.0},
+    ])
+    assert patched == {"foo": ["qux", "baz", "end"], "a/b": {"~c": 2}, "moved": "qux"}
+    assert doc["foo"] == ["bar", "baz"]  # 原文档不变
+
+
+@pytest.mark.parametrize("operations, error", [
+    ([{"op": "test", "path": "/flag", "value": 1}], JsonPatchTestFailed),  # true 与 1 不相等
+    ([{"op": "remove", "path": "/missing"}], JsonPatchError),
+    ([{"op": "add", "path": "/list/5", "value": 0}], JsonPatchError),
+    ([{"op": "move", "from": "/list", "path": "/list/0"}], JsonPatchError),
+    ([{"op": "replace", "path": "/flag"}], JsonPatchError),
+    ([], JsonPatchError),
+])
+def test_invalid_patches_are_rejected(operations, error):
+    with pytest.raises(error):
+        apply_patch({"flag": True, "list": [1]}, operations)
+
+
+def test_changed_path_is_the_smallest_common_subtree():
+    assert changed_path([{"op": "replace", "path": "/days/0/activities/1/time", "value": "10:00"}]) == ["days", "0", "activities", "1", "time"]
+    assert changed_path([
+        {"op": "test", "path": "/days/0/theme", "value": "古城"},
+        {"op": "remove", "path": "/days/0/activities/2"},
+        {"op": "add", "path": "/days/0/activities/-", "value": {}},
+    ]) == ["days", "0", "activities"]
+    assert changed_path([{"op": "move", "from": "/days/0/activities/0", "path": "/days/1/activities/0"}]) == ["days"]
+    assert parse_pointer("/a~1b/~01") == ["a/b", "~1"]
+
+
+@pytest.fixture
+def client():
+    db = SQLiteDatabase()
+    itinerary = {
+        "days": [
+            {"day": 1, "activities": [{"name": "西湖", "time": "09:00"}, {"name": "灵隐寺", "time": "14:00"}]},
+            {"day": 2, "activities": [{"name": "西溪湿地", "time": "09:30"}]},
+        ],
+        "cost_breakdown": {"total": 1500},
+    }
+    plan = asyncio.run(db.create_travel_plan("u1", {"destination": "杭州", "days": 2, "itinerary": itinerary}))
+    app.dependency_overrides[get_db] = lambda: db
+    yield TestClient(app), plan["id"]
+    app.dependency_overrides.clear()
+
+
+def test_patch_returns_changed_subtree_and_enforces_if_match(client):
+    http, plan_id = client
+    url = f"/api/travel/plans/{plan_id}"
+
+    etag = http.get(url, params={"user_id": "u1"}).headers["ETag"]
+    response = http.patch(
+        url, params={"user_id": "u1"}, headers={"If-Match": etag, "Content-Type": "application/json-patch+json"},
+        json=[{"op": "replace", "path": "/days/0/activities/1/time", "value": "15:00"}],
+    )
+    assert response.status_code == 200
+    assert response.json() == {"path": "/days/0/activities/1/time", "value": "15:00", "version": 2}
+    assert response.headers["ETag"] == '"2"'
+
+    # 旧版本的 If-Match 被拒绝
+    stale = http.patch(url, params={"user_id": "u1"}, headers={"If-Match": etag},
+                       json=[{"op": "remove", "path": "/days/1"}])
+    assert stale.status_code == 412 and stale.headers["ETag"] == '"2"'
+
+    response = http.patch(url, params={"user_id": "u1"}, json=[
+        {"op": "add", "path": "/days/0/activities/0", "value": {"name": "断桥", "time": "08:00"}},
+        {"op": "replace", "path": "/cost_breakdown/total", "value": 1800},
+    ])
+    assert response.json()["path"] == ""  # 修改跨越多个分支时返回整个行程
+
+    plan = http.get(url, params={"user_id": "u1"}).json()
+    assert [a["name"] for a in plan["itinerary"]["days"][0]["activities"]] == ["断桥", "西湖", "灵隐寺"]
+    assert plan["estimated_cost"] == 1800 and plan["version"] == 3
+
+
+def test_patch_errors(client):
+    http, plan_id = client
+    url = f"/api/travel/plans/{plan_id}"
+    failed_test = http.patch(url, params={"user_id": "u1"}, json=[{"op": "test", "path": "/days/0/day", "value": 2}])
+    assert failed_test.status_code == 409
+    bad_path = http.patch(url, params={"user_id": "u1"}, json=[{"op": "remove", "path": "/days/9"}])
+    assert bad_path.status_code == 422
+    missing = http.patch("/api/travel/plans/nope", params={"user_id": "u1"}, json=[{"op": "remove", "path": "/days/0"}])
+    assert missing.status_code == 404
+    assert http.get(url, params={"user_id": "u1"}).json()["version"] == 1
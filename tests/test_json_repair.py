@@ -0,0 +1,37 @@
+"""
+JSON修复测试（基于模型异常输出语料）
+运行: pytest tests/test_json_repair.py
+"""
+import json
+import sys
+import os
+
+import pytest
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from json_repair import loads, repair_json, JSONRepairError
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'json_repair_corpus.json')
+
+with open(CORPUS_PATH, encoding='utf-8') as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_corpus_case(case):
+    """语料中的每条异常输出都能修复为预期结果"""
+    assert loads(case["input"]) == case["expected"]
+
+
+def test_repair_output_is_valid_json():
+    """修复结果本身是合法JSON"""
+    for case in CORPUS:
+        json.loads(repair_json(case["input"]))
+
+
+def test_no_json_raises():
+    """没有JSON结构时抛出 JSONRepairError"""
+    with pytest.raises(JSONRepairError):
+        loads("抱歉，我无法生成该计划。")
@@ -0,0 +1,59 @@
+"""
+增量JSON解析测试
+运行: pytest tests/test_json_stream.py
+"""
+import json
+import sys
+import os
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from json_stream import IncrementalItineraryParser
+
+
+ITINERARY = {
+    "days": [
+        {"day": 1, "activities": [{"name": "西湖 {断桥}", "note": "含\"引号\""}]},
+        {"day": 2, "activities": []},
+    ],
+    "transportation": {"local": {"method": "地铁"}},
+    "cost_breakdown": {"total": 3000},
+    "tips": ["带伞"],
+}
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalItineraryParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_days_emitted_as_each_completes():
+    """每个 day 元素完成时立即产出，且早于后续字段"""
+    text = "好的，以下是行程：\n```json\n" + json.dumps(ITINERARY, ensure_ascii=False, indent=2) + "\n```"
+    events = feed_in_chunks(text, 7)
+
+    assert [event["section"] for event in events] == ["day", "day", "transportation", "cost_breakdown", "tips"]
+    assert events[0]["data"] == ITINERARY["days"][0]
+    assert events[1]["index"] == 1
+    assert events[3]["data"] == {"total": 3000}
+
+
+def test_day_emitted_before_stream_finishes():
+    """第一天完成后无需等待剩余输出"""
+    text = json.dumps(ITINERARY, ensure_ascii=False)
+    cut = text.index('{"day": 2')
+    parser = IncrementalItineraryParser()
+    events = parser.feed(text[:cut])
+    assert len(events) == 1
+    assert events[0]["data"]["day"] == 1
+
+
+def test_comments_do_not_break_depth_tracking():
+    """注释中的括号不影响解析"""
+    text = '{"days": [ // 每日行程 {\n {"day": 1} /* ] */ ], "tips": ["a"]}'
+    events = feed_in_chunks(text, 1)
+    assert [event["section"] for event in events] == ["day", "tips"]
@@ -0,0 +1,94 @@
+"""
+行程缓存测试
+运行: pytest tests/test_plan_cache.py
+"""
+import sys
+import os
+import time
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from ttl_cache import LRUCache, SQLiteCache
+from plan_cache import PlanCache, plan_cache_key, normalize_preferences
+from routers.travel import TravelRequest
+
+
+def make_request(**overrides):
+    data = {
+        "destination": "日本东京",
+        "days": 5,
+        "budget": 10000,
+        "travelers": 2,
+        "preferences": "美食、动漫、文化",
+    }
+    data.update(overrides)
+    return TravelRequest(**data)
+
+
+def test_preferences_sorted_and_deduplicated():
+    """偏好词去重排序后一致"""
+    assert normalize_preferences("美食、动漫，美食 文化") == normalize_preferences("文化,动漫、美食")
+
+
+def test_cache_key_canonicalization():
+    """预算同档位、偏好顺序不同的请求命中同一缓存键"""
+    base = plan_cache_key(make_request())
+    assert plan_cache_key(make_request(budget=9800, preferences="文化、动漫、美食")) == base
+    assert plan_cache_key(make_request(destination=" 日本东京 ")) == base
+    assert plan_cache_key(make_request(days=6)) != base
+    assert plan_cache_key(make_request(budget=20000)) != base
+
+
+def test_cache_key_includes_start_date():
+    """出发日期写入提示词，不同日期不能共用缓存"""
+    base = plan_cache_key(make_request())
+    summer = plan_cache_key(make_request(start_date="2026-07-01"))
+    assert summer != base
+    assert plan_cache_key(make_request(start_date=" 2026-07-01 ")) == summer
+    assert plan_cache_key(make_request(start_date="2026-12-24")) != summer
+
+
+def test_lru_evicts_by_bytes():
+    """超出字节上限时淘汰最久未使用的条目"""
+    cache = LRUCache(max_entries=10, max_bytes=100, sizeof=lambda value: 40)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_ttl_expiry():
+    """过期条目视为未命中"""
+    cache = LRUCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_plan_cache_disk_tier(tmp_path):
+    """内存层未命中时从磁盘层读取"""
+    path = str(tmp_path / "plan_cache.db")
+    itinerary = {"days": [{"day": 1}], "cost_breakdown": {"total": 100}}
+
+    PlanCache(disk_path=path).set(make_request(), itinerary)
+
+    cache = PlanCache(disk_path=path)
+    assert cache.get(make_request(preferences="文化、美食、动漫")) == itinerary
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["disk_hits"] == 1
+    assert cache.get(make_request(days=3)) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_sqlite_cache_expiry(tmp_path):
+    """磁盘层过期条目不再返回"""
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    cache.set("a", {"v": 1}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("a") is None
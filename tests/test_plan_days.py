@@ -0,0 +1,81 @@
+"""
+按天读取行程和字段投影测试
+运行: pytest tests/test_plan_days.py
+"""
+import asyncio
+import sys
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import Database, get_db
+from sqlite_storage import SQLiteDatabase
+
+
+@pytest.fixture
+def client():
+    db = SQLiteDatabase()
+    itinerary = {
+        "days": [{"day": d, "theme": f"第{d}天", "activities": [{"name": "西湖"}]} for d in range(1, 4)],
+        "cost_breakdown": {"total": 2400, "food": 600},
+    }
+    plan = asyncio.run(db.create_travel_plan("u1", {"destination": "杭州", "days": 3, "itinerary": itinerary}))
+    app.dependency_overrides[get_db] = lambda: db
+    yield TestClient(app), plan["id"]
+    app.dependency_overrides.clear()
+
+
+def test_day_fetch_and_conditional_requests(client):
+    http, plan_id = client
+    url = f"/api/travel/plans/{plan_id}/days/2"
+
+    response = http.get(url, params={"user_id": "u1"})
+    assert response.json() == {"day": 2, "theme": "第2天", "activities": [{"name": "西湖"}]}
+    etag = response.headers["ETag"]
+
+    cached = http.get(url, params={"user_id": "u1"}, headers={"If-None-Match": f"W/{etag}"})
+    assert cached.status_code == 304 and cached.content == b""
+
+    # 修改后版本变化，旧 ETag 不再匹配
+    http.patch(f"/api/travel/plans/{plan_id}", params={"user_id": "u1"},
+               json=[{"op": "replace", "path": "/days/1/theme", "value": "西溪"}])
+    refreshed = http.get(url, params={"user_id": "u1"}, headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200 and refreshed.json()["theme"] == "西溪"
+
+    assert http.get(f"/api/travel/plans/{plan_id}/days/4", params={"user_id": "u1"}).status_code == 404
+    assert http.get(f"/api/travel/plans/{plan_id}/days/0", params={"user_id": "u1"}).status_code == 404
+    assert http.get("/api/travel/plans/nope/days/1", params={"user_id": "u1"}).status_code == 404
+
+
+def test_fields_projection(client):
+    http, plan_id = client
+    response = http.get(f"/api/travel/plans/{plan_id}", params={
+        "user_id": "u1", "fields": "destination,itinerary.cost_breakdown.total,itinerary.tips",
+    })
+    assert response.json() == {"destination": "杭州", "itinerary": {"cost_breakdown": {"total": 2400}, "tips": None}}
+
+    for bad in ("user_id", "destination.name", "itinerary.days->0"):
+        assert http.get(f"/api/travel/plans/{plan_id}", params={"user_id": "u1", "fields": bad}).status_code == 400
+
+
+def test_supabase_selects_json_paths_in_postgrest():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, json=[{"version": 3, "f0": {"day": 1}, "f1": "杭州"}])
+
+    async def run():
+        db = Database("https://project.supabase.co", "key", transport=httpx.MockTransport(handler))
+        selected = await db.get_travel_plan_fields("p1", "u1", ["itinerary.days.0", "destination"])
+        await db.close()
+        return selected
+
+    assert asyncio.run(run()) == {"version": 3, "itinerary.days.0": {"day": 1}, "destination": "杭州"}
+    assert requests[0].url.params["select"] == "version,f0:itinerary->days->0,f1:destination"
@@ -0,0 +1,80 @@
+"""
+长途旅行分天并发生成测试（使用模拟的AI调用）
+运行: pytest tests/test_plan_fanout.py
+"""
+import asyncio
+import sys
+import os
+import time
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from routers import travel
+from routers.travel import TravelRequest, compute_cost_breakdown
+
+
+def test_days_generated_concurrently_and_merged(monkeypatch):
+    """各天并发生成（受并发上限约束），合并后重新计算费用"""
+    active = 0
+    peak = 0
+
+    async def fake_complete_json(messages, timer=None, kind=""):
+        nonlocal active, peak
+        prompt = messages[-1]["content"]
+        if "行程骨架" in prompt:
+            return {
+                "days": [{"day": day, "area": f"区域{day}"} for day in range(1, 9)],
+                "hotel": {"name": "西湖酒店", "estimated_cost": 400},
+                "transportation": {"outbound": {"cost": 500}, "return": {"cost": 500}, "local": {"estimated_daily_cost": 50}},
+                "shopping_budget": 600,
+                "tips": ["带伞"],
+            }
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return {"activities": [{"name": "景点", "estimated_cost": 100}], "meals": [{"estimated_cost": 80}]}
+
+    monkeypatch.setattr(travel, "complete_json", fake_complete_json)
+    monkeypatch.setattr(travel, "PLAN_FANOUT_MAX_CONCURRENCY", 4)
+
+    request = TravelRequest(destination="杭州", days=8, budget=8000, travelers=2, preferences="美食")
+
+    async def run():
+        return [event async for event in travel.stream_fanout_itinerary_events(request)]
+
+    start = time.perf_counter()
+    events = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    itinerary = events[-1]["itinerary"]
+    assert [day["day"] for day in itinerary["days"]] == list(range(1, 9))
+    assert itinerary["days"][0]["accommodation"]["name"] == "西湖酒店"
+    assert peak == 4
+    assert elapsed < 0.05 * 8
+    assert sum(1 for event in events if event.get("partial", {}).get("section") == "day") == 8
+    assert itinerary["cost_breakdown"] == {
+        "transportation": 500 + 500 + 50 * 8,
+        "accommodation": 400 * 8,
+        "food": 80 * 8,
+        "activities": 100 * 8,
+        "shopping": 600,
+        "total": 1400 + 3200 + 640 + 800 + 600,
+    }
+
+
+def test_cost_breakdown_tolerates_bad_values():
+    """费用字段缺失或非数字时按0计算"""
+    breakdown = compute_cost_breakdown({"days": [{"activities": [{"estimated_cost": "免费"}], "meals": None}]})
+    assert breakdown["total"] == 0
+
+
+def test_cost_breakdown_skips_non_object_entries():
+    """模型输出字符串活动、非对象的天或交通方案时跳过，不抛异常"""
+    breakdown = compute_cost_breakdown({
+        "days": ["第1天自由活动", {"activities": ["逛街", {"estimated_cost": 100}], "meals": "自理", "accommodation": "民宿"}],
+        "transportation": {"outbound": "自驾", "local": {"estimated_daily_cost": 20}},
+    })
+    assert breakdown["activities"] == 100 and breakdown["transportation"] == 20
+    assert breakdown["total"] == 120
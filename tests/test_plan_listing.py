@@ -0,0 +1,89 @@
+"""
+计划列表分页测试
+运行: pytest tests/test_plan_listing.py
+"""
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import get_db
+from routers.travel import encode_plan_cursor
+
+
+class FakeDatabase:
+    """按 (created_at, id) 倒序做键集分页的内存数据库"""
+
+    def __init__(self, plans):
+        self.plans = sorted(plans, key=lambda p: (p["created_at"], p["id"]), reverse=True)
+        self.calls = []
+
+    async def get_user_travel_plan_summaries(self, user_id, limit=20, after=None):
+        self.calls.append((limit, after))
+        rows = [p for p in self.plans if p["user_id"] == user_id]
+        if after is not None:
+            rows = [p for p in rows if (p["created_at"], p["id"]) < after]
+        return [{k: v for k, v in p.items() if k != "itinerary"} for p in rows[:limit]]
+
+
+def plan_id(i):
+    return f"00000000-0000-4000-8000-{i:012d}"
+
+
+@pytest.fixture
+def client():
+    # 5 个计划，其中两个创建时间相同
+    plans = [
+        {"id": plan_id(i), "user_id": "u1", "destination": "杭州", "created_at": f"2026-01-0{min(i, 4)}T00:00:00+00:00",
+         "estimated_cost": 1000 * i, "itinerary": {"days": []}}
+        for i in range(1, 6)
+    ]
+    db = FakeDatabase(plans)
+    app.dependency_overrides[get_db] = lambda: db
+    yield TestClient(app), db
+    app.dependency_overrides.clear()
+
+
+def test_pages_cover_all_plans_once(client):
+    http, db = client
+    seen = []
+    cursor = None
+    while True:
+        params = {"user_id": "u1", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        data = http.get("/api/travel/plans", params=params).json()
+        seen.extend(plan["id"] for plan in data["plans"])
+        assert all("itinerary" not in plan for plan in data["plans"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [plan_id(i) for i in (5, 4, 3, 2, 1)]
+    # 每次多取一条判断是否有下一页
+    assert all(limit == 3 for limit, _ in db.calls)
+    assert db.calls[1][1] == ("2026-01-04T00:00:00+00:00", plan_id(4))
+
+
+def test_invalid_cursor_returns_400(client):
+    http, _ = client
+    response = http.get("/api/travel/plans", params={"user_id": "u1", "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_crafted_cursor_cannot_change_the_filter(client):
+    http, db = client
+    for created_at, plan in [
+        ('2026-01-04T00:00:00+00:00",id.gt."0', plan_id(4)),
+        ("2026-01-04T00:00:00+00:00", 'x"),or(user_id.neq.u1'),
+        (["2026-01-04"], plan_id(4)),
+    ]:
+        cursor = encode_plan_cursor({"created_at": created_at, "id": plan})
+        response = http.get("/api/travel/plans", params={"user_id": "u1", "cursor": cursor})
+        assert response.status_code == 400
+    assert db.calls == []
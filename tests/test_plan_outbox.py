@@ -0,0 +1,239 @@
+"""
+计划写入发件箱测试
+运行: pytest tests/test_plan_outbox.py
+"""
+import asyncio
+import time
+import sys
+import os
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import pytest
+
+from plan_outbox import OutboxDatabase, PlanNotPersisted, PlanOutbox
+
+
+class FlakyDatabase:
+    """前几次批量写入失败的内存数据库"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.plans = {}
+        self.batches = []
+        self.expenses = []
+
+    async def create_travel_plans(self, plans):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("连接超时")
+        if any(plan["destination"] == "非法数据" for plan in plans):
+            raise RuntimeError("violates check constraint")
+        self.batches.append([plan["id"] for plan in plans])
+        for plan in plans:
+            self.plans.setdefault(plan["id"], dict(plan))
+        return plans
+
+    async def get_travel_plan(self, plan_id, user_id):
+        plan = self.plans.get(plan_id)
+        return plan if plan and plan["user_id"] == user_id else None
+
+    async def get_user_travel_plan_summaries(self, user_id, limit=20, after=None):
+        rows = sorted(
+            (p for p in self.plans.values() if p["user_id"] == user_id),
+            key=lambda p: (p["created_at"], p["id"]), reverse=True,
+        )
+        if after is not None:
+            rows = [p for p in rows if (p["created_at"], p["id"]) < tuple(after)]
+        return [{"id": p["id"], "created_at": p["created_at"]} for p in rows[:limit]]
+
+    async def delete_travel_plan(self, plan_id, user_id):
+        return self.plans.pop(plan_id, None) is not None
+
+    async def create_expense(self, user_id, plan_id, expense_data):
+        if plan_id not in self.plans:
+            raise RuntimeError("violates foreign key constraint expenses_plan_id_fkey")
+        self.expenses.append(dict(expense_data, plan_id=plan_id))
+        return self.expenses[-1]
+
+    async def close(self):
+        pass
+
+
+def make_plan(destination, total=1000):
+    return {"destination": destination, "days": 3, "itinerary": {"cost_breakdown": {"total": total}}}
+
+
+def test_pending_plans_are_readable_and_flushed_in_batches(tmp_path):
+    db = FlakyDatabase()
+    outboxed = OutboxDatabase(db, PlanOutbox(str(tmp_path / "outbox.db")), batch_size=2)
+
+    async def run():
+        created = [await outboxed.create_travel_plan("u1", make_plan(city)) for city in ("杭州", "苏州", "南京")]
+        pending = await outboxed.get_travel_plan(created[0]["id"], "u1")
+        other_user = await outboxed.get_travel_plan(created[0]["id"], "u2")
+        summaries = await outboxed.get_user_travel_plan_summaries("u1", limit=2)
+        written = await outboxed.flush()
+        stored = await outboxed.get_travel_plan(created[1]["id"], "u1")
+        return created, pending, other_user, summaries, written, stored
+
+    created, pending, other_user, summaries, written, stored = asyncio.run(run())
+
+    assert pending["destination"] == "杭州" and pending["estimated_cost"] == 1000.0
+    assert pending["sync_status"] == "pending"
+    assert other_user is None
+    assert [s["id"] for s in summaries] == [created[2]["id"], created[1]["id"]]
+    assert "itinerary" not in summaries[0]
+    assert written == 3
+    assert [len(batch) for batch in db.batches] == [2, 1]
+    assert stored["destination"] == "苏州"
+    assert outboxed.stats()["pending"] == 0
+
+
+def test_failed_flush_is_retried_after_backoff(tmp_path):
+    db = FlakyDatabase(failures=1)
+    outbox = PlanOutbox(str(tmp_path / "outbox.db"))
+    outboxed = OutboxDatabase(db, outbox)
+
+    async def run():
+        plan = await outboxed.create_travel_plan("u1", make_plan("成都"))
+        first = await outboxed.flush()
+        still_readable = await outboxed.get_travel_plan(plan["id"], "u1")
+        # 退避期间不会重试；到期后写入，且计划ID保持不变
+        assert outbox.due(10) == []
+        assert len(outbox.due(10, now=time.time() + 3600)) == 1
+        outbox._conn.execute("UPDATE plan_outbox SET next_attempt_at = 0")
+        second = await outboxed.flush()
+        return plan, first, still_readable, second
+
+    plan, first, still_readable, second = asyncio.run(run())
+
+    assert first == 0 and second == 1
+    assert still_readable["id"] == plan["id"]
+    assert list(db.plans) == [plan["id"]]
+    assert outboxed.stats()["failures"] == 1
+
+
+def test_deleting_a_pending_plan_prevents_the_write(tmp_path):
+    db = FlakyDatabase()
+    outboxed = OutboxDatabase(db, PlanOutbox(str(tmp_path / "outbox.db")))
+
+    async def run():
+        plan = await outboxed.create_travel_plan("u1", make_plan("西安"))
+        deleted = await outboxed.delete_travel_plan(plan["id"], "u1")
+        await outboxed.flush()
+        return deleted
+
+    assert asyncio.run(run()) is True
+    assert db.plans == {}
+
+
+def test_pending_plans_survive_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    db = FlakyDatabase(failures=10)
+
+    async def first_run():
+        outboxed = OutboxDatabase(db, PlanOutbox(path))
+        plan = await outboxed.create_travel_plan("u1", make_plan("厦门"))
+        await outboxed.close()
+        return plan
+
+    plan = asyncio.run(first_run())
+    db.failures = 0
+
+    async def second_run():
+        outboxed = OutboxDatabase(db, PlanOutbox(path))
+        outboxed.outbox._conn.execute("UPDATE plan_outbox SET next_attempt_at = 0")
+        return await outboxed.flush()
+
+    assert asyncio.run(second_run()) == 1
+    assert db.plans[plan["id"]]["destination"] == "厦门"
+
+
+def test_bad_row_does_not_block_batch_and_is_dead_lettered(tmp_path):
+    db = FlakyDatabase()
+    outbox = PlanOutbox(str(tmp_path / "outbox.db"))
+    outboxed = OutboxDatabase(db, outbox)
+
+    async def run():
+        good = await outboxed.create_travel_plan("u1", make_plan("青岛"))
+        bad = await outboxed.create_travel_plan("u1", make_plan("非法数据"))
+        later = await outboxed.create_travel_plan("u1", make_plan("大连"))
+        first = await outboxed.flush()
+        # 反复重试直到转入死信，之后不再尝试写入
+        for _ in range(10):
+            outbox._conn.execute("UPDATE plan_outbox SET next_attempt_at = 0")
+            await outboxed.flush()
+        still_readable = await outboxed.get_travel_plan(bad["id"], "u1")
+        summaries = await outboxed.get_user_travel_plan_summaries("u1")
+        return good, bad, later, first, still_readable, summaries
+
+    good, bad, later, first, still_readable, summaries = asyncio.run(run())
+
+    assert first == 2
+    assert set(db.plans) == {good["id"], later["id"]}
+    stats = outboxed.stats()
+    assert stats["pending"] == 0 and stats["dead_letter"] == 1 and stats["dead_lettered"] == 1
+    assert outbox._conn.execute("SELECT attempts FROM plan_outbox").fetchone()[0] == 8
+    # 写入失败的计划对用户可见，并标明失败状态
+    assert still_readable["id"] == bad["id"] and still_readable["sync_status"] == "failed"
+    assert "check constraint" in still_readable["sync_error"]
+    assert [(s["id"], s["sync_status"]) for s in summaries if s["id"] == bad["id"]] == [(bad["id"], "failed")]
+
+
+def test_expense_for_pending_plan_writes_the_plan_first(tmp_path):
+    db = FlakyDatabase()
+    outboxed = OutboxDatabase(db, PlanOutbox(str(tmp_path / "outbox.db")))
+
+    async def run():
+        plan = await outboxed.create_travel_plan("u1", make_plan("桂林"))
+        expense = await outboxed.create_expense("u1", plan["id"], {"category": "交通", "amount": 80})
+
+        db.failures = 1
+        other = await outboxed.create_travel_plan("u1", make_plan("昆明"))
+        with pytest.raises(PlanNotPersisted):
+            await outboxed.create_expense("u1", other["id"], {"category": "餐饮", "amount": 50})
+        return plan, expense
+
+    plan, expense = asyncio.run(run())
+
+    assert plan["id"] in db.plans and expense["plan_id"] == plan["id"]
+    assert outboxed.stats()["pending"] == 1 and len(db.expenses) == 1
+
+
+def test_slow_flush_does_not_block_other_writes(tmp_path):
+    db = FlakyDatabase()
+    outboxed = OutboxDatabase(db, PlanOutbox(str(tmp_path / "outbox.db")))
+    release = None
+    write = db.create_travel_plans
+
+    async def slow_create_travel_plans(plans):
+        await release.wait()
+        return await write(plans)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        db.create_travel_plans = slow_create_travel_plans
+        db.plans["stored"] = {"id": "stored", "user_id": "u1", "destination": "北京"}
+        pending = await outboxed.create_travel_plan("u1", make_plan("拉萨"))
+
+        flush = asyncio.create_task(outboxed.flush())
+        await asyncio.sleep(0.01)
+        # 写入进行中：其他计划的删除立即完成，正在写入的计划的删除等写入结束
+        await asyncio.wait_for(outboxed.delete_travel_plan("stored", "u1"), timeout=0.5)
+        delete_pending = asyncio.create_task(outboxed.delete_travel_plan(pending["id"], "u1"))
+        await asyncio.sleep(0.01)
+        waited = not delete_pending.done()
+        release.set()
+        written = await flush
+        deleted = await delete_pending
+        return pending, waited, written, deleted
+
+    pending, waited, written, deleted = asyncio.run(run())
+
+    assert waited and written == 1 and deleted
+    # 删除在写入完成后转到数据库执行，计划不会被写入恢复
+    assert pending["id"] not in db.plans and "stored" not in db.plans
+    assert outboxed.stats()["pending"] == 0
@@ -0,0 +1,263 @@
+"""
+流式行程生成测试（使用模拟的AI生成和数据库）
+运行: pytest tests/test_plan_stream.py
+"""
+import asyncio
+import json
+import sys
+import os
+
+import httpx
+import pytest
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import get_db
+from plan_cache import plan_cache
+from routers import travel
+from jobs import JobManager
+from broadcast import EventBroadcast
+
+
+class FakeDatabase:
+    """记录保存调用的内存数据库"""
+
+    def __init__(self):
+        self.saved = []
+
+    async def create_travel_plan(self, user_id, plan_data):
+        self.saved.append((user_id, plan_data))
+        return {"id": f"plan-{len(self.saved)}", "user_id": user_id, **plan_data}
+
+
+ITINERARY = {"days": [{"day": 1, "activities": []}], "cost_breakdown": {"total": 800}}
+
+
+@pytest.fixture
+def fake_db():
+    db = FakeDatabase()
+    app.dependency_overrides[get_db] = lambda: db
+    plan_cache.clear()
+    yield db
+    app.dependency_overrides.clear()
+    plan_cache.clear()
+
+
+def parse_events(body: str):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+async def fetch_stream(client, user_id):
+    params = {
+        "user_id": user_id,
+        "destination": "杭州",
+        "days": 2,
+        "budget": 3000,
+        "travelers": 2,
+        "preferences": "美食",
+    }
+    response = await client.get("/api/travel/plan-stream", params=params)
+    return parse_events(response.text)
+
+
+def test_identical_streams_share_one_generation(fake_db, monkeypatch):
+    """相同需求的并发请求只触发一次AI生成，但各自保存计划"""
+    calls = []
+
+    async def fake_events(request):
+        calls.append(request)
+        yield {"progress": 30, "message": "生成中"}
+        await asyncio.sleep(0.6)
+        yield {"itinerary": ITINERARY}
+
+    monkeypatch.setattr(travel, "stream_itinerary_events", fake_events)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(fetch_stream(client, f"user-{i}") for i in range(3)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert sorted(user_id for user_id, _ in fake_db.saved) == ["user-0", "user-1", "user-2"]
+    for events in results:
+        assert any(event.get("progress") == 30 for event in events)
+        assert events[-1]["result"]["itinerary"] == ITINERARY
+
+
+def test_background_job_persists_and_replays(fake_db, monkeypatch):
+    """后台任务完成后保存计划，可查询状态并重放事件；队列满时返回429"""
+    async def fake_events(request):
+        yield {"progress": 30, "message": "生成中"}
+        await asyncio.sleep(0.2)
+        yield {"itinerary": ITINERARY}
+
+    monkeypatch.setattr(travel, "stream_itinerary_events", fake_events)
+    monkeypatch.setattr(travel, "get_db", lambda: fake_db)
+    monkeypatch.setattr(travel, "plan_jobs", JobManager(travel.run_plan_job, workers=1, max_queue=1))
+
+    body = {"destination": "苏州", "days": 2, "budget": 2000, "travelers": 1, "preferences": "园林"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            accepted = await client.post("/api/travel/plan", params={"user_id": "u1", "background": "true"}, json=body)
+            job_id = accepted.json()["job_id"]
+
+            # worker 正在执行第一个任务，再提交两个：一个排队，一个被拒绝
+            await asyncio.sleep(0.05)
+            await client.post("/api/travel/plan", params={"user_id": "u1", "background": "true"}, json=body)
+            rejected = await client.post("/api/travel/plan", params={"user_id": "u1", "background": "true"}, json=body)
+
+            events = await client.get(f"/api/travel/jobs/{job_id}/events", params={"user_id": "u1"})
+            status = await client.get(f"/api/travel/jobs/{job_id}", params={"user_id": "u1"})
+            other_user = await client.get(f"/api/travel/jobs/{job_id}", params={"user_id": "u2"})
+            await travel.plan_jobs.stop()
+            return accepted, rejected, events, status, other_user
+
+    accepted, rejected, events, status, other_user = asyncio.run(run())
+
+    assert accepted.status_code == 202
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    replay = parse_events(events.text)
+    assert replay[0]["job_id"] == accepted.json()["job_id"]
+    assert replay[-1]["result"]["itinerary"] == ITINERARY
+    assert status.json()["status"] == "succeeded"
+    assert status.json()["result"]["id"] == "plan-1"
+    assert fake_db.saved[0][0] == "u1"
+    assert other_user.status_code == 404
+
+
+def test_only_clean_itineraries_are_cached(fake_db, monkeypatch):
+    """输出被截断或经过JSON修复的行程不写入缓存"""
+    cacheable = {"value": False}
+
+    async def fake_events(request):
+        yield {"itinerary": ITINERARY, "cacheable": cacheable["value"]}
+
+    monkeypatch.setattr(travel, "stream_itinerary_events", fake_events)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            degraded = await fetch_stream(client, "u1")
+            cacheable["value"] = True
+            clean = await fetch_stream(client, "u1")
+            cached = await fetch_stream(client, "u1")
+            return degraded, clean, cached
+
+    degraded, clean, cached = asyncio.run(run())
+
+    assert degraded[-1]["cached"] is False and clean[-1]["cached"] is False
+    assert cached[-1]["cached"] is True
+
+
+def test_parse_itinerary_flags_repaired_output():
+    timer = travel.GenerationTimer(2)
+    travel.parse_itinerary('{"days": [{"day": 1}]}', timer)
+    assert timer.degraded is False
+    travel.parse_itinerary('{"days": [{"day": 1, "activities": [{"name": "西', timer)
+    assert timer.degraded is True
+
+
+def test_stopping_job_manager_fails_queued_jobs():
+    """停止时排队中的任务标记为失败，订阅者收到错误后结束"""
+    async def slow_handler(job):
+        await asyncio.sleep(10)
+
+    async def collect(events):
+        return [event async for event in events]
+
+    async def run():
+        manager = JobManager(slow_handler, workers=1, max_queue=5)
+        running = manager.submit("u1", None)
+        queued = manager.submit("u1", None)
+        await asyncio.sleep(0.01)
+        subscriber = asyncio.create_task(asyncio.wait_for(
+            collect(queued.channel.subscribe()), timeout=1))
+        await asyncio.sleep(0.01)
+        await manager.stop()
+        return running, queued, await subscriber
+
+    running, queued, events = asyncio.run(run())
+
+    assert running.status == "failed" and queued.status == "failed"
+    assert queued.finished_at is not None
+    assert events[-1]["error"] == "任务已取消"
+
+
+def test_stopping_generations_drains_then_cancels(monkeypatch):
+    """关闭时等待进行中的生成，超时未完成的取消，订阅者收到错误后结束"""
+    async def fake_events(request):
+        yield {"progress": 30, "message": "生成中"}
+        await asyncio.sleep(0.05 if request.destination == "杭州" else 10)
+        yield {"itinerary": ITINERARY}
+
+    monkeypatch.setattr(travel, "stream_itinerary_events", fake_events)
+    plan_cache.clear()
+
+    async def collect(events):
+        return [event async for event in events]
+
+    async def run():
+        fast = travel.join_plan_generation(travel.TravelRequest(destination="杭州", days=2, budget=3000, travelers=2, preferences="美食"))
+        slow = travel.join_plan_generation(travel.TravelRequest(destination="成都", days=2, budget=3000, travelers=2, preferences="美食"))
+        subscribers = [asyncio.create_task(collect(channel.subscribe())) for channel in (fast, slow)]
+        await asyncio.sleep(0.01)
+        await travel.stop_plan_generations(timeout=0.2)
+        remaining = set(travel.generation_tasks)
+        return remaining, await asyncio.wait_for(asyncio.gather(*subscribers), timeout=1)
+
+    remaining, (fast_events, slow_events) = asyncio.run(run())
+    plan_cache.clear()
+
+    assert remaining == set() and travel.inflight_generations == {}
+    assert fast_events[-1]["itinerary"] == ITINERARY
+    assert slow_events[-1]["error"] == "服务正在关闭，生成已取消"
+
+
+def test_replay_buffer_keeps_latest_progress_and_partials():
+    """后加入的订阅者重放最新进度、每天最新的部分结果和最终结果，缓冲区不随进度事件增长"""
+    async def run():
+        channel = EventBroadcast()
+        channel.publish({"progress": 0, "message": "任务已排队", "job_id": "j1"})
+        for progress in range(1, 80):
+            channel.publish({"progress": progress, "message": "AI正在生成详细计划..."})
+        channel.publish({"progress": 50, "message": "第1天", "partial": {"section": "day", "index": 0, "data": {"v": 1}}})
+        channel.publish({"progress": 60, "message": "第1天", "partial": {"section": "day", "index": 0, "data": {"v": 2}}})
+        channel.publish({"progress": 70, "message": "第2天", "partial": {"section": "day", "index": 1, "data": {"v": 1}}})
+        channel.publish({"progress": 85, "message": "解析旅行计划..."})
+        channel.publish({"itinerary": ITINERARY})
+        channel.close()
+        return [event async for event in channel.subscribe()]
+
+    replay = asyncio.run(run())
+
+    assert len(replay) == 5
+    assert replay[0]["job_id"] == "j1"
+    assert [event["partial"]["data"]["v"] for event in replay[1:3]] == [2, 1]
+    assert replay[3]["progress"] == 85
+    assert replay[-1]["itinerary"] == ITINERARY
+
+
+def test_expired_jobs_are_purged_on_lookup():
+    async def handler(job):
+        return "ok"
+
+    async def run():
+        manager = JobManager(handler, workers=1, retention=0.05)
+        job = manager.submit("u1", None)
+        await asyncio.sleep(0.01)
+        found = manager.get(job.id)
+        await asyncio.sleep(0.1)
+        expired = manager.get(job.id)
+        await manager.stop()
+        return found, expired, manager.jobs
+
+    found, expired, jobs = asyncio.run(run())
+    assert found is not None and found.status == "succeeded"
+    assert expired is None and jobs == {}
@@ -0,0 +1,70 @@
+"""
+提示词前缀稳定性测试
+运行: pytest tests/test_prompts.py
+"""
+import sys
+import os
+from datetime import date
+from types import SimpleNamespace
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from routers.travel import TravelRequest
+from prompts import (
+    PLAN_INSTRUCTIONS,
+    PromptCacheStats,
+    build_day_messages,
+    build_plan_messages,
+    build_skeleton_messages,
+)
+
+
+def common_prefix(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def test_variable_fields_come_after_static_prefix():
+    first = build_plan_messages(
+        TravelRequest(destination="东京", days=5, budget=10000, travelers=2, preferences="美食"),
+        today=date(2026, 1, 5),
+    )
+    second = build_plan_messages(
+        TravelRequest(destination="杭州", days=3, budget=3000, travelers=1, preferences="园林", start_date="2026-03-01"),
+        today=date(2026, 10, 18),
+    )
+
+    assert first[0] == second[0]
+    assert first[1]["content"].startswith(PLAN_INSTRUCTIONS)
+    assert common_prefix(first[1]["content"], second[1]["content"]) >= len(PLAN_INSTRUCTIONS)
+    assert "东京" not in PLAN_INSTRUCTIONS and "2026" not in PLAN_INSTRUCTIONS
+    assert "2026年" in second[1]["content"] and "出发日期：2026-03-01" in second[1]["content"]
+
+
+def test_day_messages_share_prefix_across_days():
+    request = TravelRequest(destination="成都", days=8, budget=8000, travelers=2, preferences="美食")
+    skeleton = {"hotel": {"name": "春熙路酒店"}}
+    day1 = build_day_messages(request, {"day": 1, "area": "宽窄巷子"}, skeleton)
+    day2 = build_day_messages(request, {"day": 2, "area": "都江堰"}, skeleton)
+    prefix = common_prefix(day1[1]["content"], day2[1]["content"])
+    # 两天的消息只在天数之后才出现差异
+    assert day1[1]["content"][:prefix].endswith("天数：第")
+    assert build_skeleton_messages(request)[0] == day1[0]
+
+
+def test_prompt_cache_stats_reads_cached_tokens():
+    stats = PromptCacheStats()
+    assert stats.record(SimpleNamespace(prompt_tokens=1000, prompt_tokens_details=SimpleNamespace(cached_tokens=800))) == 800
+    assert stats.record(SimpleNamespace(prompt_tokens=1000, prompt_tokens_details=None)) is None
+    assert stats.stats() == {
+        "requests": 2,
+        "reported": 1,
+        "prompt_tokens": 2000,
+        "cached_tokens": 800,
+        "hit_rate": 0.4,
+    }
@@ -0,0 +1,119 @@
+"""
+嵌入式 SQLite 存储测试
+运行: pytest tests/test_sqlite_storage.py
+"""
+import asyncio
+import sys
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from main import app
+from database import create_storage, get_db
+from sqlite_storage import SQLiteDatabase
+
+
+def make_plan(destination, total=None):
+    itinerary = {"days": [{"day": 1, "activities": []}]}
+    if total is not None:
+        itinerary["cost_breakdown"] = {"total": total}
+    return {"destination": destination, "days": 2, "budget": 3000, "travelers": 2, "preferences": "美食", "itinerary": itinerary}
+
+
+def test_plans_round_trip_with_estimated_cost_and_keyset_pages(tmp_path):
+    db = create_storage(SimpleNamespace(storage_backend="sqlite", sqlite_path=str(tmp_path / "travel.db")))
+    assert isinstance(db, SQLiteDatabase)
+
+    async def run():
+        created = [await db.create_travel_plan("u1", make_plan(city, total)) for city, total in (("杭州", 1800), ("苏州", "未知"), ("南京", 2500))]
+        await db.create_travel_plan("u2", make_plan("上海", 900))
+        plan = await db.get_travel_plan(created[0]["id"], "u1")
+        hidden = await db.get_travel_plan(created[0]["id"], "u2")
+        first = await db.get_user_travel_plan_summaries("u1", limit=2)
+        last = first[-1]
+        second = await db.get_user_travel_plan_summaries("u1", limit=2, after=(last["created_at"], last["id"]))
+        updated = await db.update_travel_plan(created[1]["id"], "u1", {"itinerary": {"cost_breakdown": {"total": 700}}})
+        deleted = await db.delete_travel_plan(created[2]["id"], "u1")
+        remaining = await db.get_user_travel_plans("u1")
+        await db.close()
+        return created, plan, hidden, first, second, updated, deleted, remaining
+
+    created, plan, hidden, first, second, updated, deleted, remaining = asyncio.run(run())
+
+    assert plan["itinerary"]["days"][0]["day"] == 1 and plan["estimated_cost"] == 1800
+    assert hidden is None
+    assert "itinerary" not in first[0]
+    assert [p["id"] for p in first + second] == [c["id"] for c in reversed(created)]
+    assert first[1]["estimated_cost"] is None  # 非数字的总费用不计入
+    assert updated["estimated_cost"] == 700
+    assert deleted is True
+    assert [p["destination"] for p in remaining] == ["苏州", "杭州"]
+
+
+def test_budget_totals_follow_expense_changes_and_cascade():
+    db = SQLiteDatabase()
+
+    async def run():
+        plan = await db.create_travel_plan("u1", make_plan("成都"))
+        rows = await db.create_expenses("u1", [
+            {"plan_id": plan["id"], "category": "餐饮", "amount": 80, "description": "火锅", "date": "2026-05-01"},
+            {"plan_id": plan["id"], "category": "餐饮", "amount": 40, "description": "早餐", "date": "2026-05-02"},
+            {"plan_id": plan["id"], "category": "交通", "amount": 30, "description": "地铁", "date": "2026-05-01"},
+        ])
+        after_insert = await db.get_plan_budget_totals(plan["id"], "u1")
+        await db.update_expense(rows[2]["id"], "u1", {"category": "门票", "amount": 60})
+        await db.delete_expense(rows[1]["id"], "u1")
+        after_changes = await db.get_plan_budget_totals(plan["id"], "u1")
+        expenses = await db.get_plan_expenses(plan["id"], "u1")
+        await db.delete_travel_plan(plan["id"], "u1")
+        after_delete = await db.get_plan_expenses(plan["id"], "u1"), await db.get_plan_budget_totals(plan["id"], "u1")
+        return after_insert, after_changes, expenses, after_delete
+
+    after_insert, after_changes, expenses, after_delete = asyncio.run(run())
+
+    assert after_insert == {"餐饮": 120.0, "交通": 30.0}
+    assert after_changes == {"餐饮": 80.0, "门票": 60.0}
+    assert [e["date"] for e in expenses] == ["2026-05-01", "2026-05-01"]
+    assert after_delete == ([], {})
+
+
+def test_outbox_batches_are_idempotent():
+    db = SQLiteDatabase()
+    plan = {**make_plan("厦门", 500), "id": "p1", "user_id": "u1", "created_at": "2026-05-01T00:00:00+00:00"}
+
+    async def run():
+        first = await db.create_travel_plans([plan])
+        second = await db.create_travel_plans([plan])
+        return first, second, await db.get_user_travel_plans("u1")
+
+    first, second, stored = asyncio.run(run())
+    assert len(first) == 1 and second == []
+    assert [p["id"] for p in stored] == ["p1"]
+
+
+@pytest.fixture
+def client():
+    db = SQLiteDatabase()
+    app.dependency_overrides[get_db] = lambda: db
+    yield TestClient(app), db
+    app.dependency_overrides.clear()
+
+
+def test_api_runs_on_sqlite(client):
+    http, db = client
+    plan = asyncio.run(db.create_travel_plan("u1", make_plan("西安", 1200)))
+
+    response = http.post("/api/budget/expense", params={"user_id": "u1"}, json={
+        "plan_id": plan["id"], "category": "餐饮", "amount": 66, "description": "泡馍", "date": "2026-05-03",
+    })
+    assert response.status_code == 200
+
+    listing = http.get("/api/travel/plans", params={"user_id": "u1"}).json()
+    assert [p["estimated_cost"] for p in listing["plans"]] == [1200]
+    expenses = http.get(f"/api/budget/expenses/{plan['id']}", params={"user_id": "u1"}).json()
+    assert len(expenses["expenses"]) == 1
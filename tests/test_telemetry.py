@@ -0,0 +1,99 @@
+"""
+生成进度与耗时指标测试（使用模拟的流式AI输出）
+运行: pytest tests/test_telemetry.py
+"""
+import asyncio
+import json
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+# 添加 backend 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from routers import travel
+from routers.travel import TravelRequest
+from telemetry import ExpectedLengthModel, GenerationTimer, GenerationStatsStore
+
+ITINERARY = {
+    "days": [{"day": day, "theme": "城市漫步" * 20, "activities": []} for day in (1, 2)],
+    "cost_breakdown": {"total": 800},
+}
+
+
+def chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream:
+    """按固定大小切分的流式输出，最后一个分片携带 usage"""
+
+    def __init__(self, text, size=20):
+        self.parts = [chunk(text[i:i + size]) for i in range(0, len(text), size)]
+        self.parts.append(chunk(usage=SimpleNamespace(completion_tokens=300)))
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for part in self.parts:
+            await asyncio.sleep(0)
+            yield part
+
+
+def fake_client(text):
+    async def create(**kwargs):
+        assert kwargs["stream_options"] == {"include_usage": True}
+        return FakeStream(text)
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_expected_length_model_learns_by_days():
+    model = ExpectedLengthModel(alpha=0.5)
+    default = model.expected(3)
+    model.observe(3, 1000)
+    assert model.expected(3) == 1000
+    model.observe(3, 2000)
+    assert model.expected(3) == 1500
+    # 没见过的天数按学到的每天token数推算
+    assert model.expected(5) != default
+
+
+def test_stream_progress_follows_tokens_and_reports_metrics(monkeypatch):
+    text = json.dumps(ITINERARY, ensure_ascii=False)
+    monkeypatch.setattr(travel, "get_llm_client", lambda: fake_client(text))
+    store = GenerationStatsStore()
+    monkeypatch.setattr(travel, "generation_telemetry", store)
+
+    request = TravelRequest(destination="杭州", days=2, budget=3000, travelers=2, preferences="美食")
+
+    async def run():
+        return [event async for event in travel.stream_single_itinerary_events(request)]
+
+    start = time.perf_counter()
+    events = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    # 不再有人为的等待
+    assert elapsed < 0.3
+    progress = [event["progress"] for event in events if "progress" in event]
+    assert progress == sorted(progress)
+    assert any(40 < value < 80 for value in progress)
+
+    metrics = events[-1]["metrics"]
+    assert events[-1]["itinerary"]["days"][1]["day"] == 2
+    assert metrics["output_tokens"] == 300
+    assert metrics["token_source"] == "usage"
+    assert metrics["ttft"] is not None and metrics["ttft"] <= metrics["total_time"]
+    assert store.stats()["generations"] == 1
+
+
+def test_timer_without_usage_estimates_tokens():
+    timer = GenerationTimer(1, model=ExpectedLengthModel())
+    timer.add_text("西湖一日游")
+    metrics = timer.finish()
+    assert metrics["token_source"] == "estimate"
+    assert metrics["output_tokens"] == 5